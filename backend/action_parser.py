@@ -0,0 +1,163 @@
+import re
+import json
+from typing import Any, Dict, List, Tuple
+
+# A sentence ends at . ! or ? (optionally followed by a closing quote/bracket)
+# once whitespace follows it, so "$2.02" is not split but "Thanks. Next" is.
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+')
+# Characters that can change the parser's state inside a JSON object
+JSON_SPECIAL = re.compile(r'[{}"\\]')
+_DECODER = json.JSONDecoder()
+
+
+class StreamingActionParser:
+    """Incrementally split a model's token stream into actions and speech text.
+
+    feed() accepts arbitrary chunks and returns events as soon as they are
+    complete: ("action", dict) when a JSON object with an "action" key closes,
+    and ("text", str) for speech text outside of JSON objects. Braces inside
+    JSON strings are ignored, so nested objects are kept whole.
+    """
+
+    def __init__(self):
+        self._text: List[str] = []
+        self._json: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        events: List[Tuple[str, Any]] = []
+        pos = 0
+        end = len(chunk)
+        # Jump between the characters that matter instead of stepping one at a time
+        while pos < end:
+            if self._depth == 0:
+                brace = chunk.find("{", pos)
+                if brace == -1:
+                    self._text.append(chunk[pos:])
+                    break
+                if brace > pos:
+                    self._text.append(chunk[pos:brace])
+                self._json.append("{")
+                self._depth = 1
+                pos = brace + 1
+                continue
+
+            if self._escaped:
+                # Whatever follows a backslash inside a string is taken literally
+                self._json.append(chunk[pos])
+                self._escaped = False
+                pos += 1
+                continue
+            match = JSON_SPECIAL.search(chunk, pos)
+            if match is None:
+                self._json.append(chunk[pos:])
+                break
+            i = match.start()
+            self._json.append(chunk[pos:i + 1])
+            pos = i + 1
+            char = chunk[i]
+            if self._in_string:
+                if char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_object(events)
+
+        if self._text:
+            events.append(("text", "".join(self._text)))
+            self._text = []
+        return events
+
+    def flush(self) -> List[Tuple[str, Any]]:
+        """Return whatever is left at the end of the stream as text"""
+        leftover = "".join(self._text) + "".join(self._json)
+        self._text = []
+        self._json = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        return [("text", leftover)] if leftover else []
+
+    def _close_object(self, events: List[Tuple[str, Any]]) -> None:
+        json_str = "".join(self._json)
+        self._json = []
+        try:
+            data = json.loads(json_str)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict) and "action" in data:
+            if self._text:
+                events.append(("text", "".join(self._text)))
+                self._text = []
+            events.append(("action", data))
+        else:
+            # Not an action - keep it as part of the spoken text
+            self._text.append(json_str)
+
+
+class SentenceChunker:
+    """Buffer streamed text and release it in sentence-sized pieces"""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            sentence = normalize_space(self._buffer[start:match.end()])
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        sentence = normalize_space(self._buffer)
+        self._buffer = ""
+        return [sentence] if sentence else []
+
+
+def normalize_space(text: str) -> str:
+    """Collapse runs of whitespace the way the whole-response path does"""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def parse_reply(text: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Split a whole model reply into its speech text and action objects in one pass.
+
+    Matches StreamingActionParser on well-formed replies, but each object
+    is decoded by the C JSON scanner straight from its opening brace.
+    """
+    spoken: List[str] = []
+    actions: List[Dict[str, Any]] = []
+    pos = 0
+    while True:
+        brace = text.find("{", pos)
+        if brace == -1:
+            spoken.append(text[pos:])
+            break
+        spoken.append(text[pos:brace])
+        try:
+            data, end = _DECODER.raw_decode(text, brace)
+        except json.JSONDecodeError:
+            # Not valid JSON from here: speak the brace and keep scanning
+            spoken.append("{")
+            pos = brace + 1
+            continue
+        if isinstance(data, dict) and "action" in data:
+            actions.append(data)
+        else:
+            spoken.append(text[brace:end])
+        pos = end
+    return normalize_space("".join(spoken)), actions
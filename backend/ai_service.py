@@ -1,152 +1,343 @@
 import os
 import json
-from typing import Dict, Any, Optional
-import google.generativeai as genai
+import time
+import asyncio
+import logging
+from typing import Dict, Any, AsyncIterator, Hashable, Optional
 from dotenv import load_dotenv
+from session_store import ConversationSession, SessionRegistry
+from action_parser import SentenceChunker, StreamingActionParser, parse_reply
+from intent_matcher import IntentMatcher
+from cart import Cart, CartEngine
+from system_prompt import build_system_prompt
+from response_cache import AI_RESPONSE_CACHE, ResponseCache
+from providers import build_router
+from menu_store import get_menu_store
+from metrics import log, observe, span
 
 # Load environment variables
 load_dotenv()
 
+# Upper bound on a single model call before the turn is abandoned
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "15"))
+# Maximum number of model calls in flight at once across all lanes
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+# Answer common orders locally without a model round trip
+AI_LOCAL_FAST_PATH = os.getenv("AI_LOCAL_FAST_PATH", "1") == "1"
+# Open provider connections at startup instead of on the first customer's turn
+AI_WARM_UP = os.getenv("AI_WARM_UP", "1") == "1"
+# How often idle provider connections are pinged to keep them open (0 = never)
+AI_KEEPALIVE_SECONDS = float(os.getenv("AI_KEEPALIVE_SECONDS", "60"))
+
 class AIService:
     def __init__(self):
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         self.deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
         
         if not self.gemini_api_key:
-            print("WARNING: GEMINI_API_KEY not found in .env file. AI features will be disabled.")
-            self.model = None
-        else:
-            # Configure Gemini
-            genai.configure(api_key=self.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+            log("gemini_key_missing", logging.WARNING, message="GEMINI_API_KEY not found in .env file. Gemini will not be used.")
         
-        self.chat = None
+        # Primary and fallback providers (hedged, behind circuit breakers)
+        self.router = build_router(self.gemini_api_key, self.deepseek_api_key)
+        if not self.router:
+            log("no_ai_provider", logging.WARNING, message="No AI provider configured. AI features will be disabled.")
+        self.sessions = SessionRegistry()
+        self._model_slots = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+        self.response_cache = ResponseCache() if AI_RESPONSE_CACHE else None
         
-        # Load menu
-        menu_path = os.path.join(os.path.dirname(__file__), "menu.json")
-        with open(menu_path, "r") as f:
-            self.menu_data = json.load(f)
+        # Build the prompt from the menu store (rebuilt whenever the menu changes)
+        self.menu_store = get_menu_store()
+        self.menu_version = None
+        self.refresh_menu()
+        # Set once warm_up() has run (or right away when there is nothing to warm)
+        self.ready = not (AI_WARM_UP and self.router)
+        self.warm_up_status: Dict[str, str] = {}
     
-    def start_conversation(self, menu_data: Dict[str, Any]) -> None:
-        """Start a new conversation with the AI"""
-        system_prompt = f"""You are an AI assistant for a Tim Hortons kiosk. Your job is to help customers order items.
-
-MENU:
-{json.dumps(menu_data, indent=2)}
-
-TIM HORTONS KEYWORDS & SLANG:
-- "double double" = coffee with 2 cream and 2 sugar
-- "triple triple" = coffee with 3 cream and 3 sugar
-- "regular" = 1 cream, 1 sugar
-- "black" = no cream, no sugar
-- "Timmies" = Tim Hortons
-- Sizes: Small, Medium, Large, Extra Large (XL)
-
-RULES:
-1. **CRITICAL**: When the customer adds, removes, or modifies an item, you MUST output a JSON block FIRST, followed by your natural response.
-2. **MAX QUANTITY**: The maximum quantity allowed per item is {menu_data.get('max_quantity', 10)}. If a user requests more than this, politely decline and ask them to speak with an employee.
-2. **JSON FORMAT**:
-   - Add Item: {{"action": "add_to_cart", "item_id": "...", "name": "...", "modifiers": [...], "price": ...}}
-   - Remove Item: {{"action": "remove_item", "item_id": "..."}}
-   - Clear Cart: {{"action": "clear_cart"}}
-   - Finalize Order: {{"action": "finalize_order"}}
-3. ALWAYS output JSON FIRST, then your text response.
-4. Keep responses SHORT (1-2 sentences max).
-5. Recognize keywords: "double double" (2 cream 2 sugar), "regular" (1 cream 1 sugar), "Timmies".
-6. If the order is ambiguous, ask clarifying questions (size, etc.) BEFORE adding to cart.
-7. DO NOT explain the JSON. Just output it.
-8. **TAX RULE**: Prices in the menu are pre-tax. HST is 13%.
-9. **FINALIZE ORDER**: When the user says "that's it", "I'm done", "that's all", or similar completion phrases, output {{"action": "finalize_order"}} to trigger automatic checkout.
-
-EXAMPLES:
-User: "I want a double double"
-You: "What size would you like for that coffee?"
-
-User: "Medium please"
-You: {{"action": "add_to_cart", "item_id": "coffee_original", "name": "Original Blend Coffee", "modifiers": ["Medium", "2 Cream", "2 Sugar"], "price": 1.79}}
-    "Got it! A medium double double. Anything else?"
-
-User: "That's it"
-You: {{"action": "finalize_order"}}
-    "Great! Your total with tax is $2.02. Thank you!"
-
-Remember: Keep it SHORT and NATURAL. Don't explain the JSON, just include it in your response."""
-
-        if not self.model:
-            print("AI Model not initialized. Skipping conversation start.")
+    async def warm_up(self) -> None:
+        """Open every provider's connection with the current prompt, then mark the service ready"""
+        if self.router:
+            with span("warm_up", "none"):
+                self.warm_up_status = await self.router.warm_up(self.system_prompt, AI_TIMEOUT_SECONDS)
+        self.ready = True
+        log("ai_warmed_up", providers=self.warm_up_status)
+
+    async def keep_warm(self, interval: float = AI_KEEPALIVE_SECONDS) -> None:
+        """Warm up, then ping the providers every interval so pooled connections stay open"""
+        await self.warm_up()
+        if not self.router or interval <= 0:
             return
+        while True:
+            await asyncio.sleep(interval)
+            self.warm_up_status = await self.router.warm_up(self.system_prompt, AI_TIMEOUT_SECONDS)
+    
+    def refresh_menu(self) -> None:
+        """Rebuild the prompt, fast path and cart engine if the menu store has a new version.
 
-        self.chat = self.model.start_chat(history=[])
-        # Send system prompt as first message
-        self.chat.send_message(system_prompt)
+        The prompt is sent as the model's system instruction, so it costs no
+        extra chat turn and is built once per menu version, not per conversation.
+        Everything is built before any of it is swapped in, so a turn never
+        sees a prompt from one version and prices from another.
+        """
+        menu = self.menu_store.current
+        if menu.version == self.menu_version:
+            return
+        
+        system_prompt = build_system_prompt(menu.data)
+        intent_matcher = IntentMatcher(menu.data) if AI_LOCAL_FAST_PATH else None
+        cart_engine = CartEngine(menu.data)
+        
+        self.menu_data = menu.data
+        self.menu_version = menu.version
+        self.system_prompt = system_prompt
+        self.intent_matcher = intent_matcher
+        self.cart_engine = cart_engine
+        if self.response_cache is not None:
+            self.response_cache.clear()
+        log("system_prompt_built", menu_version=self.menu_version, chars=len(self.system_prompt),
+            approx_tokens=len(self.system_prompt) // 4)
     
-    def reset_conversation(self) -> None:
-        """Reset the conversation to start fresh"""
-        print("Resetting AI conversation...")
-        self.chat = None
+    async def _send_message(self, session: ConversationSession, message: str) -> str:
+        """Send a message in a session's conversation without blocking the event loop.
+
+        Calls are bounded by the shared concurrency limit and AI_TIMEOUT_SECONDS.
+        Cancelling the awaiting task (e.g. on client disconnect) cancels the call.
+        The exchange is only recorded in the session's history once it succeeds.
+        """
+        contents = session.history + [{"role": "user", "parts": [message]}]
+        with span("model_wait"):
+            await self._model_slots.acquire()
+        try:
+            with span("model_complete"):
+                reply = await asyncio.wait_for(
+                    self.router.generate(self.system_prompt, contents),
+                    timeout=AI_TIMEOUT_SECONDS
+                )
+        finally:
+            self._model_slots.release()
+        session.append("user", message)
+        session.append("model", reply)
+        return reply
+
+    async def _stream_message(self, session: ConversationSession, message: str) -> AsyncIterator[str]:
+        """Like _send_message, but yield the reply text chunk by chunk.
+
+        AI_TIMEOUT_SECONDS bounds the whole stream, not each chunk.
+        """
+        contents = session.history + [{"role": "user", "parts": [message]}]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AI_TIMEOUT_SECONDS
+        chunks = []
+        with span("model_wait"):
+            await self._model_slots.acquire()
+        try:
+            started = time.perf_counter()
+            stream = self.router.stream(self.system_prompt, contents)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if not chunks:
+                        observe("model_first_token", time.perf_counter() - started)
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                await stream.aclose()
+            # Includes time the consumer spent between chunks, as the stream is pulled
+            observe("model_complete", time.perf_counter() - started)
+        finally:
+            self._model_slots.release()
+        session.append("user", message)
+        session.append("model", "".join(chunks))
+
+    async def cart_for(self, session_id: str) -> Cart:
+        """The session's authoritative cart (a new customer gets an empty one).
+
+        Called at the start of each turn, so it also picks up a newer saved copy.
+        """
+        return (await self.sessions.get_latest(session_id)).cart
+
+    async def reset_conversation(self, session_id: str) -> bool:
+        """Reset one session's conversation to start fresh (on every worker)"""
+        log("conversation_reset", session_id=session_id)
+        return await self.sessions.remove(session_id)
+    
+    def _answer_without_model(self, user_text: str, current_cart: list, session_id: str) -> Optional[Dict[str, Any]]:
+        """Try the deterministic fast path, then the response cache; None means ask the model.
+
+        An answer found here is still written to the session's history (in the
+        same form the model would have produced) so later model turns keep context.
+        """
+        result = None
+        session = self.sessions.get(session_id)
+        with span("local_parse"):
+            if self.intent_matcher:
+                result = self.intent_matcher.match(user_text, current_cart)
+                if result is not None:
+                    log("local_fast_path", text=user_text)
+            if result is None and self.response_cache is not None:
+                result = self.response_cache.get(self._cache_key(session, user_text, current_cart))
+                if result is not None:
+                    log("response_cache_hit", text=user_text)
+        if result is None:
+            return None
+        
+        # A model turn in flight for this session records its own history
+        if session is not None and not session.lock.locked():
+            reply = " ".join(json.dumps(action) for action in result["actions"])
+            session.append("user", self._build_message(session, user_text, current_cart))
+            session.append("model", f"{reply}\n{result['text']}")
+            self._finish_turn(session)
+        return result
+
+    def _build_message(self, session: ConversationSession, user_text: str, current_cart: list) -> str:
+        # Add cart context to the message: a full summary now and then, otherwise
+        # only what changed since the model last saw the cart
+        window_turns = self.sessions.max_history_messages // 2
+        with span("prompt_build"):
+            return f"{user_text}\n\n{session.cart_context.render(current_cart, window_turns)}"
+
+    def _cache_key(self, session: Optional[ConversationSession], user_text: str, current_cart: list) -> Hashable:
+        # What the model said last decides what a short answer like "medium" refers to
+        last_reply = ""
+        if session is not None:
+            replies = [entry for entry in session.history if entry["role"] == "model"]
+            if replies:
+                last_reply = "".join(replies[-1]["parts"])
+        return self.response_cache.key(self.menu_version, user_text, current_cart, last_reply)
+
+    def _cache_result(self, cache_key: Optional[Hashable], result: Dict[str, Any]) -> None:
+        if cache_key is not None:
+            self.response_cache.put(cache_key, result)
+
+    def _finish_turn(self, session: ConversationSession) -> None:
+        """Record that the model has seen this turn's cart and apply history limits"""
+        session.cart_context.commit()
+        self.sessions.commit(session)
+    
+    async def stream_user_message(self, user_text: str, current_cart: list, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming variant of process_user_message.
+
+        Yields events as the model produces them:
+          {"type": "action", "action": {...}}  as soon as an action JSON block closes
+          {"type": "text", "text": "..."}      one speakable sentence at a time
+          {"type": "done", "text": "..."}      once, with the full cleaned response
+        """
+        self.refresh_menu()
+        local = self._answer_without_model(user_text, current_cart, session_id)
+        if local is not None:
+            for action in local["actions"]:
+                yield {"type": "action", "action": action}
+            yield {"type": "text", "text": local["text"]}
+            yield {"type": "done", "text": local["text"]}
+            return
+
+        if not self.router:
+            text = "I'm sorry, I cannot process your request because the AI service is not configured."
+            yield {"type": "text", "text": text}
+            yield {"type": "done", "text": text}
+            return
+
+        session = await self.sessions.get_or_create(session_id)
+        parser = StreamingActionParser()
+        chunker = SentenceChunker()
+        spoken = []
+        actions = []
+        failed = False
+        # Parsing is interleaved with the stream, so it is summed and recorded once
+        parse_seconds = 0.0
+        cache_key = None
+        
+        try:
+            async with session.lock:
+                if self.response_cache is not None:
+                    cache_key = self._cache_key(session, user_text, current_cart)
+                full_message = self._build_message(session, user_text, current_cart)
+                async for chunk in self._stream_message(session, full_message):
+                    started = time.perf_counter()
+                    events = parser.feed(chunk)
+                    parse_seconds += time.perf_counter() - started
+                    for kind, value in events:
+                        if kind == "action":
+                            actions.append(value)
+                            yield {"type": "action", "action": value}
+                        else:
+                            for sentence in chunker.feed(value):
+                                spoken.append(sentence)
+                                yield {"type": "text", "text": sentence}
+                self._finish_turn(session)
+            observe("action_parse", parse_seconds)
+
+            # Speak whatever is left once the stream has ended
+            tail = []
+            for _, value in parser.flush():
+                tail.extend(chunker.feed(value))
+            tail.extend(chunker.flush())
+            for sentence in tail:
+                spoken.append(sentence)
+                yield {"type": "text", "text": sentence}
+        except asyncio.TimeoutError:
+            log("ai_timeout", logging.WARNING, timeout_seconds=AI_TIMEOUT_SECONDS)
+            failed = True
+        except Exception as e:
+            log("ai_provider_error", logging.ERROR, error=str(e))
+            failed = True
+
+        if not spoken:
+            # Nothing speakable came back (only actions, or an error before any text)
+            text = "I'm having trouble processing that. Could you try again?" if failed else "Got it!"
+            spoken.append(text)
+            yield {"type": "text", "text": text}
+        if not failed:
+            self._cache_result(cache_key, {"text": " ".join(spoken), "actions": actions})
+        yield {"type": "done", "text": " ".join(spoken)}
     
-    async def process_user_message(self, user_text: str, current_cart: list) -> Dict[str, Any]:
+    async def process_user_message(self, user_text: str, current_cart: list, session_id: str) -> Dict[str, Any]:
         
-        if not self.model:
+        self.refresh_menu()
+        local = self._answer_without_model(user_text, current_cart, session_id)
+        if local is not None:
+            return local
+
+        if not self.router:
             return {
                 "text": "I'm sorry, I cannot process your request because the AI service is not configured.",
                 "actions": []
             }
 
-        if not self.chat:
-            self.start_conversation(self.menu_data)
-        
-        # Add cart context to the message
-        cart_context = f"\n\nCurrent cart: {json.dumps(current_cart)}" if current_cart else "\n\nCart is empty"
-        full_message = user_text + cart_context
+        session = await self.sessions.get_or_create(session_id)
+        cache_key = None
         
         try:
-            # Get AI response
-            response = self.chat.send_message(full_message)
-            ai_text = response.text
+            async with session.lock:
+                if self.response_cache is not None:
+                    cache_key = self._cache_key(session, user_text, current_cart)
+                full_message = self._build_message(session, user_text, current_cart)
+                # Get AI response
+                ai_text = await self._send_message(session, full_message)
+                self._finish_turn(session)
             
-            # Parse response for actions
+            # Split out the action objects and the text to speak in one pass
+            with span("action_parse"):
+                clean_text, actions = parse_reply(ai_text)
             result = {
-                "text": ai_text,
-                "actions": []
+                "text": clean_text or "Got it!",
+                "actions": actions
             }
             
-            import re
-            
-            # Find all JSON-like blocks
-            # This regex looks for { ... } non-greedily
-            # It might be fragile with nested braces but sufficient for this specific AI output format
-            json_matches = re.finditer(r'\{[^{}]*\}', ai_text)
-            
-            clean_text = ai_text
-            
-            for match in json_matches:
-                json_str = match.group()
-                try:
-                    action_data = json.loads(json_str)
-                    if "action" in action_data:
-                        result["actions"].append(action_data)
-                        # Remove this block from text
-                        clean_text = clean_text.replace(json_str, "")
-                except json.JSONDecodeError:
-                    continue
-            
-            # Clean up the text
-            clean_text = clean_text.strip()
-            # Remove leftover double spaces or newlines
-            clean_text = re.sub(r'\n\s*\n', '\n', clean_text)
-            clean_text = re.sub(r'\s+', ' ', clean_text)
-            
-            if clean_text:
-                result["text"] = clean_text
-            else:
-                result["text"] = "Got it!"
-            
+            self._cache_result(cache_key, result)
             return result
             
+        except asyncio.TimeoutError:
+            log("ai_timeout", logging.WARNING, timeout_seconds=AI_TIMEOUT_SECONDS)
+            return {
+                "text": "I'm having trouble processing that. Could you try again?",
+                "action": None,
+                "data": None
+            }
         except Exception as e:
-            print(f"Gemini API Error: {e}")
-            # TODO: Fallback to DeepSeek if needed
+            log("ai_provider_error", logging.ERROR, error=str(e))
             return {
                 "text": "I'm having trouble processing that. Could you try again?",
                 "action": None,
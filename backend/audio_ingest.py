@@ -0,0 +1,213 @@
+import os
+import math
+from array import array
+from typing import Callable, List, Optional, Tuple, Union
+
+# Binary /ws/audio frames are raw 16-bit little-endian mono PCM at this rate
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", "16000"))
+# Rates a client may announce in audio_start; anything else is refused (the ring
+# buffer is sized from the rate, so it must stay bounded)
+AUDIO_SAMPLE_RATES = {8000, 16000, 48000, AUDIO_SAMPLE_RATE}
+AUDIO_FRAME_MS = 20
+# Longest utterance kept; a customer still talking after this is cut off here
+AUDIO_MAX_UTTERANCE_SECONDS = float(os.getenv("AUDIO_MAX_UTTERANCE_SECONDS", "15"))
+# Silence that ends an utterance
+VAD_END_SILENCE_MS = int(os.getenv("VAD_END_SILENCE_MS", "250"))
+# Voiced audio needed before it counts as speech (filters clicks and bumps)
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "100"))
+# A frame is voiced when its RMS is this many times the noise floor...
+VAD_NOISE_RATIO = float(os.getenv("VAD_NOISE_RATIO", "3.0"))
+# ...and at least this loud (RMS of 16-bit samples)
+VAD_MIN_RMS = float(os.getenv("VAD_MIN_RMS", "300"))
+# Audio kept from before the detected start, so the first syllable isn't clipped
+VAD_PREROLL_MS = 200
+# What the stand-in transcriber "hears"; empty means every utterance is ignored
+AUDIO_FAKE_TRANSCRIPT = os.getenv("AUDIO_FAKE_TRANSCRIPT", "")
+
+
+def parse_sample_rate(value) -> Optional[int]:
+    """The announced sample rate if it is one of AUDIO_SAMPLE_RATES, else None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rate if rate == value and rate in AUDIO_SAMPLE_RATES else None
+
+
+def frame_rms(frame: bytes) -> float:
+    samples = array("h", frame)
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class PCMRingBuffer:
+    """Fixed-size byte ring addressed by absolute sample position.
+
+    Allocated once per session; audio older than the capacity is overwritten,
+    so memory stays flat however long a kiosk streams.
+    """
+
+    def __init__(self, capacity_samples: int):
+        self.capacity = capacity_samples
+        self._buffer = bytearray(capacity_samples * 2)
+        # Samples written since the session started
+        self.end = 0
+
+    @property
+    def start(self) -> int:
+        """Oldest sample position still held"""
+        return max(0, self.end - self.capacity)
+
+    def write(self, pcm: bytes) -> None:
+        size = len(self._buffer)
+        offset = (self.end * 2) % size
+        first = min(len(pcm), size - offset)
+        self._buffer[offset:offset + first] = pcm[:first]
+        if first < len(pcm):
+            self._buffer[:len(pcm) - first] = pcm[first:]
+        self.end += len(pcm) // 2
+
+    def read(self, start: int, end: int) -> bytes:
+        """PCM for samples [start, end), clamped to what is still held"""
+        start = max(start, self.start)
+        end = min(end, self.end)
+        if end <= start:
+            return b""
+        size = len(self._buffer)
+        offset = (start * 2) % size
+        length = (end - start) * 2
+        if offset + length <= size:
+            return bytes(self._buffer[offset:offset + length])
+        return bytes(self._buffer[offset:]) + bytes(self._buffer[:offset + length - size])
+
+
+class EnergyVAD:
+    """Frame-energy voice activity detector with an adaptive noise floor.
+
+    update() takes one frame's RMS and returns "speech_start" once enough
+    voiced frames have been seen, "speech_end" once the speaker has been
+    quiet for end_silence_ms, and None otherwise. The noise floor tracks the
+    room (idling engines, wind) while nobody is speaking.
+    """
+
+    def __init__(self, frame_ms: int = AUDIO_FRAME_MS, min_speech_ms: int = VAD_MIN_SPEECH_MS,
+                 end_silence_ms: int = VAD_END_SILENCE_MS, noise_ratio: float = VAD_NOISE_RATIO,
+                 min_rms: float = VAD_MIN_RMS):
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.end_silence_frames = max(1, end_silence_ms // frame_ms)
+        self.noise_ratio = noise_ratio
+        self.min_rms = min_rms
+        self.noise_floor: Optional[float] = None
+        self.speaking = False
+        self._voiced = 0
+        self._silent = 0
+
+    def end(self) -> None:
+        """Back to waiting for speech"""
+        self.speaking = False
+        self._voiced = 0
+        self._silent = 0
+
+    @property
+    def threshold(self) -> float:
+        return max(self.min_rms, (self.noise_floor or 0.0) * self.noise_ratio)
+
+    def update(self, rms: float) -> Optional[str]:
+        voiced = rms >= self.threshold
+        if not self.speaking:
+            if voiced:
+                self._voiced += 1
+                if self._voiced >= self.min_speech_frames:
+                    self.speaking = True
+                    self._silent = 0
+                    return "speech_start"
+            else:
+                self._voiced = 0
+                self.noise_floor = rms if self.noise_floor is None else self.noise_floor + 0.05 * (rms - self.noise_floor)
+            return None
+
+        if voiced:
+            self._silent = 0
+            return None
+        self._silent += 1
+        if self._silent >= self.end_silence_frames:
+            self.end()
+            return "speech_end"
+        return None
+
+
+class Transcriber:
+    """Speech-to-text backend: PCM (16-bit mono) in, text out"""
+
+    name = "base"
+
+    async def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        raise NotImplementedError
+
+
+class FakeTranscriber(Transcriber):
+    """Local stand-in for tests and offline runs.
+
+    reply may be fixed text or a callable taking (pcm, sample_rate), so tests
+    can script what each utterance "said".
+    """
+
+    name = "fake"
+
+    def __init__(self, reply: Union[str, Callable[[bytes, int], str]] = AUDIO_FAKE_TRANSCRIPT):
+        self.reply = reply
+        self.calls = 0
+
+    async def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        self.calls += 1
+        return self.reply(pcm, sample_rate) if callable(self.reply) else self.reply
+
+
+class AudioSession:
+    """One connection's audio: buffers PCM, runs the VAD and cuts out utterances.
+
+    feed() accepts frames of any size and returns events as they happen:
+    ("speech_start", None) and ("speech_end", pcm) with the whole utterance
+    (pre-roll included). An utterance reaching the buffer's capacity is ended
+    there.
+    """
+
+    def __init__(self, sample_rate: int = AUDIO_SAMPLE_RATE, vad: Optional[EnergyVAD] = None):
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * AUDIO_FRAME_MS // 1000
+        self.buffer = PCMRingBuffer(int(sample_rate * AUDIO_MAX_UTTERANCE_SECONDS))
+        self.vad = vad or EnergyVAD()
+        self._partial = b""
+        self._speech_start = 0
+        self._preroll = (VAD_PREROLL_MS // AUDIO_FRAME_MS + self.vad.min_speech_frames) * self.frame_samples
+
+    def feed(self, pcm: bytes) -> List[Tuple[str, Optional[bytes]]]:
+        events: List[Tuple[str, Optional[bytes]]] = []
+        data = self._partial + pcm
+        frame_bytes = self.frame_samples * 2
+        usable = len(data) - len(data) % frame_bytes
+        self._partial = data[usable:]
+        for offset in range(0, usable, frame_bytes):
+            frame = data[offset:offset + frame_bytes]
+            self.buffer.write(frame)
+            event = self.vad.update(frame_rms(frame))
+            if event == "speech_start":
+                self._speech_start = max(0, self.buffer.end - self._preroll)
+                events.append((event, None))
+            elif event == "speech_end":
+                # Leave out the trailing silence that ended it
+                end = self.buffer.end - self.vad.end_silence_frames * self.frame_samples
+                events.append((event, self.buffer.read(self._speech_start, end)))
+            elif self.vad.speaking and self.buffer.end - self._speech_start >= self.buffer.capacity:
+                # Out of room: end the utterance here
+                self.vad.end()
+                events.append(("speech_end", self.buffer.read(self._speech_start, self.buffer.end)))
+        return events
+
+
+def build_transcriber() -> Transcriber:
+    """The transcriber for binary /ws/audio; only the local stand-in ships today"""
+    return FakeTranscriber()
@@ -0,0 +1,322 @@
+"""Offline load test: the real backend, a fake model and simulated kiosks.
+
+Starts main.app on a local port with a deterministic FakeProvider in place of
+Gemini, then opens --kiosks concurrent /ws/audio clients (each replaying
+SCRIPT as one order) and a /ws/sensor publisher per lane. Reports turns/s,
+turn latency percentiles, event-loop lag in the server and memory per session.
+
+    python benchmark.py --kiosks 20 --orders 5 --latency lognormal:0.4:0.25
+    python benchmark.py --max-p99-ms 900    # exit 1 if p99 turn latency is slower
+    python benchmark.py --parser            # action parser vs the old regex loop
+    python benchmark.py --protocol 2 --encoding msgpack   # one turn_result frame per turn
+"""
+import os
+import sys
+import json
+import math
+import time
+import re
+import random
+import asyncio
+import argparse
+import resource
+import threading
+import timeit
+from typing import Callable, Dict, List, Optional
+import uvicorn
+import websockets
+
+# Logs would swamp the report; the benchmark only needs warnings
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["AI_PROVIDERS"] = "fake"
+
+import main
+from ai_service import get_ai_service
+from providers import FakeProvider, ProviderRouter
+from action_parser import parse_reply
+from cart import Cart
+
+# One order: (what the customer says, what the fake model answers)
+SCRIPT = [
+    ("can I get a medium coffee double double",
+     '{"action": "add_to_cart", "item_id": "coffee_original", "name": "Original Blend Coffee", '
+     '"modifiers": ["Medium", "2 Cream", "2 Sugar"]} Medium double double. Anything else?'),
+    ("and a large hot chocolate with whipped cream",
+     '{"action": "add_to_cart", "item_id": "hot_chocolate", "name": "Hot Chocolate", '
+     '"modifiers": ["Large", "Whipped Cream"]} One large hot chocolate. Anything else?'),
+    ("actually add a small french vanilla",
+     '{"action": "add_to_cart", "item_id": "french_vanilla", "name": "French Vanilla", '
+     '"modifiers": ["Small"]} Small French Vanilla added. What else can I get you?'),
+    ("remove the hot chocolate",
+     '{"action": "remove_item", "item_id": "hot_chocolate"} Removed the hot chocolate.'),
+    ("that's all thanks",
+     '{"action": "finalize_order"} Your total is on the screen. Please pull forward.'),
+]
+CANNED = {utterance: reply for utterance, reply in SCRIPT}
+# Nested modifier objects, which the old regex could not extract
+NESTED_REPLY = (
+    'Sure. {"action": "add_to_cart", "item_id": "iced_capp", "name": "Iced Capp", '
+    '"modifiers": [{"name": "Size", "choice": "Large"}, {"name": "Flavor", "choice": "Mocha"}]} '
+    'One large mocha Iced Capp. {"action": "add_to_cart", "item_id": "french_vanilla", '
+    '"name": "French Vanilla", "modifiers": [{"name": "Size", "choice": "Small"}]} Anything else?'
+)
+DEFAULT_REPLY = "Sorry, could you say that again?"
+
+SENSOR_INTERVAL_SECONDS = 0.2
+LAG_PROBE_SECONDS = 0.05
+
+
+def latency_sampler(spec: str, rng: random.Random) -> Callable[[list], float]:
+    """Model latency from a spec: "0.3", "uniform:0.1:0.6" or "lognormal:<median>:<sigma>" """
+    kind, _, params = spec.partition(":")
+    if not params:
+        fixed = float(kind)
+        return lambda contents: fixed
+    a, b = (float(value) for value in params.split(":"))
+    if kind == "uniform":
+        return lambda contents: rng.uniform(a, b)
+    if kind == "lognormal":
+        mu = math.log(a)
+        return lambda contents: rng.lognormvariate(mu, b)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def canned_reply(contents: list) -> str:
+    # The user turn is the utterance followed by the cart context
+    utterance = contents[-1]["parts"][0].split("\n\n", 1)[0]
+    return CANNED.get(utterance, DEFAULT_REPLY)
+
+
+def regex_parse_reply(text: str):
+    """The previous whole-reply parser, kept as the baseline for --parser"""
+    actions = []
+    clean_text = text
+    for match in re.finditer(r'\{[^{}]*\}', text):
+        json_str = match.group()
+        try:
+            action_data = json.loads(json_str)
+            if "action" in action_data:
+                actions.append(action_data)
+                clean_text = clean_text.replace(json_str, "")
+        except json.JSONDecodeError:
+            continue
+    clean_text = re.sub(r'\n\s*\n', '\n', clean_text.strip())
+    clean_text = re.sub(r'\s+', ' ', clean_text)
+    return clean_text, actions
+
+
+def parser_benchmark(number: int = 20000) -> bool:
+    """Time both parsers on every scripted reply and check what they extract.
+
+    Returns False if any of the single-pass parser's actions doesn't land in a cart.
+    """
+    replies = [reply for _, reply in SCRIPT] + [NESTED_REPLY]
+    for name, parse in (("regex", regex_parse_reply), ("single-pass", parse_reply)):
+        seconds = timeit.timeit(lambda: [parse(reply) for reply in replies], number=number)
+        found = sum(len(parse(reply)[1]) for reply in replies)
+        print(f"{name:12} {seconds / (number * len(replies)) * 1e6:7.2f} us/reply  actions found: {found}")
+    # Nested modifier objects must be priced, not just parsed
+    engine = get_ai_service().cart_engine
+    cart = Cart()
+    rejected = [message["message"] for _, actions in map(parse_reply, replies) for action in actions
+                for message in engine.apply(cart, action) if message["type"] == "cart_error"]
+    print(f"cart lines   {len(cart.lines)}  rejected: {rejected or 'none'}")
+    return not rejected
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux (bytes on macOS); peak, so growth is an upper bound
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class ServerThread:
+    """main.app under uvicorn on its own thread and event loop"""
+
+    def __init__(self, port: int):
+        self.server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        self.loop = asyncio.new_event_loop()
+        self.lags: List[float] = []
+        self._thread = threading.Thread(target=self.loop.run_until_complete, args=(self.server.serve(),), daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        self._lag_probe = asyncio.run_coroutine_threadsafe(self._probe_lag(), self.loop)
+
+    async def _probe_lag(self) -> None:
+        # How late a short sleep wakes up is how long the loop was busy elsewhere
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_SECONDS)
+            self.lags.append(time.perf_counter() - started - LAG_PROBE_SECONDS)
+
+    def stop(self) -> None:
+        self._lag_probe.cancel()
+        self.server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def decode_frame(frame) -> dict:
+    """Text frames are JSON; binary frames are MessagePack (only sent after it was negotiated)"""
+    if isinstance(frame, bytes):
+        import msgpack
+        return msgpack.unpackb(frame)
+    return json.loads(frame)
+
+
+async def run_kiosk(url: str, lane: str, kiosk: int, orders: int, stream: bool, hello: Optional[dict],
+                    turn_latencies: List[float], first_replies: List[float], errors: List[str],
+                    turn_frames: List[int]) -> None:
+    """One kiosk placing `orders` orders; every turn waits for its cart_state (or turn_result)"""
+    session_id = f"bench-{kiosk}"
+    async with websockets.connect(f"{url}/ws/audio?session_id={session_id}&lane={lane}", max_size=None) as ws:
+        if hello is not None:
+            await ws.send(json.dumps(hello))
+            while decode_frame(await ws.recv()).get("type") != "hello":
+                pass
+        for _ in range(orders):
+            for utterance, _ in SCRIPT:
+                started = time.perf_counter()
+                await ws.send(json.dumps({"type": "user_speech", "text": utterance, "stream": stream}))
+                first = None
+                frames = 0
+                while True:
+                    data = decode_frame(await ws.recv())
+                    kind = data.get("type")
+                    if kind in ("heartbeat", "sensor_reading"):
+                        # The lane's sensor traffic, not part of the turn
+                        continue
+                    frames += 1
+                    if first is None and kind in ("ai_response", "ai_response_partial", "turn_result"):
+                        first = time.perf_counter() - started
+                    if kind == "cart_error":
+                        errors.append(data.get("message", ""))
+                    elif kind == "turn_result":
+                        errors.extend(action.get("message", "") for action in data["actions"] if action["type"] == "cart_error")
+                        break
+                    elif kind == "cart_state":
+                        break
+                turn_latencies.append(time.perf_counter() - started)
+                turn_frames.append(frames)
+                if first is not None:
+                    first_replies.append(first)
+
+
+async def run_sensor(url: str, lane: str, stop: asyncio.Event, sent: List[int]) -> None:
+    """A lane's sensor publishing presence heartbeats until the kiosks finish"""
+    async with websockets.connect(f"{url}/ws/sensor?lane={lane}&role=publisher") as ws:
+        while not stop.is_set():
+            await ws.send(json.dumps({"type": "heartbeat", "present": True, "distance": 60.0}))
+            sent[0] += 1
+            await asyncio.sleep(SENSOR_INTERVAL_SECONDS)
+
+
+async def drive(args: argparse.Namespace) -> Dict[str, float]:
+    url = f"ws://127.0.0.1:{args.port}"
+    lanes = [str(lane + 1) for lane in range(args.lanes)]
+    turn_latencies: List[float] = []
+    first_replies: List[float] = []
+    errors: List[str] = []
+    turn_frames: List[int] = []
+    sensor_frames = [0]
+    hello = {"type": "hello", "protocol": args.protocol, "encodings": [args.encoding]} if args.protocol > 1 else None
+    stop = asyncio.Event()
+
+    sensors = [asyncio.create_task(run_sensor(url, lane, stop, sensor_frames)) for lane in lanes]
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_kiosk(url, lanes[kiosk % len(lanes)], kiosk, args.orders, args.stream, hello,
+                  turn_latencies, first_replies, errors, turn_frames)
+        for kiosk in range(args.kiosks)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*sensors)
+
+    return {
+        "turns": len(turn_latencies),
+        "seconds": round(elapsed, 3),
+        "turns_per_second": round(len(turn_latencies) / elapsed, 1),
+        "turn_p50_ms": round(percentile(turn_latencies, 50) * 1000, 1),
+        "turn_p90_ms": round(percentile(turn_latencies, 90) * 1000, 1),
+        "turn_p99_ms": round(percentile(turn_latencies, 99) * 1000, 1),
+        "first_reply_p50_ms": round(percentile(first_replies, 50) * 1000, 1),
+        "first_reply_p99_ms": round(percentile(first_replies, 99) * 1000, 1),
+        "frames_per_turn": round(sum(turn_frames) / max(len(turn_frames), 1), 2),
+        "cart_errors": len(errors),
+        "sensor_frames": sensor_frames[0],
+    }
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kiosks", type=int, default=10, help="concurrent /ws/audio clients")
+    parser.add_argument("--lanes", type=int, default=4, help="lanes (one sensor publisher each)")
+    parser.add_argument("--orders", type=int, default=3, help="orders replayed per kiosk")
+    parser.add_argument("--latency", default="lognormal:0.3:0.3",
+                        help='fake model latency: "0.3", "uniform:a:b" or "lognormal:median:sigma"')
+    parser.add_argument("--stream", action="store_true", help="use streaming turns")
+    parser.add_argument("--protocol", type=int, choices=(1, 2), default=1,
+                        help="/ws/audio protocol (2: one turn_result frame per turn)")
+    parser.add_argument("--encoding", choices=("json", "msgpack"), default="json",
+                        help="encoding asked for in the protocol 2 hello")
+    parser.add_argument("--fast-path", action="store_true", help="keep the local fast path (skips the model)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if p99 turn latency exceeds this")
+    parser.add_argument("--parser", action="store_true", help="only benchmark the action parser")
+    args = parser.parse_args(argv)
+
+    if args.parser:
+        return 0 if parser_benchmark() else 1
+
+    ai = get_ai_service()
+    ai.router = ProviderRouter([FakeProvider(reply=canned_reply, latency=latency_sampler(args.latency, random.Random(args.seed)))])
+    if not args.fast_path:
+        ai.intent_matcher = None
+        # The matcher is rebuilt when menu.json changes; keep it off for the run
+        ai.refresh_menu = lambda: None
+
+    server = ServerThread(args.port)
+    rss_before = rss_mb()
+    server.start()
+    try:
+        report = asyncio.run(drive(args))
+    finally:
+        server.stop()
+
+    sessions = max(len(ai.sessions), 1)
+    report.update({
+        "loop_lag_p50_ms": round(percentile(server.lags, 50) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(server.lags, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(server.lags, default=0.0) * 1000, 2),
+        "sessions": len(ai.sessions),
+        "history_chars_per_session": round(ai.sessions.total_chars / sessions),
+        "rss_growth_mb_per_session": round((rss_mb() - rss_before) / sessions, 3),
+    })
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        width = max(len(key) for key in report)
+        for key, value in report.items():
+            print(f"{key.ljust(width)}  {value}")
+
+    if args.max_p99_ms is not None and report["turn_p99_ms"] > args.max_p99_ms:
+        print(f"FAIL: p99 turn latency {report['turn_p99_ms']} ms > {args.max_p99_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
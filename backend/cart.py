@@ -0,0 +1,262 @@
+import logging
+import itertools
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from metrics import log
+
+# Tim Hortons slang: phrase -> {option name: choice}
+SLANG = {
+    "double double": {"Cream": "2", "Sugar": "2"},
+    "triple triple": {"Cream": "3", "Sugar": "3"},
+    "regular": {"Cream": "1", "Sugar": "1"},
+    "black": {"Cream": "0", "Sugar": "0"},
+}
+
+# Choices that mean "leave it out", so the option can be skipped
+DEFAULT_CHOICES = {"0", "No", "None"}
+
+# Ontario HST, applied to the cart subtotal
+HST_RATE = 0.13
+
+
+class CartError(Exception):
+    """An action the menu doesn't allow (unknown item, bad choice, too many)"""
+
+
+class MenuIndex:
+    """Lookup tables built once per menu version.
+
+    - items: id -> item (plus lowercase name -> id for models that get the id wrong)
+    - options: id -> option name -> choice set
+    - modifiers: id -> accepted modifier label (lowercase) -> [(option, choice)]
+      (slang such as "Double Double" maps to more than one option)
+
+    Each add is then priced and validated with dict lookups only.
+    """
+
+    def __init__(self, menu_data: Dict[str, Any]):
+        self.max_quantity = menu_data.get("max_quantity", 10)
+        self.pricing: Dict[str, float] = menu_data.get("modifiers_pricing", {})
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.names: Dict[str, str] = {}
+        self.options: Dict[str, Dict[str, List[str]]] = {}
+        self.modifiers: Dict[str, Dict[str, List[Tuple[str, str]]]] = {}
+
+        for item in menu_data.get("menu_items", []):
+            item_id = item["id"]
+            self.items[item_id] = item
+            self.names[item["name"].lower()] = item_id
+            self.options[item_id] = {option["name"]: option["choices"] for option in item.get("options", [])}
+            options = self.options[item_id]
+            labels: Dict[str, List[Tuple[str, str]]] = {}
+            for option, choices in options.items():
+                for choice in choices:
+                    for label in self._label_variants(option, choice):
+                        labels.setdefault(label.lower(), [(option, choice)])
+            for phrase, slang_choices in SLANG.items():
+                if all(choice in options.get(option, []) for option, choice in slang_choices.items()):
+                    labels.setdefault(phrase, list(slang_choices.items()))
+            self.modifiers[item_id] = labels
+
+    @staticmethod
+    def label(option: str, choice: str) -> Optional[str]:
+        """Canonical modifier text for a choice, or None if it adds nothing"""
+        if choice in DEFAULT_CHOICES:
+            return None
+        if option == "Size":
+            return choice
+        if choice.isdigit():
+            return f"{choice} {option}"
+        if choice == "Yes":
+            return option
+        return choice
+
+    @staticmethod
+    def _label_variants(option: str, choice: str) -> List[str]:
+        variants = [f"{option}: {choice}", f"{option} {choice}", f"{choice} {option}"]
+        canonical = MenuIndex.label(option, choice)
+        if canonical is not None:
+            variants.insert(0, canonical)
+        if choice in DEFAULT_CHOICES:
+            variants += [f"no {option}", f"{option}: none"]
+        return variants
+
+    def resolve_item(self, item_id: Optional[str], name: Optional[str]) -> Dict[str, Any]:
+        item = self.items.get(item_id or "")
+        if item is None and name:
+            item = self.items.get(self.names.get(name.lower(), ""))
+        if item is None:
+            raise CartError(f"'{name or item_id}' is not on the menu")
+        return item
+
+    def _resolve_object(self, item: Dict[str, Any], modifier: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """{"name": "Size", "choice": "Large"} -> [("Size", "Large")], matched case-insensitively"""
+        option_name = str(modifier.get("name", modifier.get("option", ""))).strip()
+        choice_name = str(modifier.get("choice", modifier.get("value", ""))).strip()
+        for option, choices in self.options[item["id"]].items():
+            if option.lower() != option_name.lower():
+                continue
+            for choice in choices:
+                if choice.lower() == choice_name.lower():
+                    return [(option, choice)]
+        raise CartError(f"'{option_name}: {choice_name}' isn't available for {item['name']}")
+
+    def resolve_modifiers(self, item: Dict[str, Any], modifiers: List[Any]) -> List[Tuple[str, str]]:
+        """Map modifiers (free text, or {"name", "choice"} objects) to (option, choice) pairs, one per option"""
+        labels = self.modifiers[item["id"]]
+        chosen: Dict[str, str] = {}
+        for modifier in modifiers:
+            if isinstance(modifier, dict):
+                matches = self._resolve_object(item, modifier)
+            else:
+                matches = labels.get(str(modifier).strip().lower())
+            if matches is None:
+                raise CartError(f"'{modifier}' isn't available for {item['name']}")
+            for option, choice in matches:
+                if chosen.get(option, choice) != choice:
+                    raise CartError(f"Conflicting {option} choices for {item['name']}")
+                chosen[option] = choice
+        if "Size" in self.options[item["id"]] and "Size" not in chosen:
+            raise CartError(f"Please choose a size for {item['name']}")
+        return list(chosen.items())
+
+    def surcharge(self, option: str, choice: str) -> float:
+        if choice in DEFAULT_CHOICES:
+            return 0.0
+        if option == "Size":
+            return self.pricing.get(choice, 0.0)
+        return self.pricing.get(choice, self.pricing.get(option, 0.0))
+
+    def price(self, item: Dict[str, Any], chosen: List[Tuple[str, str]]) -> float:
+        return round(item["basePrice"] + sum(self.surcharge(option, choice) for option, choice in chosen), 2)
+
+
+class Cart:
+    """Server-side authoritative cart for one session.
+
+    Running subtotal and per-item counts are kept up to date on every change,
+    so totals and the max_quantity check never rescan the lines.
+    """
+
+    def __init__(self):
+        self.lines: List[Dict[str, Any]] = []
+        self.subtotal = 0.0
+        self.counts: Counter = Counter()
+        self._line_ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    @classmethod
+    def from_lines(cls, lines: List[Dict[str, Any]]) -> "Cart":
+        """Rebuild a cart (running totals included) from saved lines"""
+        cart = cls()
+        for line in lines:
+            cart.lines.append(dict(line))
+            cart.subtotal += line["finalPrice"]
+            cart.counts[line["id"]] += 1
+        # New lines must not reuse a saved lineId
+        numbers = [int(line["lineId"].rsplit("-", 1)[-1]) for line in lines if str(line.get("lineId", "")).startswith("line-")]
+        cart._line_ids = itertools.count(max(numbers, default=0) + 1)
+        return cart
+
+    def add_line(self, line: Dict[str, Any]) -> Dict[str, Any]:
+        line["lineId"] = f"line-{next(self._line_ids)}"
+        self.lines.append(line)
+        self.subtotal += line["finalPrice"]
+        self.counts[line["id"]] += 1
+        return line
+
+    def remove_item(self, item_id: str, quantity: Optional[int] = None) -> int:
+        """Remove the most recent lines for item_id (all of them by default)"""
+        removed = 0
+        for index in range(len(self.lines) - 1, -1, -1):
+            if quantity is not None and removed >= quantity:
+                break
+            line = self.lines[index]
+            if line["id"] == item_id:
+                del self.lines[index]
+                self.subtotal -= line["finalPrice"]
+                self.counts[item_id] -= 1
+                removed += 1
+        if not self.lines:
+            self.subtotal = 0.0
+        return removed
+
+    def clear(self) -> None:
+        self.lines = []
+        self.subtotal = 0.0
+        self.counts.clear()
+
+    def totals(self) -> Dict[str, float]:
+        subtotal = round(self.subtotal, 2)
+        tax = round(subtotal * HST_RATE, 2)
+        return {"subtotal": subtotal, "tax": tax, "total": round(subtotal + tax, 2)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"items": [dict(line) for line in self.lines], **self.totals()}
+
+
+class CartEngine:
+    """Validates AI actions against the menu and applies them to a Cart.
+
+    apply() returns the websocket messages to send for the action; an invalid
+    action leaves the cart untouched and yields a cart_error instead.
+    """
+
+    def __init__(self, menu_data: Dict[str, Any]):
+        self.index = MenuIndex(menu_data)
+
+    def apply(self, cart: Cart, action: Dict[str, Any]) -> List[Dict[str, Any]]:
+        action_type = action.get("action")
+        try:
+            if action_type == "add_to_cart":
+                return self._add(cart, action)
+            if action_type == "remove_item":
+                item_id = action.get("item_id")
+                quantity = action.get("quantity")
+                cart.remove_item(item_id, int(quantity) if quantity else None)
+                return [{"type": "remove_item", "item_id": item_id}]
+            if action_type == "clear_cart":
+                cart.clear()
+                return [{"type": "clear_cart"}]
+            if action_type == "finalize_order":
+                if not cart.lines:
+                    # Nothing to pay for; don't send a $0.00 order to the journal or the LCD
+                    raise CartError("There's nothing in your order yet")
+                # The order is handed off for payment; the next one starts empty
+                totals = cart.totals()
+                items = [dict(line) for line in cart.lines]
+                cart.clear()
+                return [{"type": "finalize_order", **totals, "items": items}]
+        except (CartError, TypeError, ValueError) as e:
+            log("action_rejected", logging.WARNING, action=action, error=str(e))
+            return [{"type": "cart_error", "message": str(e)}]
+        return []
+
+    def _add(self, cart: Cart, action: Dict[str, Any]) -> List[Dict[str, Any]]:
+        index = self.index
+        item = index.resolve_item(action.get("item_id"), action.get("name"))
+        quantity = int(action.get("quantity") or 1)
+        if quantity < 1:
+            raise CartError("Quantity must be at least 1")
+        if cart.counts[item["id"]] + quantity > index.max_quantity:
+            raise CartError(
+                f"The maximum is {index.max_quantity} {item['name']} per order. "
+                "Please speak with an employee for larger orders."
+            )
+        chosen = index.resolve_modifiers(item, action.get("modifiers") or [])
+        price = index.price(item, chosen)
+        modifiers = [label for label in (index.label(option, choice) for option, choice in chosen) if label]
+
+        messages = []
+        for _ in range(quantity):
+            line = cart.add_line({
+                "id": item["id"],
+                "name": item["name"],
+                "basePrice": item["basePrice"],
+                "modifiers": list(modifiers),
+                "finalPrice": price,
+            })
+            messages.append({"type": "cart_update", "item": dict(line)})
+        return messages
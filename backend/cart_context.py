@@ -0,0 +1,75 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+LineKey = Tuple[str, Tuple[str, ...], float]
+
+
+def _line_key(item: Dict[str, Any]) -> LineKey:
+    return (
+        item.get("name") or item.get("id") or "?",
+        tuple(item.get("modifiers") or []),
+        round(float(item.get("finalPrice", item.get("basePrice", 0.0)) or 0.0), 2),
+    )
+
+
+def _describe(key: LineKey) -> str:
+    name, modifiers, price = key
+    return f"{name}[{','.join(modifiers)}] @{price:.2f}" if modifiers else f"{name} @{price:.2f}"
+
+
+def cart_counts(cart: list) -> Counter:
+    """Identical cart lines collapsed into counts"""
+    return Counter(_line_key(item) for item in cart)
+
+
+def summarize_cart(counts: Counter) -> str:
+    """One-line cart summary: "Cart: 2x Coffee[Medium,2 Cream] @2.29; ... | subtotal 4.58" """
+    if not counts:
+        return "Cart is empty"
+    lines = [f"{count}x {_describe(key)}" for key, count in counts.items()]
+    subtotal = sum(key[2] * count for key, count in counts.items())
+    return f"Cart: {'; '.join(lines)} | subtotal {subtotal:.2f}"
+
+
+def diff_carts(previous: Counter, current: Counter) -> str:
+    """Describe what changed between two carts: "Cart changes: +1 Donut @1.49; -1 ..." """
+    changes: List[str] = []
+    for key in current.keys() | previous.keys():
+        delta = current[key] - previous[key]
+        if delta:
+            changes.append(f"{delta:+d} {_describe(key)}")
+    if not changes:
+        return "Cart unchanged"
+    changes.sort()
+    return f"Cart changes: {'; '.join(changes)}"
+
+
+class CartContext:
+    """Per-session cart context that stays small as orders grow.
+
+    The first turn gets a full cart summary; later turns only get the diff
+    against the cart the model last saw. Because history is windowed, a full
+    summary is re-sent before the previous one falls out of the window.
+    """
+
+    def __init__(self):
+        self._seen: Optional[Counter] = None
+        self._turns_since_summary = 0
+        self._pending: Optional[Tuple[Counter, bool]] = None
+
+    def render(self, cart: list, window_turns: int) -> str:
+        """Context for this turn. Call commit() once the turn is recorded."""
+        counts = cart_counts(cart)
+        full = self._seen is None or self._turns_since_summary + 1 >= window_turns
+        self._pending = (counts, full)
+        if full:
+            return summarize_cart(counts)
+        return diff_carts(self._seen, counts)
+
+    def commit(self) -> None:
+        if self._pending is None:
+            return
+        counts, full = self._pending
+        self._seen = counts
+        self._turns_since_summary = 0 if full else self._turns_since_summary + 1
+        self._pending = None
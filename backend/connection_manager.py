@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Union
+from fastapi import WebSocket
+from metrics import log, span
+
+try:
+    import msgpack
+except ImportError:  # optional: without it every client stays on JSON
+    msgpack = None
+
+# Messages a client may have waiting before it is treated as stalled and dropped
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# A single send taking longer than this also marks the client as stalled
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+
+# Frames where only the newest one matters; a pending one is replaced, not queued
+COALESCED_TYPES = {"sensor_reading", "heartbeat"}
+
+DEFAULT_LANE = "1"
+# Lane names a client may use; the lane is a metrics label and a topic name, so it must stay a small set
+LANE_PATTERN = re.compile(os.getenv("LANE_PATTERN", r"[0-9]{1,2}"))
+
+# Highest /ws/audio protocol this server speaks; clients that send no hello get 1
+PROTOCOL_VERSION = 2
+
+
+def valid_lane(lane: str) -> bool:
+    return LANE_PATTERN.fullmatch(lane) is not None
+
+
+def lane_topic(lane: str, kind: str) -> str:
+    """Topic name for one kind of traffic on one lane, e.g. lane:2:sensor"""
+    return f"lane:{lane}:{kind}"
+
+
+def _coalesce_key(message: str, prefix: str = "") -> Optional[str]:
+    try:
+        data = json.loads(message)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(data, dict) and data.get("type") in COALESCED_TYPES:
+        return f"{prefix}{data['type']}"
+    return None
+
+
+class ClientConnection:
+    """One websocket with its own outbound queue and writer task.
+
+    send() never waits on the network: messages are queued and written by the
+    writer task, so a slow client only ever delays itself. Coalesced frames
+    (sensor readings) keep just the latest value per key. A client whose queue
+    overflows or whose send times out is closed and evicted.
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager",
+                 max_queue: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.manager = manager
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.closed = False
+        self.topics: Set[str] = set()
+        # Lane the client belongs to, if it said (used to address lane topics)
+        self.lane: Optional[str] = None
+        # Agreed in the client's hello (see negotiate())
+        self.protocol = 1
+        self.encoding = "json"
+        self._queue: Deque[Union[str, bytes]] = deque()
+        self._latest: Dict[str, str] = {}
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def backlog(self) -> int:
+        return len(self._queue) + len(self._latest)
+
+    def negotiate(self, hello: dict) -> dict:
+        """Apply a client's hello and return the reply announcing what was agreed.
+
+        The client asks for a protocol version and may list the encodings it
+        can read; the server picks the highest version both speak, and
+        MessagePack only if it is installed here.
+        """
+        try:
+            wanted = int(hello.get("protocol", 1))
+        except (TypeError, ValueError):
+            wanted = 1
+        self.protocol = max(1, min(wanted, PROTOCOL_VERSION))
+        encodings = hello.get("encodings") or []
+        self.encoding = "msgpack" if "msgpack" in encodings and msgpack is not None else "json"
+        return {"type": "hello", "protocol": self.protocol, "encoding": self.encoding}
+
+    def send(self, message: Union[str, bytes], key: Optional[str] = None) -> bool:
+        """Queue a frame (str as text, bytes as binary). Returns False if the client is closed or was evicted."""
+        if self.closed:
+            return False
+        if key is not None:
+            if key in self._latest:
+                self.manager.dropped += 1
+            self._latest[key] = message
+        else:
+            if len(self._queue) >= self.max_queue:
+                log("client_evicted", logging.WARNING, lane=self.lane, reason="queue_full", queued=len(self._queue))
+                self.evict()
+                return False
+            self._queue.append(message)
+        self._wakeup.set()
+        return True
+
+    async def send_json(self, data: Any) -> None:
+        # Same call shape as WebSocket.send_json, so turn handlers can use either.
+        # A client that negotiated MessagePack gets a binary frame instead.
+        if self.encoding == "msgpack":
+            self.send(msgpack.packb(data))
+        else:
+            self.send(json.dumps(data))
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue or self._latest:
+                    if self._queue:
+                        message = self._queue.popleft()
+                    else:
+                        message = self._latest.pop(next(iter(self._latest)))
+                    write = self.websocket.send_bytes if isinstance(message, bytes) else self.websocket.send_text
+                    with span("send", self.lane):
+                        await asyncio.wait_for(write(message), self.send_timeout)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            log("client_evicted", logging.WARNING, lane=self.lane, reason="send_timeout", timeout_seconds=self.send_timeout)
+            self.evict()
+        except Exception as e:
+            log("client_evicted", logging.WARNING, lane=self.lane, reason="send_failed", error=str(e))
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop the client and close its socket; its receive loop then ends normally"""
+        if self.closed:
+            return
+        self.manager.disconnect(self.websocket)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        try:
+            await asyncio.wait_for(self.websocket.close(code=1011), self.send_timeout)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        self.closed = True
+        self._queue.clear()
+        self._latest.clear()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+
+class ConnectionManager:
+    """Tracks open websockets and the topics each one subscribes to.
+
+    publish() reaches only a topic's subscribers, so a lane's sensor frames go
+    to that lane's displays and not to every socket on the backend. With a
+    relay (a StateStore), published messages also reach subscribers connected
+    to the other workers.
+    """
+
+    def __init__(self, relay=None):
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.topics: Dict[str, Set[ClientConnection]] = {}
+        self.relay = relay
+        # Coalesced frames replaced by a newer one before they were written
+        self.dropped = 0
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket, self)
+        self.clients[websocket] = client
+        return client
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        for topic in client.topics:
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del self.topics[topic]
+        client.stop()
+
+    def subscribe(self, client: ClientConnection, topic: str) -> None:
+        client.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(client)
+
+    def publish(self, topic: str, message: str, sender: Optional[ClientConnection] = None, relay: bool = True) -> int:
+        """Queue a message for a topic's subscribers (never the sender). Returns how many here."""
+        if relay and self.relay is not None:
+            self.relay.publish(topic, message)
+        subscribers = self.topics.get(topic)
+        if not subscribers:
+            return 0
+        key = _coalesce_key(message, f"{topic}:")
+        sent = 0
+        for client in list(subscribers):
+            if client is not sender and client.send(message, key):
+                sent += 1
+        return sent
+
+    def render_metrics(self) -> List[str]:
+        """Connected clients, queued frames and dropped frames in the Prometheus text format"""
+        backlog = sum(client.backlog for client in self.clients.values())
+        return [
+            "# HELP kiosk_ws_clients Open websocket connections",
+            "# TYPE kiosk_ws_clients gauge",
+            f"kiosk_ws_clients {len(self.clients)}",
+            "# HELP kiosk_ws_send_backlog Frames queued for websocket clients and not yet written",
+            "# TYPE kiosk_ws_send_backlog gauge",
+            f"kiosk_ws_send_backlog {backlog}",
+            "# HELP kiosk_ws_frames_dropped_total Coalesced frames replaced by a newer one before they were written",
+            "# TYPE kiosk_ws_frames_dropped_total counter",
+            f"kiosk_ws_frames_dropped_total {self.dropped}",
+        ]
@@ -0,0 +1,310 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# "1" forces the simulated backend; by default it is used when RPi.GPIO is missing
+HARDWARE_SIM = os.getenv("HARDWARE_SIM", "auto")
+
+SPEED_OF_SOUND_CM_S = 34300
+KEYPAD_MAP = [
+    ["1", "2", "3", "A"],
+    ["4", "5", "6", "B"],
+    ["7", "8", "9", "C"],
+    ["*", "0", "#", "D"]
+]
+
+
+class SimulatedGPIO:
+    """Enough of the RPi.GPIO API to run the controller on a plain Linux box.
+
+    Inputs change through set_input(), which fires edge callbacks like the
+    real library (on another thread). attach_ultrasonic() and attach_keypad()
+    wire up a fake HC-SR04 and a fake 4x4 keypad.
+    """
+
+    BCM = "BCM"
+    IN = "IN"
+    OUT = "OUT"
+    HIGH = 1
+    LOW = 0
+    PUD_UP = "PUD_UP"
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+
+    def __init__(self):
+        self.levels: Dict[int, int] = {}
+        self.pull_ups: Set[int] = set()
+        self.callbacks: Dict[int, Tuple[str, Callable[[int], None]]] = {}
+        self._lock = threading.RLock()
+        # Ultrasonic: trigger pin -> (echo pin, distance source)
+        self._ultrasonic: Dict[int, Tuple[int, Callable[[], Optional[float]]]] = {}
+        # Keypad: pressed (row pin, col pin) pairs
+        self._keypad_rows: List[int] = []
+        self._keypad_cols: List[int] = []
+        self._pressed: Set[Tuple[int, int]] = set()
+
+    # --- RPi.GPIO API ---
+    def setmode(self, mode) -> None:
+        pass
+
+    def setwarnings(self, flag) -> None:
+        pass
+
+    def setup(self, pin: int, direction, pull_up_down=None, initial=None) -> None:
+        if pull_up_down == self.PUD_UP:
+            self.pull_ups.add(pin)
+        self.levels.setdefault(pin, self.HIGH if pin in self.pull_ups else self.LOW)
+        if initial is not None:
+            self.levels[pin] = int(initial)
+
+    def output(self, pin: int, value) -> None:
+        with self._lock:
+            previous = self.levels.get(pin, self.LOW)
+            self.levels[pin] = int(bool(value))
+            if pin in self._ultrasonic and previous and not value:
+                self._echo(pin)
+            if pin in self._keypad_rows:
+                self._refresh_columns()
+
+    def input(self, pin: int) -> int:
+        with self._lock:
+            if pin in self._keypad_cols:
+                return self._column_level(pin)
+            return self.levels.get(pin, self.LOW)
+
+    def add_event_detect(self, pin: int, edge, callback: Callable[[int], None] = None, bouncetime: int = None) -> None:
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin: int) -> None:
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self) -> None:
+        self.callbacks.clear()
+
+    # --- simulation hooks ---
+    def set_input(self, pin: int, level: int) -> None:
+        """Drive an input pin; fires the pin's edge callback on a change"""
+        with self._lock:
+            previous = self.levels.get(pin, self.LOW)
+            self.levels[pin] = level
+        if previous != level:
+            self._fire(pin, rising=bool(level))
+
+    def _fire(self, pin: int, rising: bool) -> None:
+        edge, callback = self.callbacks.get(pin, (None, None))
+        if callback is None:
+            return
+        if edge == self.BOTH or edge == (self.RISING if rising else self.FALLING):
+            callback(pin)
+
+    def attach_ultrasonic(self, trig: int, echo: int, distance: Callable[[], Optional[float]]) -> None:
+        """After each trigger pulse, answer with an echo as long as the round trip
+        to distance() cm (no echo at all if it returns None)"""
+        self._ultrasonic[trig] = (echo, distance)
+
+    def _echo(self, trig: int) -> None:
+        echo, distance = self._ultrasonic[trig]
+        cm = distance()
+        if cm is None:
+            return
+
+        def pulse() -> None:
+            self.set_input(echo, self.HIGH)
+            time.sleep(cm * 2 / SPEED_OF_SOUND_CM_S)
+            self.set_input(echo, self.LOW)
+
+        threading.Thread(target=pulse, daemon=True).start()
+
+    def attach_keypad(self, rows: List[int], cols: List[int]) -> None:
+        self._keypad_rows = list(rows)
+        self._keypad_cols = list(cols)
+
+    def _column_level(self, col: int) -> int:
+        # Active-low: a pressed key connects its column to its row's level
+        for row, pressed_col in self._pressed:
+            if pressed_col == col and self.levels.get(row, self.HIGH) == self.LOW:
+                return self.LOW
+        return self.HIGH
+
+    def _refresh_columns(self) -> None:
+        for col in self._keypad_cols:
+            self.levels[col] = self._column_level(col)
+
+    def _key_pins(self, key: str) -> Tuple[int, int]:
+        for r, row_keys in enumerate(KEYPAD_MAP):
+            if key in row_keys:
+                return self._keypad_rows[r], self._keypad_cols[row_keys.index(key)]
+        raise ValueError(f"No such key: {key}")
+
+    def press(self, key: str) -> None:
+        pair = self._key_pins(key)
+        col = pair[1]
+        with self._lock:
+            before = self._column_level(col)
+            self._pressed.add(pair)
+            after = self._column_level(col)
+            self.levels[col] = after
+        if before != after:
+            self._fire(col, rising=False)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._pressed.discard(self._key_pins(key))
+            self._refresh_columns()
+
+    def tap(self, key: str) -> None:
+        self.press(key)
+        self.release(key)
+
+
+def start_console_keypad(gpio: SimulatedGPIO) -> None:
+    """Type keys on stdin (e.g. "D", then "1234A") to press them on a simulated keypad"""
+    import sys
+
+    def read() -> None:
+        for line in sys.stdin:
+            for key in line.strip().upper():
+                try:
+                    gpio.tap(key)
+                except ValueError:
+                    print(f"No such key: {key}")
+
+    threading.Thread(target=read, daemon=True).start()
+
+
+def load_gpio():
+    """RPi.GPIO on a Pi, SimulatedGPIO elsewhere (or when HARDWARE_SIM=1)"""
+    if HARDWARE_SIM != "1":
+        try:
+            import RPi.GPIO as GPIO
+            return GPIO
+        except (ImportError, RuntimeError):
+            if HARDWARE_SIM == "0":
+                raise
+    print("RPi.GPIO not available, using simulated GPIO")
+    return SimulatedGPIO()
+
+
+class UltrasonicSensor:
+    """HC-SR04 measured with edge callbacks instead of busy-wait loops.
+
+    The echo pin's rising and falling edges are timestamped in the GPIO
+    callback; measure() just sends the trigger pulse and sleeps on an event
+    until the falling edge arrives or the timeout passes.
+    """
+
+    def __init__(self, gpio, trig: int, echo: int, timeout: float = 0.06):
+        self.gpio = gpio
+        self.trig = trig
+        self.echo = echo
+        self.timeout = timeout
+        self._rise_ns: Optional[int] = None
+        self._fall_ns: Optional[int] = None
+        self._done = threading.Event()
+        gpio.setup(trig, gpio.OUT)
+        gpio.setup(echo, gpio.IN)
+        gpio.output(trig, gpio.LOW)
+        gpio.add_event_detect(echo, gpio.BOTH, callback=self._on_edge)
+
+    def _on_edge(self, pin: int) -> None:
+        now = time.perf_counter_ns()
+        # Alternate rather than reading the pin: on a short echo the level may
+        # already have changed again by the time the callback runs
+        if self._rise_ns is None:
+            self._rise_ns = now
+        elif self._fall_ns is None:
+            self._fall_ns = now
+            self._done.set()
+
+    def measure(self) -> Optional[float]:
+        """Distance in cm, or None if no echo came back in time"""
+        self._rise_ns = self._fall_ns = None
+        self._done.clear()
+        self.gpio.output(self.trig, self.gpio.HIGH)
+        time.sleep(0.00001)
+        self.gpio.output(self.trig, self.gpio.LOW)
+        if not self._done.wait(self.timeout):
+            return None
+        pulse_seconds = (self._fall_ns - self._rise_ns) / 1e9
+        return round(pulse_seconds * SPEED_OF_SOUND_CM_S / 2, 2)
+
+
+class Keypad:
+    """4x4 matrix keypad read through column edge interrupts.
+
+    Rows idle LOW so any press pulls its column LOW and fires a callback. Only
+    then are the rows scanned to find the key, which is passed to listener;
+    nothing runs between presses.
+    """
+
+    def __init__(self, gpio, rows: List[int], cols: List[int], keymap: List[List[str]] = KEYPAD_MAP,
+                 bouncetime_ms: int = 50, settle_seconds: float = 0.02):
+        self.gpio = gpio
+        self.rows = rows
+        self.cols = cols
+        self.keymap = keymap
+        self.settle_seconds = settle_seconds
+        # Called with each key from the GPIO thread; presses before it is set are ignored
+        self.listener: Optional[Callable[[str], None]] = None
+        self._scan_lock = threading.Lock()
+        for r in rows:
+            gpio.setup(r, gpio.OUT)
+            gpio.output(r, gpio.LOW)
+        for c in cols:
+            gpio.setup(c, gpio.IN, pull_up_down=gpio.PUD_UP)
+            gpio.add_event_detect(c, gpio.FALLING, callback=self._on_press, bouncetime=bouncetime_ms)
+
+    def _on_press(self, col_pin: int) -> None:
+        with self._scan_lock:
+            # Release bounce can look like a press; only a column still LOW counts
+            time.sleep(self.settle_seconds)
+            if self.gpio.input(col_pin) != self.gpio.LOW:
+                return
+            c = self.cols.index(col_pin)
+            key = None
+            try:
+                for r, row_pin in enumerate(self.rows):
+                    for other in self.rows:
+                        self.gpio.output(other, self.gpio.LOW if other == row_pin else self.gpio.HIGH)
+                    if self.gpio.input(col_pin) == self.gpio.LOW:
+                        key = self.keymap[r][c]
+                        break
+            finally:
+                for row_pin in self.rows:
+                    self.gpio.output(row_pin, self.gpio.LOW)
+            if key is not None and self.listener is not None:
+                self.listener(key)
+
+
+class ConsoleLCD:
+    """Stand-in for the I2C character LCD that prints what would be shown"""
+
+    def __init__(self, cols: int = 20, rows: int = 4):
+        self.cols = cols
+        self.rows = rows
+        self.cursor_pos = (0, 0)
+
+    def clear(self) -> None:
+        # Like the real controller, clear also homes the cursor
+        print("[LCD clear]")
+        self.cursor_pos = (0, 0)
+
+    def write_string(self, text: str) -> None:
+        row, col = self.cursor_pos
+        print(f"[LCD {row},{col}] {text}")
+        self.cursor_pos = (row, col + len(text))
+
+
+def open_lcd(cols: int = 20, rows: int = 4):
+    """The PCF8574 I2C LCD if RPLCD and the bus are available, else ConsoleLCD"""
+    if HARDWARE_SIM != "1":
+        try:
+            from RPLCD.i2c import CharLCD
+            return CharLCD('PCF8574', 0x27, cols=cols, rows=rows)
+        except (ImportError, OSError) as e:
+            if HARDWARE_SIM == "0":
+                raise
+            print(f"LCD not available ({e}), printing to console")
+    return ConsoleLCD(cols, rows)
@@ -0,0 +1,222 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from cart import DEFAULT_CHOICES, HST_RATE, SLANG
+
+# Slang that implies a coffee when no item is named ("a medium double double")
+DEFAULT_COFFEE_ID = "coffee_original"
+
+SIZE_ALIASES = {
+    "extra large": "Extra Large",
+    "xl": "Extra Large",
+    "small": "Small",
+    "medium": "Medium",
+    "large": "Large",
+}
+
+NUMBER_WORDS = {
+    "zero": 0, "no": 0, "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4,
+    "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+# Words customers pluralise ("two double doubles", "two boston creams")
+SINGULAR_WORDS = {"double", "triple", "regular", "coffee", "cream", "sugar"}
+
+FINALIZE_PHRASES = {
+    "thats it", "thats all", "thats everything", "im done", "im good", "all done",
+    "done", "nothing else", "no thats it", "no thats all", "that will be all",
+    "thatll be all", "thats it thanks", "thats all thanks",
+}
+
+CLEAR_PHRASES = {
+    "clear my order", "clear the order", "clear my cart", "clear the cart",
+    "cancel my order", "cancel the order", "start over", "start again",
+}
+
+# Words that carry no ordering information
+FILLER = {
+    "i", "id", "want", "would", "like", "can", "could", "get", "have", "give", "me",
+    "please", "thanks", "thank", "you", "and", "with", "a", "an", "just", "lets",
+    "ill", "take", "um", "uh", "hi", "hello", "hey", "may",
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop apostrophes and punctuation, collapse whitespace"""
+    text = text.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"[^a-z0-9&]+", " ", text)
+    return " ".join(text.split())
+
+
+def _take(text: str, phrase: str) -> Tuple[bool, str]:
+    """Remove a whole-word phrase from text. Returns (found, remaining text)."""
+    pattern = r"(?:^| )" + re.escape(phrase) + r"(?= |$)"
+    remaining, count = re.subn(pattern, " ", text, count=1)
+    return count > 0, " ".join(remaining.split())
+
+
+class IntentMatcher:
+    """Deterministic matcher for the most common kiosk utterances.
+
+    Built from menu.json plus the slang table from the system prompt. match()
+    returns the same action dicts the model would emit, or None whenever the
+    utterance isn't fully understood, so the caller can fall back to the model.
+    """
+
+    def __init__(self, menu_data: Dict[str, Any]):
+        self.max_quantity = menu_data.get("max_quantity", 10)
+        self.pricing = menu_data.get("modifiers_pricing", {})
+        self.items = {item["id"]: item for item in menu_data.get("menu_items", [])}
+
+        # Item aliases, longest first so "dark roast coffee" beats "dark roast"
+        aliases: Dict[str, Optional[str]] = {}
+        for item in self.items.values():
+            name = normalize(item["name"])
+            for alias in (name, re.sub(r" coffee$", "", name)):
+                # An alias shared by two items is ambiguous
+                aliases[alias] = item["id"] if aliases.get(alias, item["id"]) == item["id"] else None
+        self.aliases = sorted(aliases.items(), key=lambda pair: -len(pair[0]))
+
+    def match(self, user_text: str, current_cart: list) -> Optional[Dict[str, Any]]:
+        text = normalize(user_text)
+        if not text:
+            return None
+
+        if text in CLEAR_PHRASES:
+            return {
+                "text": "Okay, I've cleared your order. What can I get you?",
+                "actions": [{"action": "clear_cart"}],
+            }
+
+        if text in FINALIZE_PHRASES:
+            if not current_cart:
+                return None
+            # Rounded the way Cart.totals() does, so the spoken total matches the receipt
+            subtotal = round(sum(item.get("finalPrice", 0.0) for item in current_cart), 2)
+            total = round(subtotal + round(subtotal * HST_RATE, 2), 2)
+            return {
+                "text": f"Great! Your total with tax is ${total:.2f}. Thank you!",
+                "actions": [{"action": "finalize_order"}],
+            }
+
+        return self._match_item(text)
+
+    def _match_item(self, text: str) -> Optional[Dict[str, Any]]:
+        # "two double doubles" -> "two double double"
+        text = " ".join(
+            word[:-1] if word.endswith("s") and word[:-1] in SINGULAR_WORDS else word
+            for word in text.split()
+        )
+
+        # Item name
+        item_id = None
+        for alias, alias_id in self.aliases:
+            found, rest = _take(text, alias)
+            if found:
+                if alias_id is None:
+                    return None
+                item_id, text = alias_id, rest
+                break
+
+        # Size
+        size = None
+        for alias, choice in SIZE_ALIASES.items():
+            found, text = _take(text, alias)
+            if found:
+                size = choice
+                break
+
+        # Slang and explicit "<n> cream" / "<n> sugar"
+        chosen: Dict[str, str] = {}
+        for phrase, choices in SLANG.items():
+            found, text = _take(text, phrase)
+            if found:
+                chosen.update(choices)
+        for option in ("cream", "sugar"):
+            for word in re.findall(r"(\w+) " + option + r"\b", text):
+                count = NUMBER_WORDS.get(word, int(word) if word.isdigit() else None)
+                if count is None:
+                    return None
+                chosen[option.capitalize()] = str(count)
+                _, text = _take(text, f"{word} {option}")
+
+        if item_id is None:
+            # "medium coffee" alone still needs cream/sugar asking about
+            _, text = _take(text, "coffee")
+            if not chosen:
+                return None
+            item_id = DEFAULT_COFFEE_ID
+
+        # Quantity ("two medium double doubles")
+        quantity = 1
+        words = text.split()
+        if words and NUMBER_WORDS.get(words[0], 0) > 1:
+            quantity = NUMBER_WORDS[words.pop(0)]
+
+        # Anything left that isn't filler means we didn't understand the order
+        if any(word not in FILLER for word in words):
+            return None
+        if quantity > self.max_quantity:
+            return None
+
+        item = self.items[item_id]
+        modifiers = self._resolve_options(item, size, chosen)
+        if modifiers is None:
+            return None
+
+        action = {
+            "action": "add_to_cart",
+            "item_id": item_id,
+            "name": item["name"],
+            "modifiers": [label for _, label in modifiers],
+            "price": self.price(item, modifiers),
+        }
+        description = " ".join([size or "", item["name"]]).strip()
+        extras = [label for option, label in modifiers if option != "Size"]
+        if extras:
+            description += f" ({', '.join(extras)})"
+        if quantity > 1:
+            description = f"{quantity} x {description}"
+        return {
+            "text": f"Got it! {description}. Anything else?",
+            "actions": [dict(action) for _ in range(quantity)],
+        }
+
+    def _resolve_options(
+        self, item: Dict[str, Any], size: Optional[str], chosen: Dict[str, str]
+    ) -> Optional[List[Tuple[str, str]]]:
+        """Validate choices against the item's options.
+
+        Returns (option name, modifier label) pairs, or None if a required size
+        is missing or a choice isn't offered for this item.
+        """
+        options = {option["name"]: option["choices"] for option in item.get("options", [])}
+        modifiers: List[Tuple[str, str]] = []
+
+        if "Size" in options:
+            # The model asks for the size before adding; so do we
+            if size not in options["Size"]:
+                return None
+            modifiers.append(("Size", size))
+        elif size is not None:
+            return None
+
+        for option, choice in chosen.items():
+            if choice not in options.get(option, []):
+                return None
+            if choice != "0":
+                modifiers.append((option, f"{choice} {option}"))
+
+        # Options without a "nothing" default (flavour, meat, ...) need asking
+        for option, choices in options.items():
+            if option in chosen or option == "Size":
+                continue
+            if not DEFAULT_CHOICES.intersection(choices):
+                return None
+        return modifiers
+
+    def price(self, item: Dict[str, Any], modifiers: List[Tuple[str, str]]) -> float:
+        price = item["basePrice"]
+        for option, label in modifiers:
+            price += self.pricing.get(label, 0.0) if option == "Size" else self.pricing.get(option, 0.0)
+        return round(price, 2)
+
@@ -0,0 +1,172 @@
+import time
+import asyncio
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+# Rewriting a short unchanged gap is cheaper than a cursor-move command
+MERGE_GAP = 1
+MIN_FLUSH_INTERVAL_SECONDS = 0.05
+# The clear command takes ~1.5 ms, about as long as 16 character writes
+CLEAR_COST = 16
+
+
+class FakeLCD:
+    """In-memory character LCD with the RPLCD interface, counting bus traffic.
+
+    Every character, cursor move and clear is one byte on the I2C bus, so
+    bus_bytes measures what a renderer costs on the real PCF8574 backpack.
+    """
+
+    def __init__(self, cols: int = 20, rows: int = 4):
+        self.cols = cols
+        self.rows = rows
+        self.grid = [[" "] * cols for _ in range(rows)]
+        self._cursor = (0, 0)
+        self.chars_written = 0
+        self.cursor_moves = 0
+        self.clears = 0
+
+    @property
+    def bus_bytes(self) -> int:
+        return self.chars_written + self.cursor_moves + self.clears
+
+    @property
+    def cursor_pos(self) -> Tuple[int, int]:
+        return self._cursor
+
+    @cursor_pos.setter
+    def cursor_pos(self, pos: Tuple[int, int]) -> None:
+        self.cursor_moves += 1
+        self._cursor = pos
+
+    def clear(self) -> None:
+        self.clears += 1
+        self.grid = [[" "] * self.cols for _ in range(self.rows)]
+        self._cursor = (0, 0)
+
+    def write_string(self, text: str) -> None:
+        row, col = self._cursor
+        for ch in text:
+            if col < self.cols:
+                self.grid[row][col] = ch
+            col += 1
+            self.chars_written += 1
+        self._cursor = (row, col)
+
+    def lines(self) -> List[str]:
+        return ["".join(row) for row in self.grid]
+
+
+def changed_runs(shown: str, target: str, merge_gap: int = MERGE_GAP) -> List[Tuple[int, str]]:
+    """(start column, text) runs covering every position where target differs from shown"""
+    runs: List[Tuple[int, str]] = []
+    start: Optional[int] = None
+    end = 0
+    for col, (old, new) in enumerate(zip(shown, target)):
+        if old == new:
+            continue
+        if start is not None and col - end > merge_gap:
+            runs.append((start, target[start:end]))
+            start = None
+        if start is None:
+            start = col
+        end = col + 1
+    if start is not None:
+        runs.append((start, target[start:end]))
+    return runs
+
+
+class LCDRenderer:
+    """Shadow-buffered renderer for a character LCD.
+
+    render() only updates the target frame. flush() compares it with what is
+    on the glass and writes just the changed character runs, skipping cursor
+    moves when the cursor is already in place. The flickering clear command is
+    only used when a whole new screen makes it cheaper than overwriting. Under
+    run(), flushes happen at most every min_interval seconds, so a burst of
+    renders (fast key presses) costs one bus update.
+    """
+
+    def __init__(self, lcd, cols: int = 20, rows: int = 4, min_interval: float = MIN_FLUSH_INTERVAL_SECONDS):
+        self.lcd = lcd
+        self.cols = cols
+        self.rows = rows
+        self.min_interval = min_interval
+        self._blank = " " * cols
+        self._target = [self._blank] * rows
+        self._shown = [self._blank] * rows
+        self._cursor: Optional[Tuple[int, int]] = None
+        # _lock serializes bus writes; _target_lock only guards the target frame,
+        # so render() never waits on the (slow) I2C writes of a flush
+        self._lock = threading.Lock()
+        self._target_lock = threading.Lock()
+        self._dirty: Optional[asyncio.Event] = None
+        self._last_flush = 0.0
+        # Start from a known state
+        lcd.clear()
+
+    def _fit(self, text: str) -> str:
+        return text[:self.cols].ljust(self.cols)
+
+    def render(self, lines: Sequence[str]) -> None:
+        """Set the whole frame; rows not given are blank"""
+        padded = list(lines[:self.rows]) + [""] * (self.rows - len(lines))
+        frame = [self._fit(line) for line in padded]
+        with self._target_lock:
+            self._target = frame
+        if self._dirty is not None:
+            self._dirty.set()
+
+    def _plan(self, shown: List[str], target: List[str]) -> List[Tuple[int, int, str]]:
+        return [(row, col, text) for row in range(self.rows) for col, text in changed_runs(shown[row], target[row])]
+
+    @staticmethod
+    def _cost(plan: List[Tuple[int, int, str]]) -> int:
+        # One byte per character plus (at most) one cursor move per run
+        return sum(len(text) + 1 for _, _, text in plan)
+
+    def flush(self) -> int:
+        """Write pending changes to the LCD. Returns the number of characters written."""
+        with self._lock:
+            # Plan against one snapshot: a render() arriving mid-flush is left for the next flush
+            with self._target_lock:
+                target = list(self._target)
+            plan = self._plan(self._shown, target)
+            # A whole new screen: clearing first can beat overwriting old text with spaces
+            blank = [self._blank] * self.rows
+            from_blank = self._plan(blank, target)
+            if CLEAR_COST + self._cost(from_blank) < self._cost(plan):
+                self.lcd.clear()
+                self._cursor = (0, 0)
+                plan = from_blank
+
+            written = 0
+            for row, col, text in plan:
+                if self._cursor != (row, col):
+                    self.lcd.cursor_pos = (row, col)
+                self.lcd.write_string(text)
+                self._cursor = (row, col + len(text))
+                written += len(text)
+            self._shown = target
+            self._last_flush = time.monotonic()
+            return written
+
+    def clear(self) -> None:
+        """Blank the display with the LCD's clear command and reset the buffers"""
+        with self._lock:
+            self.lcd.clear()
+            with self._target_lock:
+                self._target = [self._blank] * self.rows
+            self._shown = [self._blank] * self.rows
+            self._cursor = (0, 0)
+
+    async def run(self) -> None:
+        """Flush after each render, at most once per min_interval (I2C writes run in a thread)"""
+        self._dirty = asyncio.Event()
+        while True:
+            await self._dirty.wait()
+            wait = self._last_flush + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty.clear()
+            await asyncio.to_thread(self.flush)
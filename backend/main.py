@@ -1,15 +1,55 @@
 import os
 import json
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import time
+import uuid
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import Callable, Optional
 from dotenv import load_dotenv
+from connection_manager import DEFAULT_LANE, ClientConnection, ConnectionManager, lane_topic, valid_lane
+from turn_coalescer import TurnCoalescer
+from menu_store import accepts_gzip, get_menu_store
+from state_store import get_state_store
+from audio_ingest import AUDIO_SAMPLE_RATE, AUDIO_SAMPLE_RATES, AudioSession, build_transcriber, parse_sample_rate
+from order_journal import get_order_journal
+import metrics
+from metrics import log
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the AI service (imports, clients, prompt) before the first customer, not during their turn
+    from ai_service import AI_WARM_UP, get_ai_service
+    with metrics.span("startup", "none"):
+        ai = get_ai_service()
+    # Connections are opened in the background; /ready reports when they are
+    warmer = asyncio.create_task(ai.keep_warm()) if AI_WARM_UP and ai.router else None
+    # Pick up menu.json edits without a restart
+    watcher = asyncio.create_task(get_menu_store().watch())
+    # Topic messages published on other workers (no-op with the memory store)
+    relay = asyncio.create_task(get_state_store().listen(
+        lambda topic, message: manager.publish(topic, message, relay=False)))
+    # Write-behind journal of turns and orders
+    journal = get_order_journal()
+    journal_writer = asyncio.create_task(journal.run()) if journal is not None else None
+    try:
+        yield
+    finally:
+        watcher.cancel()
+        relay.cancel()
+        if warmer is not None:
+            warmer.cancel()
+        if journal_writer is not None:
+            # Its final flush runs on cancel; wait for it so no order is lost
+            journal_writer.cancel()
+            await asyncio.gather(journal_writer, return_exceptions=True)
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -20,11 +60,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load Menu
-menu_path = os.path.join(os.path.dirname(__file__), "menu.json")
-with open(menu_path, "r") as f:
-    MENU_DATA = json.load(f)
-
 # Get mode from environment
 MODE = os.getenv("MODE", "production")
 
@@ -33,158 +68,438 @@ MODE = os.getenv("MODE", "production")
 async def get_config():
     return {
         "mode": MODE,
-        "initial_distance": 50 if MODE == "test" else 200
+        "initial_distance": 50 if MODE == "test" else 200,
+        "menu_version": get_menu_store().current.version
     }
 
+@app.get("/ready")
+async def ready():
+    """200 once startup warm-up is done (for load balancers and deploy scripts), 503 until then"""
+    from ai_service import get_ai_service
+    ai = get_ai_service()
+    body = {"ready": ai.ready, "providers": ai.warm_up_status, "menu_version": ai.menu_version}
+    return Response(json.dumps(body), status_code=200 if ai.ready else 503, media_type="application/json")
+
 @app.get("/inventory")
-async def get_inventory():
-    return MENU_DATA
+async def get_inventory(request: Request):
+    """The current menu, pre-serialized per version: 304 when the ETag matches, gzip when accepted"""
+    menu = get_menu_store().current
+    headers = {"ETag": menu.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if menu.matches(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        return Response(menu.gzip_body, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(menu.body, media_type="application/json", headers=headers)
+
+@app.get("/cache_stats")
+async def cache_stats():
+    """Hit/miss counters for the opt-in AI response cache"""
+    from ai_service import get_ai_service
+    cache = get_ai_service().response_cache
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.get("/analytics/throughput")
+async def analytics_throughput(hours: int = 24):
+    """Turns, orders and revenue per hour, from the order journal"""
+    journal = get_order_journal()
+    if journal is None:
+        return {"enabled": False}
+    return {"hours": await journal.throughput(hours), **journal.stats()}
+
+@app.get("/analytics/top_items")
+async def analytics_top_items(limit: int = 10, hours: int = 24):
+    """Most ordered menu items, from the order journal"""
+    journal = get_order_journal()
+    if journal is None:
+        return {"enabled": False}
+    return {"items": await journal.top_items(limit, hours)}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-stage latency histograms (labelled by stage and lane) and send-queue gauges for Prometheus"""
+    body = metrics.render_prometheus() + "\n".join(manager.render_metrics()) + "\n"
+    return Response(body, media_type="text/plain; version=0.0.4")
 
 @app.post("/reset_conversation")
-async def reset_conversation():
-    """Reset AI conversation for a new customer"""
+async def reset_conversation(session_id: Optional[str] = None):
+    """Reset a lane's AI conversation for a new customer"""
+    if not session_id:
+        return {"status": "error", "message": "session_id is required"}
     try:
         from ai_service import get_ai_service
         ai = get_ai_service()
-        ai.reset_conversation()
-        return {"status": "reset"}
+        await ai.reset_conversation(session_id)
+        return {"status": "reset", "session_id": session_id}
     except Exception as e:
-        print(f"Error resetting conversation: {e}")
+        log("reset_error", logging.ERROR, session_id=session_id, error=str(e))
         return {"status": "error", "message": str(e)}
 
 
-# WebSocket Connection Manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# WebSocket Connection Manager (topics are shared with other workers through the state store)
+manager = ConnectionManager(relay=get_state_store())
+# Speech-to-text for binary audio on /ws/audio
+transcriber = build_transcriber()
+# The first turn a worker handles is timed on its own: it shows what warm-up saved
+first_turn_pending = True
+
+async def reject_lane(websocket: WebSocket, lane: str) -> None:
+    """Refuse a connection whose lane doesn't match LANE_PATTERN (policy violation)"""
+    log("lane_rejected", logging.WARNING, lane=lane)
+    await websocket.close(code=1008)
+
+async def send_actions(client: ClientConnection, ai, cart, actions: list, session_id: str,
+                       batch: Optional[list] = None):
+    """Apply AI actions to the server cart and send the resulting messages (or add them to batch)"""
+    for action_data in actions:
+        for outgoing in ai.cart_engine.apply(cart, action_data):
+            if outgoing["type"] == "finalize_order":
+                log("order_finalized", total=outgoing.get("total"))
+                publish_order(client, outgoing)
+                journal = get_order_journal()
+                if journal is not None:
+                    journal.record_order(session_id, client.lane, outgoing)
+            if batch is not None:
+                batch.append(outgoing)
+            else:
+                await client.send_json(outgoing)
+
+def publish_order(client: ClientConnection, finalized: dict):
+    """Hand a finalized total to the lane's payment hardware (see pi_controller.py)"""
+    if client.lane is None:
+        return
+    message = {**finalized, "type": "order_finalized", "lane": client.lane}
+    manager.publish(lane_topic(client.lane, "order"), json.dumps(message))
+
+async def send_cart_state(client: ClientConnection, cart):
+    """Canonical cart and totals, sent once at the end of every turn"""
+    await client.send_json({"type": "cart_state", **cart.to_dict()})
+
+async def send_turn_result(client: ClientConnection, text: str, actions: list, cart=None, streamed: bool = False):
+    """Protocol 2: the reply, its cart messages in order and the resulting cart in one frame.
+
+    The kiosk applies the whole turn at once, so it never shows a cart with
+    only some of a turn's changes.
+    """
+    frame = {"type": "turn_result", "text": text, "actions": actions}
+    if cart is not None:
+        frame["cart"] = cart.to_dict()
+    if streamed:
+        frame["streamed"] = True
+    await client.send_json(frame)
+
+async def stream_user_speech(client: ClientConnection, ai, user_text: str, cart, session_id: str,
+                             commit: Callable[[], None], batch: Optional[list] = None) -> dict:
+    """Streaming turn: forward each action and sentence as soon as it is ready.
+
+    With a batch, sentences are still sent as they come (so speech starts
+    early) but the cart messages and the full text are left to the caller's
+    turn_result. Returns the full reply text and the actions applied.
+    """
+    result = {"reply": None, "actions": []}
+    # Snapshot: actions change the cart while the reply is still streaming
+    async for event in ai.stream_user_message(user_text, list(cart.lines), session_id):
+        commit()
+        if event["type"] == "action":
+            result["actions"].append(event["action"])
+            await send_actions(client, ai, cart, [event["action"]], session_id, batch)
+        elif event["type"] == "text":
+            await client.send_json({
+                "type": "ai_response_partial",
+                "text": event["text"]
+            })
+        elif event["type"] == "done":
+            result["reply"] = event["text"]
+            log("ai_response", text=event["text"], streamed=True)
+            if batch is not None:
+                continue
+            # Full text for the transcript; already spoken via the partials
+            await client.send_json({
+                "type": "ai_response",
+                "text": event["text"],
+                "streamed": True
+            })
+    return result
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+async def handle_user_speech(client: ClientConnection, message: dict, session_id: str,
+                             commit: Callable[[], None] = lambda: None) -> Optional[dict]:
+    """Run one AI turn for a user_speech message and send the results.
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    commit() is called before anything is sent; until then the turn may be
+    cancelled and merged into a newer one. Returns the reply text and the
+    actions applied, or None when there was nothing to answer.
+    """
+    user_text = message.get('text', '').strip()
+    log("user_speech", session_id=session_id, text=user_text)
+    
+    # Skip empty messages
+    if not user_text:
+        log("empty_speech_skipped", session_id=session_id)
+        return None
+    
+    # Protocol 2 clients get the turn as a single turn_result frame
+    batch = [] if client.protocol >= 2 else None
+    cart = None
+    try:
+        # Get AI service
+        from ai_service import get_ai_service
+        ai = get_ai_service()
+        # The server owns the cart; the client's copy is only a view of it
+        cart = await ai.cart_for(session_id)
+        
+        if message.get('stream'):
+            result = await stream_user_speech(client, ai, user_text, cart, session_id, commit, batch)
+            if batch is not None:
+                await send_turn_result(client, result["reply"] or "", batch, cart, streamed=True)
+            else:
+                await send_cart_state(client, cart)
+            await ai.sessions.save(session_id)
+            return result
+        
+        # Process with Gemini
+        ai_result = await ai.process_user_message(user_text, list(cart.lines), session_id)
+        commit()
+        log("ai_response", text=ai_result["text"], streamed=False)
+        
+        # Send AI response
+        if batch is None:
+            await client.send_json({
+                "type": "ai_response", 
+                "text": ai_result["text"]
+            })
+        
+        # Handle cart actions
+        actions = ai_result.get("actions", [])
+        
+        # If legacy single action exists (fallback), add it
+        if ai_result.get("action"):
+            actions.append(ai_result.get("data"))
+        
+        await send_actions(client, ai, cart, actions, session_id, batch)
+        if batch is not None:
+            await send_turn_result(client, ai_result["text"], batch, cart)
+        else:
+            await send_cart_state(client, cart)
+        await ai.sessions.save(session_id)
+        return {"reply": ai_result["text"], "actions": actions}
+    except Exception as ai_error:
+        log("ai_processing_error", logging.ERROR, exc_info=True, session_id=session_id, error=str(ai_error))
+        commit()
+        # Send error message to client
+        apology = "I'm sorry, I'm having trouble processing that. Could you try again?"
+        if batch is not None:
+            # Whatever the turn already applied to the cart, and the cart it left
+            await send_turn_result(client, apology, batch, cart)
+        else:
+            await client.send_json({
+                "type": "ai_response",
+                "text": apology
+            })
+        return None
+
+async def complete_order(client: ClientConnection, session_id: str):
+    """The kiosk's Complete Order button: finalize the server cart as a spoken "that's all" would"""
+    from ai_service import get_ai_service
+    ai = get_ai_service()
+    session = await ai.sessions.get_latest(session_id)
+    # A streamed turn applies the model's actions while it holds the session
+    # lock (a non-streamed one applies them all at once), so waiting for the
+    # lock means the cart is never finalized and cleared halfway through a turn
+    async with session.lock:
+        cart = session.cart
+        batch = [] if client.protocol >= 2 else None
+        await send_actions(client, ai, cart, [{"action": "finalize_order"}], session_id, batch)
+        if batch is not None:
+            await send_turn_result(client, "", batch, cart)
+        else:
+            await send_cart_state(client, cart)
+    await ai.sessions.save(session_id)
+
+async def transcribe_utterance(client: ClientConnection, turns: TurnCoalescer, pcm: bytes, sample_rate: int,
+                               ended_at: float, stream: bool, in_order: asyncio.Lock):
+    """Turn one endpointed utterance into a user_speech turn"""
+    # Transcripts must reach the turn queue in the order the utterances ended
+    async with in_order:
+        with metrics.span("transcribe", client.lane):
+            text = (await transcriber.transcribe(pcm, sample_rate)).strip()
+    log("transcript", lane=client.lane, text=text, seconds=round(len(pcm) / 2 / sample_rate, 2))
+    if not text:
+        return
+    await client.send_json({"type": "transcript", "text": text})
+    turns.add({"type": "user_speech", "text": text, "stream": stream}, ended_at)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+def turn_runner(client: ClientConnection, session_id: str) -> TurnCoalescer:
+    """Per-connection turn queue: user_speech fragments are debounced and merged,
+    then handled one turn at a time by the coalescer's run() task.
 
-manager = ConnectionManager()
+    Running turns there keeps the receive loop free, so a disconnect is noticed
+    (and the in-flight model call cancelled) while the model is still thinking.
+    """
+    async def run_turn(message: dict, received_at: float) -> None:
+        metrics.current_lane.set(client.lane or "none")
+        result = None
+        with metrics.track_turn() as stages:
+            # From the first fragment arriving to its turn starting (debounce included)
+            metrics.observe("receive", time.perf_counter() - received_at)
+            try:
+                with metrics.span("turn"):
+                    result = await handle_user_speech(client, message, session_id, coalescer.commit)
+            except Exception as e:
+                log("turn_error", logging.ERROR, session_id=session_id, error=str(e))
+        timings = {stage: round(seconds, 4) for stage, seconds in stages.items()}
+        log("turn_timing", session_id=session_id, stages=timings)
+        global first_turn_pending
+        if first_turn_pending and "turn" in stages:
+            first_turn_pending = False
+            metrics.observe("first_turn", stages["turn"])
+            log("first_turn", session_id=session_id, seconds=timings["turn"])
+        journal = get_order_journal()
+        if journal is not None and result is not None:
+            journal.record_turn(session_id, client.lane, message.get("text", "").strip(),
+                                result["reply"], result["actions"], timings)
+
+    coalescer = TurnCoalescer(run_turn)
+    return coalescer
 
 @app.websocket("/ws/audio")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, session_id: Optional[str] = None, lane: Optional[str] = None):
+    # Conversations are keyed by session ID so lanes sharing a backend don't
+    # mix histories. Clients that don't supply one get a per-connection session.
+    if lane is not None and not valid_lane(lane):
+        await reject_lane(websocket, lane)
+        return
+    ephemeral_session = session_id is None
+    if ephemeral_session:
+        session_id = uuid.uuid4().hex
+    # Replies go through the client's send queue, like topic messages
+    client = await manager.connect(websocket)
+    client.lane = lane
+    if lane is not None:
+        # A kiosk that names its lane also gets that lane's sensor frames
+        manager.subscribe(client, lane_topic(lane, "sensor"))
+    if not ephemeral_session:
+        # A kiosk reconnecting mid-order (e.g. after a worker restart) gets its cart back
+        from ai_service import get_ai_service
+        cart = await get_ai_service().cart_for(session_id)
+        if cart.lines:
+            await send_cart_state(client, cart)
+    turns = turn_runner(client, session_id)
+    worker = asyncio.create_task(turns.run())
+    # Binary frames: 16-bit mono PCM, endpointed here (see audio_ingest.py)
+    audio: Optional[AudioSession] = None
+    audio_stream = True
+    transcriptions = set()
+    in_order = asyncio.Lock()
     try:
         while True:
             # Receive messages from frontend
             data = await websocket.receive()
             
             if "text" in data:
+                received_at = time.perf_counter()
                 # Parse the message
                 try:
                     message = json.loads(data['text'])
                     
-                    if message.get('type') == 'user_speech':
-                        # User has finished speaking - process with AI
-                        user_text = message.get('text', '').strip()
-                        current_cart = message.get('cart', [])
-                        print(f"User said: '{user_text}'")
-                        
-                        # Skip empty messages
-                        if not user_text:
-                            print("Empty message, skipping AI processing")
-                            continue
-                        
-                        try:
-                            # Get AI service
-                            from ai_service import get_ai_service
-                            ai = get_ai_service()
-                            
-                            # Process with Gemini
-                            print(f"Processing with AI...")
-                            ai_result = await ai.process_user_message(user_text, current_cart)
-                            print(f"AI Response: {ai_result['text']}")
-                            
-                            # Send AI response
-                            await websocket.send_json({
-                                "type": "ai_response", 
-                                "text": ai_result["text"]
-                            })
-                            
-                            # Handle cart actions
-                            actions = ai_result.get("actions", [])
-                            
-                            # If legacy single action exists (fallback), add it
-                            if ai_result.get("action"):
-                                actions.append(ai_result.get("data"))
-                            
-                            for action_data in actions:
-                                action_type = action_data.get("action")
-                                
-                                if action_type == "add_to_cart":
-                                    await websocket.send_json({
-                                        "type": "cart_update",
-                                        "item": {
-                                            "id": action_data.get("item_id"),
-                                            "name": action_data.get("name"),
-                                            "basePrice": action_data.get("price", 0.0),
-                                            "modifiers": action_data.get("modifiers", []),
-                                            "finalPrice": action_data.get("price", 0.0)
-                                        }
-                                    })
-                                elif action_type == "clear_cart":
-                                    await websocket.send_json({"type": "clear_cart"})
-                                elif action_type == "remove_item":
-                                    await websocket.send_json({
-                                        "type": "remove_item",
-                                        "item_id": action_data.get("item_id")
-                                    })
-                                elif action_type == "finalize_order":
-                                    print("Sending finalize_order to frontend")
-                                    await websocket.send_json({
-                                        "type": "finalize_order"
-                                    })
-                        except Exception as ai_error:
-                            print(f"AI Processing Error: {ai_error}")
-                            import traceback
-                            traceback.print_exc()
-                            # Send error message to client
-                            await websocket.send_json({
-                                "type": "ai_response",
-                                "text": "I'm sorry, I'm having trouble processing that. Could you try again?"
+                    if message.get('type') == 'hello':
+                        # Optional, first: {"type": "hello", "protocol": 2, "encodings": ["msgpack", "json"]}
+                        reply = client.negotiate(message)
+                        # Always answered in JSON text; binary frames after it use the agreed encoding
+                        client.send(json.dumps(reply))
+                        log("protocol_negotiated", lane=lane, protocol=client.protocol, encoding=client.encoding)
+                    elif message.get('type') == 'user_speech':
+                        # User has finished speaking - queue for AI processing
+                        turns.add(message, received_at)
+                    elif message.get('type') == 'complete_order':
+                        await complete_order(client, session_id)
+                    elif message.get('type') == 'audio_start':
+                        # Optional: announce the PCM sample rate and reply mode before streaming audio
+                        requested = message.get("sample_rate")
+                        sample_rate = parse_sample_rate(AUDIO_SAMPLE_RATE if requested is None else requested)
+                        if sample_rate is None:
+                            await client.send_json({
+                                "type": "audio_error",
+                                "message": f"sample_rate must be one of {sorted(AUDIO_SAMPLE_RATES)}"
                             })
+                        else:
+                            audio = AudioSession(sample_rate)
+                            audio_stream = bool(message.get("stream", True))
                         
                 except json.JSONDecodeError:
-                    print(f"Received non-JSON text: {data['text']}")
+                    log("non_json_text", logging.WARNING, text=data["text"])
+            elif data.get("bytes") is not None:
+                if audio is None:
+                    audio = AudioSession()
+                for event, pcm in audio.feed(data["bytes"]):
+                    await client.send_json({"type": event})
+                    if event == "speech_end":
+                        task = asyncio.create_task(transcribe_utterance(
+                            client, turns, pcm, audio.sample_rate, time.perf_counter(), audio_stream, in_order))
+                        transcriptions.add(task)
+                        task.add_done_callback(transcriptions.discard)
+            elif data.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        print("Client disconnected")
+        log("client_disconnected", lane=lane, session_id=session_id)
     except RuntimeError:
         # Handle "Cannot call 'receive' once a disconnect message has been received"
         manager.disconnect(websocket)
-        print("Client disconnected (RuntimeError)")
+        log("client_disconnected", lane=lane, session_id=session_id, reason="RuntimeError")
     except Exception as e:
-        print(f"WebSocket Error: {e}")
+        log("websocket_error", logging.ERROR, lane=lane, error=str(e))
         manager.disconnect(websocket)
+    finally:
+        # Abandon any in-flight model call for this client
+        worker.cancel()
+        for task in transcriptions:
+            task.cancel()
+        if ephemeral_session:
+            from ai_service import get_ai_service
+            await get_ai_service().reset_conversation(session_id)
 
 @app.websocket("/ws/sensor")
-async def sensor_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def sensor_endpoint(websocket: WebSocket, lane: str = DEFAULT_LANE, role: str = "publisher"):
+    """Sensor traffic for one lane.
+
+    The lane's sensor script connects as a publisher and each reading it sends
+    is relayed to that lane's subscribers (displays) only. Subscribers connect
+    with role=subscriber; anything they send is ignored.
+    """
+    if not valid_lane(lane):
+        await reject_lane(websocket, lane)
+        return
+    client = await manager.connect(websocket)
+    topic = lane_topic(lane, "sensor")
+    if role == "subscriber":
+        manager.subscribe(client, topic)
     try:
         while True:
             data = await websocket.receive_text()
-            # Broadcast sensor data to all clients (or specific ones)
-            # In a real scenario, the sensor script might connect here as a client
-            # or this endpoint might be used by the frontend to listen to sensor events
-            # pushed by the backend's internal sensor loop.
-            
-            # For this architecture, let's assume the sensor script connects here
-            # and sends data, which we broadcast to the frontend.
-            await manager.broadcast(data)
+            if role == "publisher":
+                manager.publish(topic, data, sender=client)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket)
+
+@app.websocket("/ws/orders")
+async def orders_endpoint(websocket: WebSocket, lane: str = DEFAULT_LANE):
+    """order_finalized events (with totals) for one lane's payment hardware"""
+    if not valid_lane(lane):
+        await reject_lane(websocket, lane)
+        return
+    client = await manager.connect(websocket)
+    manager.subscribe(client, lane_topic(lane, "order"))
+    try:
+        while True:
+            await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Several workers need STATE_BACKEND=sqlite to share sessions and topics
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -0,0 +1,139 @@
+import os
+import gzip
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+from metrics import log
+
+MENU_PATH = os.path.join(os.path.dirname(__file__), "menu.json")
+# How often the watcher checks menu.json for changes
+MENU_WATCH_INTERVAL_SECONDS = float(os.getenv("MENU_WATCH_INTERVAL_SECONDS", "2"))
+
+
+class MenuError(ValueError):
+    pass
+
+
+def validate_menu(menu_data: Any) -> None:
+    """Raise MenuError unless menu_data has the shape the prompt, fast path and cart rely on"""
+    if not isinstance(menu_data, dict):
+        raise MenuError("menu must be a JSON object")
+    items = menu_data.get("menu_items")
+    if not isinstance(items, list) or not items:
+        raise MenuError("menu_items must be a non-empty list")
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict):
+            raise MenuError("every menu item must be an object")
+        for field in ("id", "name", "basePrice"):
+            if field not in item:
+                raise MenuError(f"menu item {item.get('id', '?')} has no {field}")
+        if item["id"] in seen:
+            raise MenuError(f"duplicate menu item id {item['id']}")
+        seen.add(item["id"])
+        if not isinstance(item["basePrice"], (int, float)):
+            raise MenuError(f"menu item {item['id']} has a non-numeric basePrice")
+        for option in item.get("options", []):
+            if not isinstance(option, dict) or "name" not in option or not isinstance(option.get("choices"), list):
+                raise MenuError(f"menu item {item['id']} has a malformed option")
+    if not isinstance(menu_data.get("modifiers_pricing", {}), dict):
+        raise MenuError("modifiers_pricing must be an object")
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """True if an Accept-Encoding header allows gzip: listed (or covered by *) with q above 0"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0))) > 0
+
+
+class MenuVersion:
+    """One validated menu.json, with its /inventory response bodies built once"""
+
+    def __init__(self, raw: bytes, data: Dict[str, Any]):
+        self.data = data
+        self.version = hashlib.sha256(raw).hexdigest()[:12]
+        self.etag = f'"{self.version}"'
+        self.body = json.dumps(data, separators=(",", ":")).encode()
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+
+    def matches(self, if_none_match: str) -> bool:
+        """True if an If-None-Match header names this version (weak tags and * included)"""
+        return any(tag.strip().removeprefix("W/") in (self.etag, "*") for tag in if_none_match.split(","))
+
+
+class MenuStore:
+    """The one place menu.json is read.
+
+    reload() (run periodically by watch()) re-reads the file when its mtime or
+    size changes, validates it and only then swaps it in as current, so readers
+    always see a whole, valid version. A bad edit is logged and ignored.
+    """
+
+    def __init__(self, path: str = MENU_PATH):
+        self.path = path
+        self._signature: Optional[Tuple[int, int]] = self._stat()
+        self.current: MenuVersion = self._read()
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> MenuVersion:
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise MenuError(f"menu.json is not valid JSON: {e}") from e
+        validate_menu(data)
+        return MenuVersion(raw, data)
+
+    def reload(self) -> bool:
+        """Swap in menu.json if it changed and is valid. Returns True on a new version."""
+        try:
+            signature = self._stat()
+            if signature == self._signature:
+                return False
+            # Recorded even if the new file is rejected, so it is reported once
+            self._signature = signature
+            menu = self._read()
+        except (OSError, MenuError) as e:
+            log("menu_rejected", logging.WARNING, error=str(e), version=self.current.version)
+            return False
+        if menu.version == self.current.version:
+            # Touched but not changed
+            return False
+        self.current = menu
+        log("menu_loaded", version=menu.version, items=len(menu.data["menu_items"]))
+        return True
+
+    async def watch(self, interval: float = MENU_WATCH_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.reload()
+
+
+menu_store = None
+
+
+def get_menu_store() -> MenuStore:
+    global menu_store
+    if menu_store is None:
+        menu_store = MenuStore()
+    return menu_store
@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Lane of the turn being handled; spans pick it up as their lane label
+current_lane: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_lane", default=None)
+# Per-stage totals for the turn being handled, for its log line
+_turn_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("turn_stages", default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, event and the event's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+logger = logging.getLogger("kiosk")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def log(event: str, level: int = logging.INFO, exc_info: bool = False, **fields) -> None:
+    """Write a structured log line, e.g. log("turn_error", lane="2", error=str(e))"""
+    if "lane" not in fields and current_lane.get() is not None:
+        fields["lane"] = current_lane.get()
+    logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label combination"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts, total, count = self._series.get(labels) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._series[labels] = (counts, total + value, count + 1)
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        # Label values escape backslash, double quote and newline (text exposition format)
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def _label_text(self, labels: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{self._escape(value)}"' for name, value in zip(self.label_names, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = self._label_text(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = self._label_text(labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "kiosk_stage_seconds",
+    "Time spent in each stage of the voice pipeline",
+    ("stage", "lane"),
+)
+
+
+def observe(stage: str, seconds: float, lane: Optional[str] = None) -> None:
+    """Record one timing for a stage (lane defaults to the current turn's)"""
+    lane = lane or current_lane.get() or "none"
+    STAGE_SECONDS.observe(seconds, stage, lane)
+    stages = _turn_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str, lane: Optional[str] = None) -> Iterator[None]:
+    """Time the enclosed block as one observation of stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, lane)
+
+
+@contextmanager
+def track_turn() -> Iterator[Dict[str, float]]:
+    """Collect every stage observed during the block into the yielded dict"""
+    stages: Dict[str, float] = {}
+    token = _turn_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _turn_stages.reset(token)
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(STAGE_SECONDS.render()) + "\n"
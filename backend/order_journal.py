@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from metrics import log
+
+# Set to 0 to keep no journal
+ORDER_JOURNAL = os.getenv("ORDER_JOURNAL", "1") == "1"
+ORDER_JOURNAL_PATH = os.getenv("ORDER_JOURNAL_PATH", os.path.join(os.path.dirname(__file__), "orders.db"))
+# Records written per transaction, and the longest a record waits for a batch to fill
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "200"))
+JOURNAL_FLUSH_SECONDS = float(os.getenv("JOURNAL_FLUSH_SECONDS", "0.5"))
+# Records held in memory while the disk is slow; beyond this new ones are dropped
+JOURNAL_MAX_PENDING = int(os.getenv("JOURNAL_MAX_PENDING", "10000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    session_id TEXT NOT NULL,
+    lane TEXT,
+    user_text TEXT NOT NULL,
+    reply TEXT,
+    actions TEXT NOT NULL,
+    stages TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_ts ON turns (ts);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    session_id TEXT NOT NULL,
+    lane TEXT,
+    subtotal REAL NOT NULL,
+    tax REAL NOT NULL,
+    total REAL NOT NULL,
+    item_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_ts ON orders (ts);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id INTEGER NOT NULL REFERENCES orders (id),
+    ts REAL NOT NULL,
+    item_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    price REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS order_items_ts_item ON order_items (ts, item_id);
+"""
+
+Record = Tuple[str, Dict[str, Any]]
+
+
+class OrderJournal:
+    """Append-only record of turns and finalized orders in SQLite (WAL).
+
+    record_turn() and record_order() only append to an in-memory queue; the
+    run() task writes it out in batches, one transaction each, on a worker
+    thread. A lane's turn never waits on the disk. If the disk falls far
+    behind, records beyond max_pending are dropped (and counted) rather than
+    growing memory.
+    """
+
+    def __init__(self, path: str = ORDER_JOURNAL_PATH, batch_size: int = JOURNAL_BATCH_SIZE,
+                 flush_seconds: float = JOURNAL_FLUSH_SECONDS, max_pending: int = JOURNAL_MAX_PENDING):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.written = 0
+        self._pending: Deque[Record] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        db.close()
+        # The writer and the analytics queries each get their own connection
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+    def _append(self, record: Record) -> None:
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(record)
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def record_turn(self, session_id: str, lane: Optional[str], user_text: str, reply: Optional[str],
+                    actions: List[Dict[str, Any]], stages: Dict[str, float]) -> None:
+        self._append(("turn", {
+            "ts": time.time(), "session_id": session_id, "lane": lane, "user_text": user_text,
+            "reply": reply, "actions": json.dumps(actions), "stages": json.dumps(stages),
+        }))
+
+    def record_order(self, session_id: str, lane: Optional[str], finalized: Dict[str, Any]) -> None:
+        """finalized is the finalize_order message: totals plus the order's items"""
+        self._append(("order", {"ts": time.time(), "session_id": session_id, "lane": lane, **finalized}))
+
+    def _write(self, batch: List[Record]) -> None:
+        with self._write_lock, self._writer:
+            for kind, row in batch:
+                if kind == "turn":
+                    self._writer.execute(
+                        "INSERT INTO turns (ts, session_id, lane, user_text, reply, actions, stages) "
+                        "VALUES (:ts, :session_id, :lane, :user_text, :reply, :actions, :stages)", row)
+                    continue
+                items = row.get("items", [])
+                order_id = self._writer.execute(
+                    "INSERT INTO orders (ts, session_id, lane, subtotal, tax, total, item_count) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (row["ts"], row["session_id"], row["lane"], row["subtotal"], row["tax"], row["total"], len(items)),
+                ).lastrowid
+                self._writer.executemany(
+                    "INSERT INTO order_items (order_id, ts, item_id, name, price) VALUES (?, ?, ?, ?, ?)",
+                    [(order_id, row["ts"], item["id"], item["name"], item["finalPrice"]) for item in items],
+                )
+
+    async def flush(self) -> None:
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await asyncio.to_thread(self._write, batch)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                self.dropped += len(batch)
+                log("journal_write_failed", logging.WARNING, records=len(batch), error=str(e))
+
+    async def run(self) -> None:
+        """Write batches until cancelled, then write whatever is left"""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    # A full batch goes out at once; otherwise every flush_seconds
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+        finally:
+            # Shutdown: don't lose the tail (the writes still run off the loop)
+            await asyncio.shield(self.flush())
+
+    def _query(self, sql: str, params: Tuple) -> List[tuple]:
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    async def throughput(self, hours: int = 24) -> List[Dict[str, Any]]:
+        """Turns, orders and revenue per hour over the last `hours` hours"""
+        since = time.time() - hours * 3600
+        orders = await asyncio.to_thread(self._query, (
+            "SELECT CAST(ts / 3600 AS INTEGER) AS hour, COUNT(*), ROUND(SUM(total), 2) "
+            "FROM orders WHERE ts >= ? GROUP BY hour"), (since,))
+        turns = await asyncio.to_thread(self._query, (
+            "SELECT CAST(ts / 3600 AS INTEGER) AS hour, COUNT(*) FROM turns WHERE ts >= ? GROUP BY hour"), (since,))
+        by_hour: Dict[int, Dict[str, Any]] = {}
+        for hour, count in turns:
+            by_hour.setdefault(hour, {"turns": 0, "orders": 0, "revenue": 0.0})["turns"] = count
+        for hour, count, revenue in orders:
+            entry = by_hour.setdefault(hour, {"turns": 0, "orders": 0, "revenue": 0.0})
+            entry["orders"] = count
+            entry["revenue"] = revenue
+        return [
+            {"hour": time.strftime("%Y-%m-%dT%H:00:00Z", time.gmtime(hour * 3600)), **by_hour[hour]}
+            for hour in sorted(by_hour)
+        ]
+
+    async def top_items(self, limit: int = 10, hours: int = 24) -> List[Dict[str, Any]]:
+        """Most ordered items over the last `hours` hours"""
+        rows = await asyncio.to_thread(self._query, (
+            "SELECT item_id, name, COUNT(*) AS quantity, ROUND(SUM(price), 2) FROM order_items "
+            "WHERE ts >= ? GROUP BY item_id ORDER BY quantity DESC LIMIT ?"), (time.time() - hours * 3600, limit))
+        return [{"item_id": item_id, "name": name, "quantity": quantity, "revenue": revenue}
+                for item_id, name, quantity, revenue in rows]
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "written": self.written, "dropped": self.dropped}
+
+
+order_journal = None
+
+
+def get_order_journal() -> Optional[OrderJournal]:
+    """The process's journal, or None when ORDER_JOURNAL=0"""
+    global order_journal
+    if order_journal is None and ORDER_JOURNAL:
+        order_journal = OrderJournal()
+    return order_journal
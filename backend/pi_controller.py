@@ -1,18 +1,24 @@
 
-import RPi.GPIO as GPIO
+import os
+import json
 import time
-from RPLCD.i2c import CharLCD
+import random
+import asyncio
+import websockets
+from sensor import RECONNECT_MAX_SECONDS, RECONNECT_MIN_SECONDS, PresenceFilter
+from lcd_renderer import LCDRenderer
+from hardware import Keypad, SimulatedGPIO, UltrasonicSensor, load_gpio, open_lcd, start_console_keypad
 
 # ===========================
 # GPIO SETUP
 # ===========================
+# RPi.GPIO on the Pi; a simulated backend elsewhere (see hardware.py)
+GPIO = load_gpio()
 GPIO.setmode(GPIO.BCM)
 
 # Ultrasonic pins
 TRIG = 23
 ECHO = 24
-GPIO.setup(TRIG, GPIO.OUT)
-GPIO.setup(ECHO, GPIO.IN)
 
 # LED pins
 LED_RED = 17
@@ -28,41 +34,36 @@ GPIO.setup(LED_GREEN, GPIO.OUT)
 KEYPAD_ROWS = [12, 16, 20, 21]      # R1..R4  -> phys 32,36,38,40
 KEYPAD_COLS = [5, 6, 13, 19]        # C1..C4  -> phys 29,31,33,35
 
-# Rows as outputs, idle HIGH
-for r in KEYPAD_ROWS:
-    GPIO.setup(r, GPIO.OUT)
-    GPIO.output(r, GPIO.HIGH)
+if isinstance(GPIO, SimulatedGPIO):
+    # No hardware: a car pulls up for 10 s every 30 s; keys are typed on stdin
+    GPIO.attach_ultrasonic(TRIG, ECHO, lambda: 2.0 if (int(time.time()) % 30) < 10 else 120.0)
+    GPIO.attach_keypad(KEYPAD_ROWS, KEYPAD_COLS)
+    start_console_keypad(GPIO)
 
-# Cols as inputs with pull‑up (idle HIGH, pressed -> LOW)
-for c in KEYPAD_COLS:
-    GPIO.setup(c, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-KEYPAD_MAP = [
-    ["1", "2", "3", "A"],
-    ["4", "5", "6", "B"],
-    ["7", "8", "9", "C"],
-    ["*", "0", "#", "D"]
-]
+# Edge-triggered: echo edges are timestamped and key presses queued by GPIO
+# callbacks, so nothing here polls a pin in a loop
+ultrasonic = UltrasonicSensor(GPIO, TRIG, ECHO)
+keypad = Keypad(GPIO, KEYPAD_ROWS, KEYPAD_COLS)
 
 # ===========================
 # LCD SETUP (20x4 DISPLAY)
 # ===========================
-lcd = CharLCD('PCF8574', 0x27, cols=20, rows=4)
+lcd = open_lcd(cols=20, rows=4)
+# Shadow buffer: only changed characters go over the I2C bus
+lcd_renderer = LCDRenderer(lcd, cols=20, rows=4)
 
 # ===========================
 # FUNCTIONS
 # ===========================
 def lcd_clear():
-    lcd.clear()
+    lcd_renderer.clear()
 
 def lcd_write(lines):
     """
     lines = ["line1", "line2", ...]
     """
-    lcd_clear()
-    for i, text in enumerate(lines):
-        lcd.cursor_pos = (i, 0)
-        lcd.write_string(text[:20])  # max 20 chars
+    lcd_renderer.render(lines)
+    lcd_renderer.flush()
 
 
 def leds_only(red=False, yellow=False, green=False):
@@ -71,173 +72,197 @@ def leds_only(red=False, yellow=False, green=False):
     GPIO.output(LED_GREEN, GPIO.HIGH if green else GPIO.LOW)
 
 
-def get_key():
-    """Scan keypad and return key character, else None."""
-    for r in range(4):
-        # Drive this row LOW, others HIGH
-        for rr in range(4):
-            GPIO.output(KEYPAD_ROWS[rr], GPIO.HIGH)
-        GPIO.output(KEYPAD_ROWS[r], GPIO.LOW)
-
-        for c in range(4):
-            # Active‑low: pressed key pulls column LOW
-            if GPIO.input(KEYPAD_COLS[c]) == GPIO.LOW:
-                # simple debounce
-                time.sleep(0.02)
-                if GPIO.input(KEYPAD_COLS[c]) == GPIO.LOW:
-                    # wait for release
-                    while GPIO.input(KEYPAD_COLS[c]) == GPIO.LOW:
-                        time.sleep(0.01)
-                    # restore this row
-                    GPIO.output(KEYPAD_ROWS[r], GPIO.HIGH)
-                    return KEYPAD_MAP[r][c]
-
-        # restore this row
-        GPIO.output(KEYPAD_ROWS[r], GPIO.HIGH)
-
-    return None
-
-
 def get_distance():
-    GPIO.output(TRIG, False)
-    time.sleep(0.00005)
-
-    # Trigger pulse
-    GPIO.output(TRIG, True)
-    time.sleep(0.00001)
-    GPIO.output(TRIG, False)
-
-    start_time = time.time()
-    timeout = start_time + 0.03
-
-    # Wait for echo HIGH
-    while GPIO.input(ECHO) == 0:
-        pulse_start = time.time()
-        if pulse_start > timeout:
-            return None
-
-    # Wait for echo LOW
-    timeout = time.time() + 0.03
-    while GPIO.input(ECHO) == 1:
-        pulse_end = time.time()
-        if pulse_end > timeout:
-            return None
-
-    pulse_duration = pulse_end - pulse_start
-    distance = (pulse_duration * 34300) / 2
-    return round(distance, 2)
+    return ultrasonic.measure()
 
 
 # ===========================
-# MAIN LOOP
+# HARDWARE SERVICE
 # ===========================
-try:
-    print("System Started.")
-    leds_only(red=True)
-    ai_enable_flag = 0
-
+LANE = os.getenv("LANE", "1")
+BACKEND_WS_URL = os.getenv("BACKEND_WS_URL", "ws://localhost:8000")
+STORE_NAME = os.getenv("STORE_NAME", "Tim Hortons")
+PAYMENT_PIN = os.getenv("PAYMENT_PIN", "1234")
+
+# Car at the window: closer than CAR_PRESENT_CM, gone once past CAR_LEFT_CM
+CAR_PRESENT_CM = 5
+CAR_LEFT_CM = 15
+MEASURE_INTERVAL_SECONDS = 0.2
+HEARTBEAT_SECONDS = 5.0
+# Give up on a payment screen nobody answers
+PAYMENT_TIMEOUT_SECONDS = 120
+
+
+async def keep_connected(url, handle):
+    """Run handle(websocket) for as long as the backend is up; reconnect with backoff"""
+    delay = RECONNECT_MIN_SECONDS
     while True:
-        dist = get_distance()
-
-        # LED logic
-        if dist is None:
-            leds_only(red=True)
-            ai_enable_flag = 0
-
-        elif dist < 5:
-            leds_only(green=True)
-            ai_enable_flag = 1  # Car present → AI mode ON
-
-        elif 5 <= dist <= 15:
-            leds_only(yellow=True)
-
-        else:
-            leds_only(red=True)
-            ai_enable_flag = 0  # Car moved away
+        started = time.monotonic()
+        try:
+            async with websockets.connect(url) as websocket:
+                print(f"Connected to {url}")
+                await handle(websocket)
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            print(f"Connection to {url} lost: {e}")
+        if time.monotonic() - started > RECONNECT_MAX_SECONDS:
+            delay = RECONNECT_MIN_SECONDS
+        await asyncio.sleep(random.uniform(delay / 2, delay))
+        delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+
+class HardwareService:
+    """One lane's window hardware as concurrent asyncio tasks.
+
+    - watch_presence: measures distance, drives the LEDs, queues presence events
+    - publish_presence: sends them to /ws/sensor as the lane's publisher
+    - receive_orders: listens on /ws/orders for the lane's finalized totals
+    - take_payments: shows each total on the LCD and takes the PIN
+
+    Blocking hardware calls (echo timing, I2C writes) run in worker threads and
+    key presses arrive from the GPIO callback thread, so no task stalls another.
+    """
 
-        # ================================
-        # AI MODE WORKFLOW STARTS HERE
-        # ================================
-        if ai_enable_flag == 1:
+    def __init__(self, lane: str = LANE):
+        self.lane = lane
+        self.presence = PresenceFilter(enter_cm=CAR_PRESENT_CM, leave_cm=CAR_LEFT_CM, window=3, alpha=0.5)
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.orders: asyncio.Queue = asyncio.Queue()
+        self.keys: asyncio.Queue = asyncio.Queue()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        keypad.listener = lambda key: loop.call_soon_threadsafe(self.keys.put_nowait, key)
+        await asyncio.gather(
+            self.watch_presence(),
+            keep_connected(f"{BACKEND_WS_URL}/ws/sensor?lane={self.lane}&role=publisher", self.publish_presence),
+            keep_connected(f"{BACKEND_WS_URL}/ws/orders?lane={self.lane}", self.receive_orders),
+            self.take_payments(),
+            lcd_renderer.run(),
+        )
+
+    def _state(self, event_type):
+        distance = self.presence.smoothed
+        return {
+            "type": event_type,
+            "present": self.presence.present,
+            "distance": None if distance is None else round(distance, 1),
+        }
+
+    async def watch_presence(self):
+        last_heartbeat = time.monotonic()
+        while True:
+            dist = await asyncio.to_thread(get_distance)
+            event = self.presence.update(dist) if dist is not None else None
+
+            # LED logic
+            if dist is None:
+                leds_only(red=True)
+            elif self.presence.present:
+                leds_only(green=True)  # Car present
+            elif self.presence.smoothed <= CAR_LEFT_CM:
+                leds_only(yellow=True)
+            else:
+                leds_only(red=True)
+
+            now = time.monotonic()
+            if event:
+                print(f"{event} at {self.presence.smoothed:.1f} cm")
+                self.events.put_nowait(self._state(event))
+                last_heartbeat = now
+            elif now - last_heartbeat >= HEARTBEAT_SECONDS:
+                self.events.put_nowait(self._state("heartbeat"))
+                last_heartbeat = now
+            await asyncio.sleep(MEASURE_INTERVAL_SECONDS)
+
+    async def publish_presence(self, websocket):
+        # A (re)connected backend learns the current state right away
+        await websocket.send(json.dumps(self._state("heartbeat")))
+        while True:
+            event = await self.events.get()
+            await websocket.send(json.dumps(event))
+
+    async def receive_orders(self, websocket):
+        async for raw in websocket:
+            data = json.loads(raw)
+            if data.get("type") == "order_finalized":
+                print(f"Order finalized: ${data['total']:.2f}")
+                self.orders.put_nowait(data)
+
+    async def show(self, lines):
+        # Flushed by lcd_renderer.run(), rate-limited
+        lcd_renderer.render(lines)
+
+    async def next_key(self, timeout=PAYMENT_TIMEOUT_SECONDS):
+        try:
+            return await asyncio.wait_for(self.keys.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
 
-            print("Car detected. Waiting 5 seconds...")
-            time.sleep(5)
+    async def take_payments(self):
+        while True:
+            order = await self.orders.get()
+            # Keys pressed before the total was shown don't count
+            while not self.keys.empty():
+                self.keys.get_nowait()
 
             # Display welcome screen
-            lcd_write([
-                "Hi, User",
-                "Welcome to McDonalds",
-                "Total Amount: $25.65",
-                "Proceed to pay"
+            await self.show([
+                "Welcome to",
+                STORE_NAME,
+                f"Total Amount: ${order['total']:.2f}",
+                "Press D to pay"
             ])
 
             # Wait for user to press D
-            print("Waiting for user to press D...")
-            while True:
-                key = get_key()
-                if key == "D":
-                    break
-                time.sleep(0.02)
+            key = await self.next_key()
+            while key is not None and key != "D":
+                key = await self.next_key()
+            if key is None:
+                await self.show([])
+                continue
 
             # Ask for PIN
-            lcd_write([
-                "Enter PIN",
-                "",
-                "",
-                ""
-            ])
-
+            await self.show(["Enter PIN", "", "", ""])
             entered_pin = ""
 
             # Enter digits + press A to confirm
             while True:
-                key = get_key()
-                if key is None:
-                    continue
-
-                if key.isdigit():
-                    if len(entered_pin) < 4:
-                        entered_pin += key
-                        lcd_write([
-                            "Enter PIN",
-                            "*" * len(entered_pin),
-                            "",
-                            ""
-                        ])
-
-                if key == "A":  # Confirm
+                key = await self.next_key()
+                if key is None or key == "A":  # Timed out / confirm
                     break
+                if key.isdigit() and len(entered_pin) < 4:
+                    entered_pin += key
+                    await self.show(["Enter PIN", "*" * len(entered_pin), "", ""])
 
             # Validate PIN
-            if entered_pin == "1234":
-                lcd_write([
+            if key == "A" and entered_pin == PAYMENT_PIN:
+                await self.show([
                     "Payment Received",
                     "Thank You",
                     "Move to next window",
                     ""
                 ])
             else:
-                lcd_write([
+                await self.show([
                     "Invalid PIN!",
                     "Transaction canceled",
                     "",
                     ""
                 ])
 
-            time.sleep(5)
-            lcd_clear()
-
-            # Reset to main loop
-            ai_enable_flag = 0
-            leds_only(red=True)
-
-        time.sleep(0.2)
-
-except KeyboardInterrupt:
-    print("\nStopping system...")
-
-finally:
-    lcd_clear()
-    leds_only(False, False, False)
-    GPIO.cleanup()
-    print("GPIO cleaned up. System stopped.")
\ No newline at end of file
+            await asyncio.sleep(5)
+            await self.show([])
+
+
+if __name__ == "__main__":
+    try:
+        print(f"System Started (lane {LANE}).")
+        leds_only(red=True)
+        asyncio.run(HardwareService().run())
+    except KeyboardInterrupt:
+        print("\nStopping system...")
+    finally:
+        lcd_clear()
+        leds_only(False, False, False)
+        GPIO.cleanup()
+        print("GPIO cleaned up. System stopped.")
@@ -0,0 +1,420 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Union
+from metrics import log
+
+# Comma-separated provider order; the first available one is the primary
+AI_PROVIDERS = os.getenv("AI_PROVIDERS", "gemini,deepseek")
+# Start a hedged request on the next provider once the primary takes this long
+AI_HEDGE_AFTER_SECONDS = float(os.getenv("AI_HEDGE_AFTER_SECONDS", "2.5"))
+# Consecutive failures (errors or lost hedges) before a provider is skipped
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "3"))
+# How long a tripped provider is skipped before a single trial request is allowed
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+# Idle pooled connections to a provider are kept open this long
+AI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("AI_KEEPALIVE_EXPIRY_SECONDS", "300"))
+
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+DEEPSEEK_MODEL = "deepseek-chat"
+DEEPSEEK_URL = "https://api.deepseek.com/chat/completions"
+DEEPSEEK_MODELS_URL = "https://api.deepseek.com/models"
+
+# Conversation contents use the Gemini format: {"role": "user" | "model", "parts": [text]}
+Contents = List[Dict[str, Any]]
+
+
+class ProviderUnavailable(Exception):
+    """No provider is configured, or every configured provider is tripped"""
+
+
+class Provider:
+    """A model backend. Providers are stateless: each call gets the full history."""
+
+    name = "provider"
+
+    async def generate(self, system_prompt: str, contents: Contents) -> str:
+        raise NotImplementedError
+
+    async def stream(self, system_prompt: str, contents: Contents) -> AsyncIterator[str]:
+        # Providers without native streaming yield the whole reply at once
+        yield await self.generate(system_prompt, contents)
+
+    async def warm_up(self, system_prompt: str) -> None:
+        """Open the connection (and anything built per prompt) with a free request"""
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model_name = model_name
+        self._model = None
+        self._prompt = None
+
+    def _model_for(self, system_prompt: str):
+        # The model carries the system instruction, so rebuild it only when the prompt changes
+        if system_prompt != self._prompt:
+            self._model = self._genai.GenerativeModel(self.model_name, system_instruction=system_prompt)
+            self._prompt = system_prompt
+        return self._model
+
+    async def generate(self, system_prompt: str, contents: Contents) -> str:
+        response = await self._model_for(system_prompt).generate_content_async(contents)
+        return response.text
+
+    async def stream(self, system_prompt: str, contents: Contents) -> AsyncIterator[str]:
+        response = await self._model_for(system_prompt).generate_content_async(contents, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async def warm_up(self, system_prompt: str) -> None:
+        # Token counting is free, and goes over the same channel as generation
+        await self._model_for(system_prompt).count_tokens_async("hello")
+
+
+class DeepSeekProvider(Provider):
+    """DeepSeek's OpenAI-compatible chat completions API"""
+
+    name = "deepseek"
+
+    def __init__(self, api_key: str, model_name: str = DEEPSEEK_MODEL, url: str = DEEPSEEK_URL,
+                 models_url: str = DEEPSEEK_MODELS_URL):
+        import httpx
+        self.model_name = model_name
+        self.url = url
+        self.models_url = models_url
+        self._client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=None,
+            limits=httpx.Limits(keepalive_expiry=AI_KEEPALIVE_EXPIRY_SECONDS),
+        )
+
+    def _payload(self, system_prompt: str, contents: Contents, stream: bool) -> Dict[str, Any]:
+        messages = [{"role": "system", "content": system_prompt}]
+        for entry in contents:
+            role = "assistant" if entry["role"] == "model" else "user"
+            messages.append({"role": role, "content": "".join(entry["parts"])})
+        return {"model": self.model_name, "messages": messages, "stream": stream}
+
+    async def generate(self, system_prompt: str, contents: Contents) -> str:
+        response = await self._client.post(self.url, json=self._payload(system_prompt, contents, False))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, system_prompt: str, contents: Contents) -> AsyncIterator[str]:
+        payload = self._payload(system_prompt, contents, True)
+        async with self._client.stream("POST", self.url, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                delta = json.loads(line[len("data: "):])["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+
+    async def warm_up(self, system_prompt: str) -> None:
+        # Listing models costs nothing and leaves a pooled TLS connection behind
+        response = await self._client.get(self.models_url)
+        response.raise_for_status()
+
+
+class FakeProvider(Provider):
+    """Deterministic local provider for tests and offline runs.
+
+    reply and latency may be fixed values or callables taking the contents, so
+    tests can script answers and simulate slow or failing providers.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        reply: Union[str, Callable[[Contents], str]] = "Got it! Anything else?",
+        latency: Union[float, Callable[[Contents], float]] = 0.0,
+        error: Optional[Exception] = None,
+        chunk_size: int = 16,
+        name: str = "fake",
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.error = error
+        self.chunk_size = chunk_size
+        self.name = name
+        self.calls = 0
+
+    def _reply_for(self, contents: Contents) -> str:
+        return self.reply(contents) if callable(self.reply) else self.reply
+
+    async def _wait(self, contents: Contents) -> None:
+        self.calls += 1
+        delay = self.latency(contents) if callable(self.latency) else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error is not None:
+            raise self.error
+
+    async def generate(self, system_prompt: str, contents: Contents) -> str:
+        await self._wait(contents)
+        return self._reply_for(contents)
+
+    async def stream(self, system_prompt: str, contents: Contents) -> AsyncIterator[str]:
+        await self._wait(contents)
+        reply = self._reply_for(contents)
+        for start in range(0, len(reply), self.chunk_size):
+            yield reply[start:start + self.chunk_size]
+            await asyncio.sleep(0)
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures; one half-open trial after a cool-down"""
+
+    def __init__(self, failure_threshold: int = AI_BREAKER_FAILURES, reset_timeout: float = AI_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # A half-open trial request is out and its outcome isn't known yet
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """True if a request may go out now. When half-open, only the first caller
+        gets through (it takes the trial) until the trial's outcome is recorded."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self.trial_running:
+            return False
+        self.trial_running = True
+        return True
+
+    def release(self) -> None:
+        """The trial request was cancelled without an outcome; let the next one through"""
+        self.trial_running = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        # A failed half-open trial re-opens immediately
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                log("circuit_breaker_opened", logging.WARNING, failures=self.failures)
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+
+class ProviderRouter:
+    """Hedged requests across providers, each behind a circuit breaker.
+
+    Providers are tried in order, skipping any whose breaker is open. If no
+    answer has come within hedge_after seconds, the next provider is asked
+    too (and another every hedge_after after that); whichever answers first
+    wins and the rest are cancelled. Losing the race counts as a failure only
+    for a provider that had already gone past hedge_after, so a browned-out
+    primary trips its breaker but a healthy backup that was merely beaten
+    keeps its own. A provider that errors is replaced by the next one at
+    once, even while a slow one is still running.
+    """
+
+    def __init__(self, providers: List[Provider], hedge_after: float = AI_HEDGE_AFTER_SECONDS):
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.breakers = {provider.name: CircuitBreaker() for provider in providers}
+
+    def _available(self) -> List[Provider]:
+        available = [provider for provider in self.providers if self.breakers[provider.name].state != "open"]
+        if not available:
+            raise ProviderUnavailable("All AI providers are unavailable")
+        return available
+
+    def _admit(self, candidates: List[Provider], trials: Set[Provider]) -> Optional[Provider]:
+        """Take the next candidate whose breaker lets a request through; trials collects half-open ones"""
+        while candidates:
+            provider = candidates.pop(0)
+            breaker = self.breakers[provider.name]
+            trial = breaker.state == "half_open"
+            if breaker.allow():
+                if trial:
+                    trials.add(provider)
+                return provider
+        return None
+
+    def _record(self, provider: Provider, trials: Set[Provider], ok: bool) -> None:
+        trials.discard(provider)
+        if ok:
+            self.breakers[provider.name].record_success()
+        else:
+            self.breakers[provider.name].record_failure()
+
+    def status(self) -> Dict[str, str]:
+        return {provider.name: self.breakers[provider.name].state for provider in self.providers}
+
+    async def warm_up(self, system_prompt: str, timeout: float) -> Dict[str, str]:
+        """Warm every provider at once; "ok" or the error, per provider.
+
+        A failed warm-up doesn't touch the breakers: the provider may still
+        answer real requests.
+        """
+        async def warm(provider: Provider) -> str:
+            try:
+                await asyncio.wait_for(provider.warm_up(system_prompt), timeout)
+                return "ok"
+            except Exception as e:
+                log("provider_warm_up_failed", logging.WARNING, provider=provider.name, error=str(e) or type(e).__name__)
+                return str(e) or type(e).__name__
+
+        results = await asyncio.gather(*(warm(provider) for provider in self.providers))
+        return {provider.name: result for provider, result in zip(self.providers, results)}
+
+    async def generate(self, system_prompt: str, contents: Contents) -> str:
+        candidates = self._available()
+        running: Dict[asyncio.Task, Provider] = {}
+        # Providers that went past hedge_after without answering
+        slow: Set[Provider] = set()
+        # Half-open providers this request holds the trial for
+        trials: Set[Provider] = set()
+        last_error: Optional[BaseException] = None
+
+        def launch() -> Optional[Provider]:
+            provider = self._admit(candidates, trials)
+            if provider is not None:
+                running[asyncio.create_task(provider.generate(system_prompt, contents))] = provider
+            return provider
+
+        if launch() is None:
+            raise ProviderUnavailable("All AI providers are unavailable")
+        try:
+            while running:
+                timeout = self.hedge_after if candidates else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    slow.update(running.values())
+                    hedge = launch()
+                    if hedge is not None:
+                        log("provider_hedged", slow=[provider.name for provider in running.values() if provider is not hedge],
+                            hedge=hedge.name)
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        log("provider_failed", logging.WARNING, provider=provider.name, error=str(last_error))
+                        self._record(provider, trials, ok=False)
+                        launch()
+                        continue
+                    self._record(provider, trials, ok=True)
+                    for loser in running.values():
+                        if loser in slow:
+                            self._record(loser, trials, ok=False)
+                    return task.result()
+            raise last_error or ProviderUnavailable("No AI provider answered")
+        finally:
+            for task in running:
+                task.cancel()
+            for provider in trials:
+                self.breakers[provider.name].release()
+
+    async def stream(self, system_prompt: str, contents: Contents) -> AsyncIterator[str]:
+        """Hedged streaming: the first provider to produce a chunk wins the turn"""
+        candidates = self._available()
+        queue: asyncio.Queue = asyncio.Queue()
+        running: Dict[Provider, asyncio.Task] = {}
+        winner: Optional[Provider] = None
+        slow: Set[Provider] = set()
+        trials: Set[Provider] = set()
+        last_error: Optional[BaseException] = None
+
+        async def pump(provider: Provider) -> None:
+            try:
+                async for chunk in provider.stream(system_prompt, contents):
+                    await queue.put((provider, chunk, None))
+                await queue.put((provider, None, None))
+            except Exception as e:
+                await queue.put((provider, None, e))
+
+        def launch() -> Optional[Provider]:
+            provider = self._admit(candidates, trials)
+            if provider is not None:
+                running[provider] = asyncio.create_task(pump(provider))
+            return provider
+
+        if launch() is None:
+            raise ProviderUnavailable("All AI providers are unavailable")
+        try:
+            while running:
+                timeout = self.hedge_after if winner is None and candidates else None
+                try:
+                    provider, chunk, error = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    slow.update(running)
+                    hedge = launch()
+                    if hedge is not None:
+                        log("provider_hedged", slow=[provider.name for provider in running if provider is not hedge],
+                            hedge=hedge.name)
+                    continue
+                if winner is not None and provider is not winner:
+                    continue
+
+                if error is not None:
+                    running.pop(provider, None)
+                    last_error = error
+                    log("provider_failed", logging.WARNING, provider=provider.name, error=str(error))
+                    self._record(provider, trials, ok=False)
+                    if winner is not None:
+                        # Already spoke part of this answer; can't switch providers mid-reply
+                        raise error
+                    launch()
+                    continue
+
+                if winner is None:
+                    winner = provider
+                    for loser, task in list(running.items()):
+                        if loser is not winner:
+                            task.cancel()
+                            running.pop(loser)
+                            if loser in slow:
+                                self._record(loser, trials, ok=False)
+                if chunk is None:
+                    self._record(winner, trials, ok=True)
+                    return
+                yield chunk
+            raise last_error or ProviderUnavailable("No AI provider answered")
+        finally:
+            for task in running.values():
+                task.cancel()
+            for provider in trials:
+                self.breakers[provider.name].release()
+
+
+def build_router(gemini_api_key: Optional[str], deepseek_api_key: Optional[str]) -> Optional[ProviderRouter]:
+    """Build the router from AI_PROVIDERS, skipping providers without credentials"""
+    providers: List[Provider] = []
+    for name in (part.strip() for part in AI_PROVIDERS.split(",")):
+        if name == "gemini" and gemini_api_key:
+            providers.append(GeminiProvider(gemini_api_key))
+        elif name == "deepseek" and deepseek_api_key:
+            providers.append(DeepSeekProvider(deepseek_api_key))
+        elif name == "fake":
+            providers.append(FakeProvider())
+    if not providers:
+        return None
+    log("ai_providers", providers=[provider.name for provider in providers])
+    return ProviderRouter(providers)
@@ -0,0 +1,75 @@
+import os
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from cart_context import cart_counts
+from intent_matcher import normalize
+
+# Off by default: a cached answer only sees the model's previous reply, not the whole conversation
+AI_RESPONSE_CACHE = os.getenv("AI_RESPONSE_CACHE", "0") == "1"
+AI_RESPONSE_CACHE_SIZE = int(os.getenv("AI_RESPONSE_CACHE_SIZE", "256"))
+AI_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("AI_RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+
+def cart_fingerprint(cart: list) -> Tuple:
+    """Order-independent, hashable view of the cart's contents"""
+    return tuple(sorted(cart_counts(cart).items()))
+
+
+class ResponseCache:
+    """LRU + TTL cache of model results.
+
+    Keyed on (menu version, normalized utterance, cart fingerprint, hash of the
+    model's previous reply), so a menu change never serves stale answers and
+    "medium please" only replays an answer given to the same question;
+    clear() also drops them eagerly.
+    """
+
+    def __init__(self, max_entries: int = AI_RESPONSE_CACHE_SIZE, ttl: float = AI_RESPONSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(menu_version: str, user_text: str, current_cart: list, last_reply: str = "") -> Hashable:
+        context = hashlib.sha1(last_reply.encode("utf-8")).hexdigest() if last_reply else ""
+        return (menu_version, normalize(user_text), cart_fingerprint(current_cart), context)
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        # Callers are free to mutate what they get back
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: Hashable, result: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
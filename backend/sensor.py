@@ -1,50 +1,120 @@
+import os
 import time
 import json
 import random
 import asyncio
+import statistics
+from collections import deque
+from typing import Optional
 import websockets
 
 # Configuration
 SENSOR_PIN_TRIG = 23
 SENSOR_PIN_ECHO = 24
 WAKE_DISTANCE_CM = 100
-SERVER_URI = "ws://localhost:8000/ws/sensor"
+# Hysteresis: someone counts as gone only once they are further than this
+LEAVE_DISTANCE_CM = 150
+LANE = os.getenv("LANE", "1")
+SERVER_URI = f"ws://localhost:8000/ws/sensor?lane={LANE}&role=publisher"
 
-async def sensor_loop():
+SAMPLE_INTERVAL_SECONDS = 0.2
+HEARTBEAT_SECONDS = 5.0
+MEDIAN_WINDOW = 5
+EMA_ALPHA = 0.3
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+
+class PresenceFilter:
+    """Median-of-N then EMA smoothing, with hysteresis around the wake distance.
+
+    The median drops single bad echoes; the EMA smooths what is left. Presence
+    starts below enter_cm and ends above leave_cm, so a reading wobbling
+    around one threshold can't flap between wake and sleep.
+    """
+
+    def __init__(self, enter_cm: float = WAKE_DISTANCE_CM, leave_cm: float = LEAVE_DISTANCE_CM,
+                 window: int = MEDIAN_WINDOW, alpha: float = EMA_ALPHA):
+        self.enter_cm = enter_cm
+        self.leave_cm = leave_cm
+        self.alpha = alpha
+        self.samples = deque(maxlen=window)
+        self.smoothed: Optional[float] = None
+        self.present = False
+
+    def update(self, distance: float) -> Optional[str]:
+        """Add a raw reading; returns "presence_enter"/"presence_leave" on a change"""
+        self.samples.append(distance)
+        median = statistics.median(self.samples)
+        if self.smoothed is None:
+            self.smoothed = median
+        else:
+            self.smoothed += self.alpha * (median - self.smoothed)
+
+        if not self.present and self.smoothed < self.enter_cm:
+            self.present = True
+            return "presence_enter"
+        if self.present and self.smoothed > self.leave_cm:
+            self.present = False
+            return "presence_leave"
+        return None
+
+
+def read_distance() -> float:
+    # Simulate distance reading
+    # In a real scenario, we would use gpiozero or RPi.GPIO
+    # distance = measure_distance()
+
+    # Let's simulate a user approaching every 30 seconds
+    if (int(time.time()) % 30) < 10:
+        return random.uniform(50, 90) # Awake
+    return random.uniform(140, 200) # Sleep
+
+
+async def sensor_loop(presence: PresenceFilter):
+    """Sample continuously; send only presence changes and a low-rate heartbeat"""
     async with websockets.connect(SERVER_URI) as websocket:
         print(f"Connected to {SERVER_URI}")
-        
+        # Tell a (re)connected server where we stand right away
+        last_sent = 0.0
+
         while True:
-            # Simulate distance reading
-            # In a real scenario, we would use gpiozero or RPi.GPIO
-            # distance = measure_distance()
-            
-            # Mock: Randomly fluctuate around 150cm (Sleep), occasionally drop to 80cm (Wake)
-            # For testing, we can just send a "heartbeat" of distance.
-            # The frontend simulation slider will likely override this, 
-            # but this script demonstrates the "Physical Trigger" logic.
-            
-            # Let's simulate a user approaching every 30 seconds
-            if (int(time.time()) % 30) < 10:
-                distance = random.uniform(50, 90) # Awake
-            else:
-                distance = random.uniform(140, 200) # Sleep
-                
-            payload = {
-                "type": "sensor_reading",
-                "distance": round(distance, 2)
-            }
-            
-            await websocket.send(json.dumps(payload))
-            # print(f"Sent: {payload}")
-            
-            await asyncio.sleep(0.2) # 200ms interval
+            event = presence.update(read_distance())
+            now = time.monotonic()
+            payload = None
+            if event:
+                payload = {"type": event, "distance": round(presence.smoothed, 1)}
+                print(f"Sent: {payload}")
+            elif now - last_sent >= HEARTBEAT_SECONDS:
+                payload = {"type": "heartbeat", "present": presence.present, "distance": round(presence.smoothed, 1)}
+
+            if payload:
+                await websocket.send(json.dumps(payload))
+                last_sent = now
+
+            await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+
+
+async def run_forever():
+    """Keep the sensor connected, backing off (with jitter) while the server is down"""
+    presence = PresenceFilter()
+    delay = RECONNECT_MIN_SECONDS
+    while True:
+        started = time.monotonic()
+        try:
+            await sensor_loop(presence)
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            print(f"Sensor connection lost: {e}")
+        # A connection that stayed up for a while starts the backoff over
+        if time.monotonic() - started > RECONNECT_MAX_SECONDS:
+            delay = RECONNECT_MIN_SECONDS
+        wait = random.uniform(delay / 2, delay)
+        print(f"Reconnecting in {wait:.1f}s")
+        await asyncio.sleep(wait)
+        delay = min(delay * 2, RECONNECT_MAX_SECONDS)
 
 if __name__ == "__main__":
     try:
-        asyncio.run(sensor_loop())
+        asyncio.run(run_forever())
     except KeyboardInterrupt:
         print("Sensor script stopped")
-    except Exception as e:
-        print(f"Error: {e}")
-        # Retry logic could go here
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from cart import Cart
+from cart_context import CartContext
+from metrics import log
+from state_store import StateStore, get_state_store
+
+# Registry limits (see README for tuning)
+AI_MAX_SESSIONS = int(os.getenv("AI_MAX_SESSIONS", "64"))
+AI_SESSION_TTL_SECONDS = float(os.getenv("AI_SESSION_TTL_SECONDS", "900"))
+AI_MAX_HISTORY_MESSAGES = int(os.getenv("AI_MAX_HISTORY_MESSAGES", "20"))
+AI_SESSION_MEMORY_CAP_CHARS = int(os.getenv("AI_SESSION_MEMORY_CAP_CHARS", "4000000"))
+
+
+class ConversationSession:
+    """Conversation state for one customer at one lane.
+
+    History is stored in the Gemini content format
+    ({"role": "user" | "model", "parts": [text]}) so it can be passed straight
+    to generate_content. The system prompt is not part of it; it is sent as
+    the model's system instruction.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history: List[Dict[str, Any]] = []
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.chars = 0
+        self.cart_context = CartContext()
+        self.cart = Cart()
+        # Revision of the saved copy this matches (see state_store.py)
+        self.revision = 0
+        # Serialises turns when several sockets share one session ID
+        self.lock = asyncio.Lock()
+
+    def to_state(self) -> str:
+        return json.dumps({"history": self.history, "cart": self.cart.lines})
+
+    @classmethod
+    def from_state(cls, session_id: str, revision: int, state: str) -> "ConversationSession":
+        """Rebuild a saved session. Its cart context starts over, so the model's
+        next turn gets a full cart summary."""
+        data = json.loads(state)
+        session = cls(session_id)
+        session.history = data["history"]
+        session.chars = sum(len(part) for entry in session.history for part in entry["parts"])
+        session.cart = Cart.from_lines(data["cart"])
+        session.revision = revision
+        return session
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def append(self, role: str, text: str) -> None:
+        self.history.append({"role": role, "parts": [text]})
+        self.chars += len(text)
+
+    def trim(self, max_messages: int) -> None:
+        """Drop the oldest user/model pairs beyond max_messages"""
+        excess = len(self.history) - max_messages
+        if excess <= 0:
+            return
+        # Drop whole pairs so the history keeps alternating user/model
+        excess += excess % 2
+        dropped = self.history[:excess]
+        del self.history[:excess]
+        self.chars -= sum(len(part) for entry in dropped for part in entry["parts"])
+
+
+class SessionRegistry:
+    """LRU registry of conversation sessions with idle-TTL and memory cap.
+
+    Sessions are kept in least-recently-used order, so expiry and eviction
+    only ever look at the front of the dict. Each turn's result is saved to
+    the state store; a session this process doesn't hold, or holds an older
+    revision of (another worker served the lane or reset it since), is loaded
+    from it.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = AI_MAX_SESSIONS,
+        idle_ttl: float = AI_SESSION_TTL_SECONDS,
+        max_history_messages: int = AI_MAX_HISTORY_MESSAGES,
+        memory_cap_chars: int = AI_SESSION_MEMORY_CAP_CHARS,
+        store: Optional[StateStore] = None,
+    ):
+        self.store = store or get_state_store()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history_messages = max_history_messages
+        self.memory_cap_chars = memory_cap_chars
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    @property
+    def total_chars(self) -> int:
+        return sum(session.chars for session in self._sessions.values())
+
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        self.evict_expired()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.touch()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    async def get_or_create(self, session_id: str) -> ConversationSession:
+        """The session held here, else its saved copy, else a new one (the store is read off the event loop)"""
+        session = self.get(session_id)
+        if session is not None:
+            return session
+        saved = await asyncio.to_thread(self.store.load_session, session_id, 0)
+        current = self._sessions.get(session_id)
+        if current is not None:
+            # Another task created it while the store was read
+            return current
+        session = self._from_saved(session_id, *saved) if saved is not None else ConversationSession(session_id)
+        self._sessions[session_id] = session
+        self._enforce_limits()
+        return session
+
+    async def get_latest(self, session_id: str) -> ConversationSession:
+        """Like get_or_create, but first picks up a newer saved copy or a reset (call at the start of a turn).
+
+        The store is read off the event loop.
+        """
+        session = self.get(session_id)
+        if session is not None and session.lock.locked():
+            return session
+        saved = await asyncio.to_thread(self.store.load_session, session_id, session.revision if session else 0)
+        current = self._sessions.get(session_id)
+        if current is not session and current is not None:
+            # Another task created or replaced it while the store was read
+            return current
+        if saved is not None:
+            session = self._from_saved(session_id, *saved)
+        elif session is None:
+            session = ConversationSession(session_id)
+        else:
+            return session
+        self._sessions[session_id] = session
+        self._enforce_limits()
+        return session
+
+    @staticmethod
+    def _from_saved(session_id: str, revision: int, state: Optional[str]) -> ConversationSession:
+        if state is None:
+            # Reset (possibly by another worker): start over, but at the tombstone's
+            # revision so it is not picked up again
+            session = ConversationSession(session_id)
+            session.revision = revision
+            return session
+        return ConversationSession.from_state(session_id, revision, state)
+
+    async def save(self, session_id: str) -> None:
+        """Save a session's history and cart (the write runs off the event loop)"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        session.revision = await asyncio.to_thread(self.store.save_session, session_id, session.to_state())
+
+    async def remove(self, session_id: str) -> bool:
+        """Forget a session and reset its saved copy for every worker. Returns False if it was not known here."""
+        known = self._sessions.pop(session_id, None) is not None
+        await asyncio.to_thread(self.store.delete_session, session_id)
+        return known
+
+    def commit(self, session: ConversationSession) -> None:
+        """Apply history and memory limits after a turn has been recorded"""
+        session.trim(self.max_history_messages)
+        self._enforce_limits()
+
+    def evict_expired(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            log("session_evicted", session_id=session_id, reason="idle")
+            self._sessions.popitem(last=False)
+
+    def _enforce_limits(self) -> None:
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            log("session_evicted", session_id=session_id, reason="lru")
+        total = self.total_chars
+        # Never evict the most recently used session to satisfy the cap
+        while total > self.memory_cap_chars and len(self._sessions) > 1:
+            session_id, session = self._sessions.popitem(last=False)
+            total -= session.chars
+            log("session_evicted", session_id=session_id, reason="memory_cap")
@@ -0,0 +1,191 @@
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+from metrics import log
+
+# "memory" keeps state in this process; "sqlite" shares it between workers and restarts
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(os.path.dirname(__file__), "state.db"))
+# How often a worker exchanges topic messages with the others
+STATE_POLL_SECONDS = float(os.getenv("STATE_POLL_SECONDS", "0.05"))
+# Saved sessions idle this long are deleted (same default as the in-memory TTL)
+STATE_SESSION_TTL_SECONDS = float(os.getenv("AI_SESSION_TTL_SECONDS", "900"))
+# Relayed messages are only needed until every worker has polled them
+EVENT_RETENTION_SECONDS = 60.0
+PRUNE_INTERVAL_SECONDS = 10.0
+
+Deliver = Callable[[str, str], None]
+
+
+class StateStore:
+    """Where sessions are saved and how topic messages reach other workers.
+
+    Sessions are saved as JSON text with a revision number that goes up on
+    every save, so a worker can tell when its in-memory copy is stale. A
+    delete is a save too: it leaves a tombstone (state None) at the next
+    revision, so workers holding the session see that it was reset.
+    """
+
+    name = "base"
+
+    def load_session(self, session_id: str, newer_than: int = 0) -> Optional[Tuple[int, Optional[str]]]:
+        """(revision, state) if the saved session is newer than newer_than, else None.
+
+        state is None when the session was deleted at that revision.
+        """
+        raise NotImplementedError
+
+    def save_session(self, session_id: str, state: str) -> int:
+        """Save a session's state; returns its new revision"""
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str) -> int:
+        """Mark a session deleted; returns the tombstone's revision"""
+        raise NotImplementedError
+
+    def publish(self, topic: str, message: str) -> None:
+        """Relay a topic message to the other workers (never back to this one)"""
+
+    async def listen(self, deliver: Deliver) -> None:
+        """Call deliver(topic, message) for messages published by other workers, until cancelled"""
+        await asyncio.Event().wait()
+
+
+class MemoryStateStore(StateStore):
+    """Single-process default: the session registry's own memory is the only copy.
+
+    Nothing is written anywhere, so a restart starts every lane over and
+    there are no other workers to relay to.
+    """
+
+    name = "memory"
+
+    def load_session(self, session_id: str, newer_than: int = 0) -> Optional[Tuple[int, Optional[str]]]:
+        return None
+
+    def save_session(self, session_id: str, state: str) -> int:
+        return 0
+
+    def delete_session(self, session_id: str) -> int:
+        return 0
+
+
+class SQLiteStateStore(StateStore):
+    """State shared by every worker on the machine through one SQLite file in WAL mode.
+
+    WAL lets readers and the single writer work at the same time, so workers
+    don't block each other. Topic messages go into an events table: publish()
+    only queues them, and listen() writes the queue and reads other workers'
+    messages in one batch every poll interval, off the event loop. Session
+    loads use a connection of their own, so a turn never waits behind that
+    batch's write transaction.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = STATE_DB_PATH, poll_seconds: float = STATE_POLL_SECONDS):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        # Identifies this worker's own events so they are not delivered back to it
+        self.origin = uuid.uuid4().hex
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._lock = threading.Lock()
+        self._reader = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._read_lock = threading.Lock()
+        self._outbox: Deque[Tuple[str, str]] = deque()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, revision INTEGER NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, message TEXT NOT NULL, "
+                "origin TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            # Only messages published from now on are delivered to this worker
+            self._last_event = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self._last_prune = time.time()
+
+    def load_session(self, session_id: str, newer_than: int = 0) -> Optional[Tuple[int, Optional[str]]]:
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT revision, state FROM sessions WHERE session_id = ? AND revision > ?",
+                (session_id, newer_than),
+            ).fetchone()
+        if row is None:
+            return None
+        # An empty state is a tombstone left by delete_session()
+        return row[0], row[1] or None
+
+    def save_session(self, session_id: str, state: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "INSERT INTO sessions (session_id, revision, state, updated_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET revision = revision + 1, state = excluded.state, "
+                "updated_at = excluded.updated_at RETURNING revision",
+                (session_id, state, time.time()),
+            ).fetchone()
+        return row[0]
+
+    def delete_session(self, session_id: str) -> int:
+        # Kept as an empty row (pruned with the other idle sessions) so other workers see the reset
+        return self.save_session(session_id, "")
+
+    def publish(self, topic: str, message: str) -> None:
+        self._outbox.append((topic, message))
+
+    def _exchange(self) -> List[Tuple[str, str]]:
+        """Write queued messages and read the other workers' new ones (runs in a thread)"""
+        now = time.time()
+        outgoing = []
+        while self._outbox:
+            topic, message = self._outbox.popleft()
+            outgoing.append((topic, message, self.origin, now))
+        with self._lock:
+            if outgoing:
+                self._db.execute("BEGIN")
+                try:
+                    self._db.executemany("INSERT INTO events (topic, message, origin, created_at) VALUES (?, ?, ?, ?)", outgoing)
+                    self._db.execute("COMMIT")
+                except sqlite3.Error:
+                    self._db.execute("ROLLBACK")
+                    raise
+            rows = self._db.execute(
+                "SELECT id, topic, message, origin FROM events WHERE id > ? ORDER BY id", (self._last_event,)
+            ).fetchall()
+            if now - self._last_prune >= PRUNE_INTERVAL_SECONDS:
+                self._last_prune = now
+                self._db.execute("DELETE FROM events WHERE created_at < ?", (now - EVENT_RETENTION_SECONDS,))
+                self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (now - STATE_SESSION_TTL_SECONDS,))
+        if rows:
+            self._last_event = rows[-1][0]
+        return [(topic, message) for _, topic, message, origin in rows if origin != self.origin]
+
+    async def listen(self, deliver: Deliver) -> None:
+        while True:
+            try:
+                for topic, message in await asyncio.to_thread(self._exchange):
+                    deliver(topic, message)
+            except sqlite3.Error as e:
+                log("state_store_error", logging.WARNING, error=str(e))
+            await asyncio.sleep(self.poll_seconds)
+
+
+state_store = None
+
+
+def get_state_store() -> StateStore:
+    global state_store
+    if state_store is None:
+        state_store = SQLiteStateStore() if STATE_BACKEND == "sqlite" else MemoryStateStore()
+        log("state_store", backend=state_store.name)
+    return state_store
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Backend modules are imported flat (from cart import ...), as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
@@ -0,0 +1,51 @@
+from action_parser import SentenceChunker, StreamingActionParser, parse_reply
+
+REPLY = (
+    'Sure! {"action": "add_to_cart", "item_id": "coffee_original", "modifiers": ["Medium", "Double Double"]} '
+    'A medium double double. {"action": "remove_item", "item_id": "donut", "note": "no {braces} here"} Anything else?'
+)
+
+
+def test_parse_reply_extracts_actions_and_clean_text():
+    text, actions = parse_reply(REPLY)
+    assert [action["action"] for action in actions] == ["add_to_cart", "remove_item"]
+    assert actions[1]["note"] == "no {braces} here"
+    assert text == "Sure! A medium double double. Anything else?"
+
+
+def test_parse_reply_keeps_nested_modifier_objects():
+    _, actions = parse_reply('{"action": "add_to_cart", "modifiers": [{"name": "Size", "choice": "Large"}]} OK')
+    assert actions == [{"action": "add_to_cart", "modifiers": [{"name": "Size", "choice": "Large"}]}]
+
+
+def test_parse_reply_ignores_objects_without_action_and_bad_json():
+    text, actions = parse_reply('Hi {"note": 1} and {not json} bye')
+    assert actions == []
+    assert "bye" in text
+
+
+def test_streaming_parser_handles_any_chunking():
+    for size in (1, 2, 3, 7, 16, len(REPLY)):
+        parser = StreamingActionParser()
+        events = []
+        for start in range(0, len(REPLY), size):
+            events += parser.feed(REPLY[start:start + size])
+        events += parser.flush()
+        assert [value for kind, value in events if kind == "action"] == parse_reply(REPLY)[1], size
+        actions = [value for kind, value in events if kind == "action"]
+        text = "".join(value for kind, value in events if kind == "text")
+        assert [action["action"] for action in actions] == ["add_to_cart", "remove_item"], size
+        assert actions[1]["note"] == "no {braces} here", size
+        assert " ".join(text.split()) == "Sure! A medium double double. Anything else?", size
+
+
+def test_streaming_parser_keeps_escaped_quotes_inside_strings():
+    parser = StreamingActionParser()
+    events = parser.feed('{"action": "add_to_cart", "name": "say \\"hi\\" {"}') + parser.flush()
+    assert events == [("action", {"action": "add_to_cart", "name": 'say "hi" {'})]
+
+
+def test_sentence_chunker_keeps_prices_whole():
+    chunker = SentenceChunker()
+    sentences = chunker.feed("That's $2.59 total. Tap ") + chunker.feed("to pay.") + chunker.flush()
+    assert sentences == ["That's $2.59 total.", "Tap to pay."]
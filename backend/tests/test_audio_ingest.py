@@ -0,0 +1,35 @@
+import asyncio
+import math
+from array import array
+import pytest
+from audio_ingest import AudioSession, FakeTranscriber, parse_sample_rate
+
+RATE = 16000
+
+
+def tone(seconds: float, amplitude: int) -> bytes:
+    samples = int(RATE * seconds)
+    return array("h", (int(amplitude * math.sin(2 * math.pi * 440 * i / RATE)) for i in range(samples))).tobytes()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (16000, 16000), (8000, 8000), (48000.0, 48000),
+    (0, None), (-16000, None), (10 ** 9, None), ("16000", None), ("fast", None), (None, None), (True, None),
+])
+def test_parse_sample_rate(value, expected):
+    assert parse_sample_rate(value) == expected
+
+
+def test_utterance_is_endpointed_after_trailing_silence():
+    session = AudioSession(RATE)
+    events = session.feed(tone(0.5, 20) + tone(0.6, 8000) + tone(0.5, 20))
+    assert [event for event, _ in events] == ["speech_start", "speech_end"]
+    pcm = events[1][1]
+    # The speech plus pre-roll, without the silence that ended it
+    assert 0.6 <= len(pcm) / 2 / RATE <= 1.0
+
+
+def test_fake_transcriber_scripts_each_utterance():
+    transcriber = FakeTranscriber(lambda pcm, rate: f"{len(pcm) // 2 // rate} seconds")
+    assert asyncio.run(transcriber.transcribe(tone(2.0, 8000), RATE)) == "2 seconds"
+    assert transcriber.calls == 1
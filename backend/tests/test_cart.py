@@ -0,0 +1,107 @@
+import json
+import os
+import pytest
+from action_parser import parse_reply
+from cart import Cart, CartEngine
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "menu.json")
+# Same shape as benchmark.NESTED_REPLY; importing benchmark would start the fake provider setup
+NESTED_REPLY = (
+    'Sure. {"action": "add_to_cart", "item_id": "iced_capp", "name": "Iced Capp", '
+    '"modifiers": [{"name": "Size", "choice": "Large"}, {"name": "Flavor", "choice": "Mocha"}]} '
+    'One large mocha Iced Capp. {"action": "add_to_cart", "item_id": "french_vanilla", '
+    '"name": "French Vanilla", "modifiers": [{"name": "Size", "choice": "Small"}]} Anything else?'
+)
+
+
+@pytest.fixture
+def engine():
+    with open(MENU_PATH) as f:
+        return CartEngine(json.load(f))
+
+
+def test_nested_modifiers_land_in_the_cart(engine):
+    cart = Cart()
+    _, actions = parse_reply(NESTED_REPLY)
+    messages = [message for action in actions for message in engine.apply(cart, action)]
+    assert [message["type"] for message in messages] == ["cart_update", "cart_update"]
+    assert [line["modifiers"] for line in cart.lines] == [["Large", "Mocha"], ["Small"]]
+
+
+def test_unknown_modifier_object_is_readable(engine):
+    cart = Cart()
+    action = {"action": "add_to_cart", "item_id": "iced_capp", "modifiers": [{"name": "Size", "choice": "Huge"}]}
+    assert engine.apply(cart, action) == [{"type": "cart_error", "message": "'Size: Huge' isn't available for Iced Capp"}]
+    assert not cart.lines
+
+
+
+def add(engine, cart, item_id, modifiers=(), quantity=None):
+    action = {"action": "add_to_cart", "item_id": item_id, "modifiers": list(modifiers)}
+    if quantity is not None:
+        action["quantity"] = quantity
+    return engine.apply(cart, action)
+
+
+def test_price_includes_size_and_modifier_surcharges(engine):
+    cart = Cart()
+    add(engine, cart, "coffee_original", ["Large", "Double Double"])
+    add(engine, cart, "hot_chocolate", ["Medium", "Whipped Cream"])
+    assert [(line["modifiers"], line["finalPrice"]) for line in cart.lines] == [
+        (["Large", "2 Cream", "2 Sugar"], 2.59),
+        (["Medium", "Whipped Cream"], 3.09),
+    ]
+
+
+def test_totals_add_hst_to_the_subtotal(engine):
+    cart = Cart()
+    add(engine, cart, "donut_boston_cream", quantity=3)
+    assert cart.totals() == {"subtotal": 5.37, "tax": 0.7, "total": 6.07}
+
+
+def test_max_quantity_counts_what_is_already_in_the_cart(engine):
+    cart = Cart()
+    add(engine, cart, "donut_honey_cruller", quantity=8)
+    messages = add(engine, cart, "donut_honey_cruller", quantity=3)
+    assert messages[0]["type"] == "cart_error"
+    assert messages[0]["message"].startswith("The maximum is 10 Honey Cruller per order.")
+    assert len(cart) == 8
+    assert [message["type"] for message in add(engine, cart, "donut_honey_cruller", quantity=2)] == ["cart_update"] * 2
+
+
+@pytest.mark.parametrize("item_id, modifiers, quantity, message", [
+    ("pizza", [], None, "'pizza' is not on the menu"),
+    ("coffee_original", ["Double Double"], None, "Please choose a size for Original Blend Coffee"),
+    ("coffee_original", ["Small", "Black", "Double Double"], None, "Conflicting Cream choices for Original Blend Coffee"),
+    ("coffee_original", ["Small", "Oat Milk"], None, "'Oat Milk' isn't available for Original Blend Coffee"),
+    ("donut_boston_cream", [], -1, "Quantity must be at least 1"),
+])
+def test_invalid_adds_are_rejected(engine, item_id, modifiers, quantity, message):
+    cart = Cart()
+    assert add(engine, cart, item_id, modifiers, quantity) == [{"type": "cart_error", "message": message}]
+    assert not cart.lines
+
+
+def test_finalize_returns_totals_and_empties_the_cart(engine):
+    cart = Cart()
+    assert engine.apply(cart, {"action": "finalize_order"}) == [
+        {"type": "cart_error", "message": "There's nothing in your order yet"}
+    ]
+    add(engine, cart, "coffee_original", ["Small"])
+    (finalized,) = engine.apply(cart, {"action": "finalize_order"})
+    assert (finalized["type"], finalized["subtotal"], finalized["tax"], finalized["total"]) == ("finalize_order", 1.89, 0.25, 2.14)
+    assert [line["id"] for line in finalized["items"]] == ["coffee_original"]
+    assert not cart.lines and cart.totals()["total"] == 0.0
+
+
+def test_remove_item_and_restore_keep_running_totals(engine):
+    cart = Cart()
+    add(engine, cart, "donut_boston_cream", quantity=2)
+    add(engine, cart, "coffee_original", ["Small"])
+    engine.apply(cart, {"action": "remove_item", "item_id": "donut_boston_cream", "quantity": 1})
+    assert cart.totals()["subtotal"] == 3.68
+    restored = Cart.from_lines(cart.lines)
+    assert restored.totals() == cart.totals()
+    # New lines continue after the restored line IDs
+    add(engine, restored, "donut_boston_cream")
+    assert restored.lines[-1]["lineId"] == "line-4"
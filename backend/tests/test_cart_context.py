@@ -0,0 +1,33 @@
+from cart_context import CartContext
+
+COFFEE = {"id": "coffee_original", "name": "Coffee", "modifiers": ["Medium", "2 Cream"], "finalPrice": 2.29}
+DONUT = {"id": "donut_boston_cream", "name": "Boston Cream", "modifiers": [], "finalPrice": 1.79}
+
+
+def test_first_turn_gets_a_summary_then_diffs():
+    context = CartContext()
+    assert context.render([COFFEE, COFFEE], window_turns=10) == "Cart: 2x Coffee[Medium,2 Cream] @2.29 | subtotal 4.58"
+    context.commit()
+    assert context.render([COFFEE, DONUT], window_turns=10) == (
+        "Cart changes: +1 Boston Cream @1.79; -1 Coffee[Medium,2 Cream] @2.29"
+    )
+    context.commit()
+    assert context.render([COFFEE, DONUT], window_turns=10) == "Cart unchanged"
+
+
+def test_uncommitted_turn_is_diffed_again():
+    context = CartContext()
+    context.render([], window_turns=10)
+    context.commit()
+    context.render([DONUT], window_turns=10)
+    # The turn failed, so the model never saw the donut
+    assert context.render([DONUT], window_turns=10) == "Cart changes: +1 Boston Cream @1.79"
+
+
+def test_summary_is_resent_before_it_leaves_the_history_window():
+    context = CartContext()
+    rendered = []
+    for _ in range(5):
+        rendered.append(context.render([DONUT], window_turns=3))
+        context.commit()
+    assert [text.startswith("Cart:") for text in rendered] == [True, False, False, True, False]
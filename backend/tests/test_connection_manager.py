@@ -0,0 +1,133 @@
+import asyncio
+import json
+import msgpack
+from connection_manager import PROTOCOL_VERSION, ConnectionManager, lane_topic
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def run(scenario):
+    """Run scenario(manager) on a fresh loop, letting writer tasks drain afterwards"""
+    async def main():
+        manager = ConnectionManager()
+        result = await scenario(manager)
+        await asyncio.sleep(0.01)
+        return result
+
+    return asyncio.run(main())
+
+
+def test_no_hello_keeps_protocol_1_json():
+    async def scenario(manager):
+        client = await manager.connect(FakeWebSocket())
+        await client.send_json({"type": "cart_state", "items": []})
+        return client
+
+    client = run(scenario)
+    assert (client.protocol, client.encoding) == (1, "json")
+    assert json.loads(client.websocket.frames[0])["type"] == "cart_state"
+
+
+def test_hello_negotiates_protocol_and_msgpack():
+    async def scenario(manager):
+        client = await manager.connect(FakeWebSocket())
+        reply = client.negotiate({"type": "hello", "protocol": 9, "encodings": ["msgpack", "json"]})
+        await client.send_json({"type": "turn_result", "text": "Hi", "actions": []})
+        return client, reply
+
+    client, reply = run(scenario)
+    assert reply == {"type": "hello", "protocol": PROTOCOL_VERSION, "encoding": "msgpack"}
+    assert msgpack.unpackb(client.websocket.frames[0]) == {"type": "turn_result", "text": "Hi", "actions": []}
+
+
+def test_json_only_hello_and_bad_protocol():
+    async def scenario(manager):
+        client = await manager.connect(FakeWebSocket())
+        return client.negotiate({"type": "hello", "protocol": "two", "encodings": ["json"]})
+
+    assert run(scenario) == {"type": "hello", "protocol": 1, "encoding": "json"}
+
+
+class StalledWebSocket(FakeWebSocket):
+    async def send_text(self, text):
+        await asyncio.Event().wait()
+
+
+def test_sensor_frames_coalesce_while_replies_queue():
+    async def scenario(manager):
+        client = await manager.connect(StalledWebSocket())
+        manager.subscribe(client, "lane:1:sensor")
+        # The first frame is taken by the writer, which then stalls on it
+        manager.publish("lane:1:sensor", json.dumps({"type": "heartbeat"}))
+        await asyncio.sleep(0)
+        for distance in (90, 80, 70):
+            manager.publish("lane:1:sensor", json.dumps({"type": "sensor_reading", "distance": distance}))
+        client.send(json.dumps({"type": "ai_response", "text": "Hi"}))
+        client.send(json.dumps({"type": "ai_response", "text": "Bye"}))
+        metrics = manager.render_metrics()
+        manager.disconnect(client.websocket)
+        return client, metrics
+
+    client, metrics = run(scenario)
+    assert "kiosk_ws_send_backlog 3" in metrics
+    assert "kiosk_ws_frames_dropped_total 2" in metrics
+
+
+def test_full_queue_evicts_the_client():
+    async def scenario(manager):
+        websocket = StalledWebSocket()
+        client = await manager.connect(websocket)
+        client.max_queue = 2
+        sent = [client.send(json.dumps({"type": "ai_response", "text": str(n)})) for n in range(4)]
+        await asyncio.sleep(0)
+        return manager, websocket, sent
+
+    manager, websocket, sent = run(scenario)
+    assert sent == [True, True, False, False]
+    assert websocket.closed_with == 1011
+    assert not manager.clients
+
+
+class RecordingRelay:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, message):
+        self.published.append((topic, message))
+
+
+def test_lane_topics_reach_only_that_lanes_subscribers():
+    relay = RecordingRelay()
+
+    async def scenario(manager):
+        manager.relay = relay
+        publisher, lane_1, lane_2 = [await manager.connect(FakeWebSocket()) for _ in range(3)]
+        for client, lane in ((publisher, "1"), (lane_1, "1"), (lane_2, "2")):
+            manager.subscribe(client, lane_topic(lane, "sensor"))
+        reached = manager.publish(lane_topic("1", "sensor"), '{"type": "presence_enter"}', sender=publisher)
+        # Messages from other workers are delivered here but not relayed back out
+        manager.publish(lane_topic("2", "order"), '{"type": "order_finalized"}', relay=False)
+        manager.disconnect(lane_2.websocket)
+        return manager, reached, [client.websocket.frames for client in (publisher, lane_1, lane_2)]
+
+    manager, reached, frames = run(scenario)
+    assert reached == 1
+    assert frames == [[], ['{"type": "presence_enter"}'], []]
+    assert relay.published == [("lane:1:sensor", '{"type": "presence_enter"}')]
+    assert set(manager.topics) == {"lane:1:sensor"}
@@ -0,0 +1,42 @@
+from hardware import Keypad, SimulatedGPIO, UltrasonicSensor
+
+ROWS = [5, 6, 13, 19]
+COLS = [12, 16, 20, 21]
+
+
+def test_keypad_reports_the_pressed_key():
+    gpio = SimulatedGPIO()
+    gpio.attach_keypad(ROWS, COLS)
+    keypad = Keypad(gpio, ROWS, COLS, settle_seconds=0.001)
+    pressed = []
+    keypad.listener = pressed.append
+    for key in "7#D":
+        gpio.press(key)
+        gpio.release(key)
+    assert pressed == ["7", "#", "D"]
+
+
+def test_keypad_ignores_a_column_that_is_released_before_the_scan():
+    gpio = SimulatedGPIO()
+    gpio.attach_keypad(ROWS, COLS)
+    keypad = Keypad(gpio, ROWS, COLS, settle_seconds=0.001)
+    pressed = []
+    keypad.listener = pressed.append
+    # Bounce: the column went LOW but is HIGH again when the callback settles
+    gpio.release("5")
+    keypad._on_press(COLS[1])
+    assert pressed == []
+
+
+def test_ultrasonic_measures_the_simulated_distance():
+    gpio = SimulatedGPIO()
+    gpio.attach_ultrasonic(23, 24, lambda: 120.0)
+    sensor = UltrasonicSensor(gpio, 23, 24, timeout=0.5)
+    # The echo pulse is a sleep, so it can only run long (by scheduling jitter)
+    assert 110.0 <= sensor.measure() < 400.0
+
+
+def test_ultrasonic_without_echo_is_none():
+    gpio = SimulatedGPIO()
+    gpio.attach_ultrasonic(23, 24, lambda: None)
+    assert UltrasonicSensor(gpio, 23, 24, timeout=0.05).measure() is None
@@ -0,0 +1,59 @@
+import json
+import os
+import pytest
+from cart import Cart, CartEngine
+from intent_matcher import IntentMatcher
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "menu.json")
+
+
+@pytest.fixture(scope="module")
+def menu():
+    with open(MENU_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def matcher(menu):
+    return IntentMatcher(menu)
+
+
+@pytest.mark.parametrize("text, modifiers, count", [
+    ("A medium double double please", ["Medium", "2 Cream", "2 Sugar"], 1),
+    ("two large triple triples", ["Large", "3 Cream", "3 Sugar"], 2),
+    ("an XL black coffee", ["Extra Large"], 1),
+])
+def test_slang_orders_become_coffee_adds(matcher, text, modifiers, count):
+    result = matcher.match(text, [])
+    assert [action["item_id"] for action in result["actions"]] == ["coffee_original"] * count
+    assert all(action["modifiers"] == modifiers for action in result["actions"])
+
+
+def test_fast_path_actions_are_priced_like_the_cart(matcher, menu):
+    engine, cart = CartEngine(menu), Cart()
+    actions = [action for text in ("two large triple triples", "a medium hot chocolate", "a boston cream")
+               for action in matcher.match(text, [])["actions"]]
+    for action in actions:
+        assert engine.apply(cart, action)[0]["type"] == "cart_update"
+    assert [action["price"] for action in actions] == [line["finalPrice"] for line in cart.lines]
+
+
+def test_finalize_quotes_the_cart_total(matcher):
+    result = matcher.match("That's all, thanks", [{"id": "donut_boston_cream", "finalPrice": 1.79}])
+    assert result["actions"] == [{"action": "finalize_order"}]
+    assert "$2.02" in result["text"]
+
+
+def test_clear_phrase(matcher):
+    assert matcher.match("Start over", [])["actions"] == [{"action": "clear_cart"}]
+
+
+@pytest.mark.parametrize("text", [
+    "what's good here?",              # a question
+    "a small coffee with oat milk",   # an option the menu doesn't have
+    "a double double",                # no size given
+    "a medium",                       # refers back to an earlier question
+    "that's all",                     # nothing in the cart to finalize
+])
+def test_anything_not_fully_understood_goes_to_the_model(matcher, text):
+    assert matcher.match(text, []) is None
@@ -0,0 +1,37 @@
+from lcd_renderer import FakeLCD, LCDRenderer
+
+
+class KeypressDuringWrite(FakeLCD):
+    """An LCD whose first write is interrupted by another render (a key press mid-flush)"""
+
+    def __init__(self):
+        super().__init__()
+        self.on_write = None
+
+    def write_string(self, text: str) -> None:
+        super().write_string(text)
+        if self.on_write is not None:
+            on_write, self.on_write = self.on_write, None
+            on_write()
+
+
+def test_render_during_flush_is_written_by_the_next_flush():
+    lcd = KeypressDuringWrite()
+    renderer = LCDRenderer(lcd)
+    renderer.render(["PIN *"])
+    lcd.on_write = lambda: renderer.render(["PIN **"])
+    renderer.flush()
+    assert lcd.lines()[0].rstrip() == "PIN *"
+    renderer.flush()
+    assert lcd.lines()[0].rstrip() == "PIN **"
+
+
+def test_flush_writes_only_changed_runs():
+    lcd = FakeLCD()
+    renderer = LCDRenderer(lcd)
+    renderer.render(["Total: $2.59"])
+    renderer.flush()
+    written = lcd.chars_written
+    renderer.render(["Total: $2.69"])
+    assert renderer.flush() == 1
+    assert lcd.chars_written == written + 1
@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import pytest
+from menu_store import MenuStore, accepts_gzip
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "menu.json")
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "menu.json"
+    shutil.copy(MENU_PATH, path)
+    return MenuStore(str(path))
+
+
+def rewrite(store, data):
+    with open(store.path, "w") as f:
+        json.dump(data, f)
+    # Make sure the signature changes even within one mtime tick
+    store._signature = None
+
+
+def test_etag_matches_only_the_current_version(store):
+    menu = store.current
+    assert menu.matches(menu.etag)
+    assert menu.matches(f'"other", W/{menu.etag}')
+    assert menu.matches("*")
+    assert not menu.matches('"other"') and not menu.matches("")
+
+
+def test_reload_swaps_in_a_valid_change_and_keeps_the_old_etag_stale(store):
+    old = store.current
+    data = dict(old.data, max_quantity=5)
+    rewrite(store, data)
+    assert store.reload()
+    assert store.current.data["max_quantity"] == 5
+    assert not store.current.matches(old.etag)
+
+
+def test_reload_ignores_an_invalid_menu(store):
+    old = store.current
+    rewrite(store, {"menu_items": []})
+    assert not store.reload()
+    assert store.current is old
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.8", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, deflate", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("identity, *;q=0.5", True),
+    ("gzip;q=0, *", False),
+    ("", False),
+    ("deflate", False),
+])
+def test_accepts_gzip_respects_q_values(header, expected):
+    assert accepts_gzip(header) is expected
@@ -0,0 +1,16 @@
+from connection_manager import valid_lane
+from metrics import Histogram
+
+
+def test_label_values_are_escaped():
+    histogram = Histogram("t_seconds", "test", ("lane",), buckets=(1.0,))
+    histogram.observe(0.5, 'x"} 1\nfake_series{a="b')
+    lines = histogram.render()
+    # Still one sample per line: HELP, TYPE, two buckets, sum and count
+    assert len(lines) == 6
+    assert 'lane="x\\"} 1\\nfake_series{a=\\"b"' in lines[-1]
+
+
+def test_lane_names_are_restricted():
+    assert valid_lane("1") and valid_lane("12")
+    assert not valid_lane("") and not valid_lane("123") and not valid_lane('1"\n')
@@ -0,0 +1,54 @@
+import asyncio
+from order_journal import OrderJournal
+
+FINALIZED = {
+    "subtotal": 3.68, "tax": 0.48, "total": 4.16,
+    "items": [
+        {"id": "coffee_original", "name": "Original Blend Coffee", "finalPrice": 1.89},
+        {"id": "donut_boston_cream", "name": "Boston Cream", "finalPrice": 1.79},
+    ],
+}
+
+
+def test_records_wait_in_memory_until_the_writer_runs(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"), flush_seconds=60)
+    journal.record_turn("s1", "1", "a coffee and a donut", "Got it!", [{"action": "add_to_cart"}], {"turn": 0.1})
+    journal.record_order("s1", "1", FINALIZED)
+    assert journal.stats() == {"pending": 2, "written": 0, "dropped": 0}
+
+    async def scenario():
+        writer = asyncio.create_task(journal.run())
+        await asyncio.sleep(0.01)
+        # Shutdown writes the tail even though no batch filled and no flush was due
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        return await journal.throughput(1), await journal.top_items(5, 1)
+
+    throughput, top = asyncio.run(scenario())
+    assert journal.stats() == {"pending": 0, "written": 2, "dropped": 0}
+    assert [(hour["turns"], hour["orders"], hour["revenue"]) for hour in throughput] == [(1, 1, 4.16)]
+    assert sorted((item["item_id"], item["quantity"]) for item in top) == [("coffee_original", 1), ("donut_boston_cream", 1)]
+
+
+def test_a_full_batch_is_written_without_waiting(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"), batch_size=2, flush_seconds=60)
+
+    async def scenario():
+        writer = asyncio.create_task(journal.run())
+        await asyncio.sleep(0)
+        journal.record_order("s1", "1", FINALIZED)
+        journal.record_order("s2", "2", FINALIZED)
+        await asyncio.sleep(0.2)
+        written = journal.written
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        return written
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_records_beyond_max_pending_are_dropped(tmp_path):
+    journal = OrderJournal(str(tmp_path / "orders.db"), max_pending=2)
+    for _ in range(3):
+        journal.record_order("s1", "1", FINALIZED)
+    assert journal.stats() == {"pending": 2, "written": 0, "dropped": 1}
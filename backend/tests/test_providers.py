@@ -0,0 +1,124 @@
+import asyncio
+import time
+import pytest
+from providers import CircuitBreaker, FakeProvider, ProviderRouter, ProviderUnavailable
+
+CONTENTS = [{"role": "user", "parts": ["a medium coffee"]}]
+
+
+def generate(router: ProviderRouter) -> str:
+    return asyncio.run(router.generate("prompt", CONTENTS))
+
+
+def stream(router: ProviderRouter) -> str:
+    async def collect() -> str:
+        return "".join([chunk async for chunk in router.stream("prompt", CONTENTS)])
+    return asyncio.run(collect())
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    # reset_timeout 0: the trial request is allowed straight away
+    assert breaker.state == "half_open" and breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_breaker_stays_open_during_cool_down():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_error_fails_over_and_trips_the_primary():
+    primary = FakeProvider(error=RuntimeError("boom"), name="primary")
+    backup = FakeProvider(reply="from backup", name="backup")
+    router = ProviderRouter([primary, backup], hedge_after=5.0)
+    for _ in range(3):
+        assert generate(router) == "from backup"
+    assert router.status() == {"primary": "open", "backup": "closed"}
+    # Skipped while open
+    generate(router)
+    assert primary.calls == 3
+
+
+def test_hedge_answer_wins_when_primary_is_slow():
+    primary = FakeProvider(reply="slow", latency=0.5, name="primary")
+    backup = FakeProvider(reply="fast", name="backup")
+    router = ProviderRouter([primary, backup], hedge_after=0.05)
+    assert generate(router) == "fast"
+    assert router.breakers["primary"].failures == 1
+    assert router.breakers["backup"].failures == 0
+
+
+@pytest.mark.parametrize("call", [generate, stream])
+def test_beaten_backup_keeps_a_closed_breaker(call):
+    # The primary is just over the hedge budget but still answers first
+    primary = FakeProvider(reply="primary", latency=0.06, name="primary")
+    backup = FakeProvider(reply="backup", latency=0.5, name="backup")
+    router = ProviderRouter([primary, backup], hedge_after=0.05)
+    for _ in range(3):
+        assert call(router) == "primary"
+    assert backup.calls == 3
+    assert router.status() == {"primary": "closed", "backup": "closed"}
+
+
+def test_streaming_slow_primary_loses_to_hedge():
+    primary = FakeProvider(reply="slow", latency=0.5, name="primary")
+    backup = FakeProvider(reply="fast reply", chunk_size=4, name="backup")
+    router = ProviderRouter([primary, backup], hedge_after=0.05)
+    assert stream(router) == "fast reply"
+    assert router.breakers["primary"].failures == 1
+    assert router.breakers["backup"].failures == 0
+
+
+def test_all_providers_open_is_unavailable():
+    primary = FakeProvider(name="primary")
+    router = ProviderRouter([primary])
+    router.breakers["primary"].opened_at = float("inf")
+    router.breakers["primary"].reset_timeout = 60.0
+    with pytest.raises(ProviderUnavailable):
+        generate(router)
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    # A cancelled trial gives the slot back
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.allow()
+
+
+def test_concurrent_requests_send_one_trial_to_a_half_open_provider():
+    primary = FakeProvider(reply="primary", latency=0.1, name="primary")
+    backup = FakeProvider(reply="backup", name="backup")
+    router = ProviderRouter([primary, backup], hedge_after=5.0)
+    breaker = router.breakers["primary"]
+    breaker.failures, breaker.opened_at = 3, time.monotonic() - breaker.reset_timeout
+
+    async def burst():
+        return await asyncio.gather(*(router.generate("prompt", CONTENTS) for _ in range(3)))
+
+    assert sorted(asyncio.run(burst())) == ["backup", "backup", "primary"]
+    assert primary.calls == 1
+    assert router.status()["primary"] == "closed"
+
+
+@pytest.mark.parametrize("call", [generate, stream])
+def test_failed_hedge_falls_through_to_the_next_provider(call):
+    primary = FakeProvider(reply="primary", latency=1.0, name="primary")
+    hedge = FakeProvider(error=RuntimeError("boom"), name="hedge")
+    third = FakeProvider(reply="third", name="third")
+    router = ProviderRouter([primary, hedge, third], hedge_after=0.05)
+    started = time.monotonic()
+    assert call(router) == "third"
+    # Answered without waiting for the slow primary
+    assert time.monotonic() - started < 0.5
+    assert (primary.calls, hedge.calls, third.calls) == (1, 1, 1)
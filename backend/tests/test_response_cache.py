@@ -0,0 +1,17 @@
+from response_cache import ResponseCache
+
+COFFEE = [{"name": "Original Blend", "size": "Small", "price": 1.89}]
+
+
+def test_key_depends_on_previous_reply():
+    cache = ResponseCache()
+    asked_coffee = cache.key("v1", "Medium please", COFFEE, "What size for the coffee?")
+    asked_cocoa = cache.key("v1", "Medium please", COFFEE, "What size for the hot chocolate?")
+    cache.put(asked_coffee, {"text": "Medium coffee it is.", "actions": []})
+    assert cache.get(asked_cocoa) is None
+    assert cache.get(cache.key("v1", "medium please!", COFFEE, "What size for the coffee?")) is not None
+
+
+def test_key_ignores_cart_order():
+    cart = COFFEE + [{"name": "Timbit", "price": 0.25}]
+    assert ResponseCache.key("v1", "that's all", cart) == ResponseCache.key("v1", "that's all", cart[::-1])
@@ -0,0 +1,22 @@
+from sensor import PresenceFilter
+
+
+def feed(presence: PresenceFilter, readings):
+    return [event for event in map(presence.update, readings) if event]
+
+
+def test_enter_and_leave_once_each():
+    presence = PresenceFilter(enter_cm=100, leave_cm=150, window=3, alpha=0.5)
+    assert feed(presence, [300] * 3 + [50] * 6 + [300] * 6) == ["presence_enter", "presence_leave"]
+
+
+def test_single_bad_echo_is_ignored():
+    presence = PresenceFilter(enter_cm=100, leave_cm=150, window=3, alpha=0.5)
+    assert feed(presence, [300, 300, 20, 300, 300]) == []
+    assert not presence.present
+
+
+def test_no_flapping_between_the_thresholds():
+    presence = PresenceFilter(enter_cm=100, leave_cm=150, window=1, alpha=1.0)
+    assert feed(presence, [90, 120, 95, 140, 99, 130]) == ["presence_enter"]
+    assert presence.present
@@ -0,0 +1,54 @@
+import asyncio
+from session_store import SessionRegistry
+from state_store import MemoryStateStore
+
+
+def registry(**limits) -> SessionRegistry:
+    return SessionRegistry(store=MemoryStateStore(), **limits)
+
+
+def create(sessions: SessionRegistry, *session_ids: str) -> None:
+    async def scenario():
+        for session_id in session_ids:
+            await sessions.get_or_create(session_id)
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_session_is_evicted():
+    sessions = registry(max_sessions=2)
+    create(sessions, "a", "b")
+    sessions.get("a")
+    create(sessions, "c")
+    assert "a" in sessions and "c" in sessions and "b" not in sessions
+
+
+def test_idle_sessions_expire():
+    sessions = registry(idle_ttl=60)
+    create(sessions, "old", "new")
+    # get() would touch it, so age it directly
+    sessions._sessions["old"].last_used -= 120
+    assert sessions.get("old") is None
+    assert len(sessions) == 1
+
+
+def test_memory_cap_evicts_oldest_but_never_the_current_session():
+    sessions = registry(memory_cap_chars=100)
+    create(sessions, "a", "b")
+    sessions.get("a").append("user", "x" * 60)
+    b = sessions.get("b")
+    b.append("user", "y" * 150)
+    sessions.commit(b)
+    assert "a" not in sessions and "b" in sessions
+
+
+def test_history_is_trimmed_in_whole_pairs():
+    sessions = registry(max_history_messages=4)
+    create(sessions, "a")
+    session = sessions.get("a")
+    for turn in range(3):
+        session.append("user", f"q{turn}")
+        session.append("model", f"a{turn}")
+    sessions.commit(session)
+    assert [entry["parts"][0] for entry in session.history] == ["q1", "a1", "q2", "a2"]
+    assert session.chars == 8
@@ -0,0 +1,40 @@
+import asyncio
+from session_store import SessionRegistry
+from state_store import SQLiteStateStore
+
+
+def test_revisions_and_tombstones(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    assert store.load_session("lane-1") is None
+    assert store.save_session("lane-1", '{"history": [], "cart": []}') == 1
+    assert store.load_session("lane-1") == (1, '{"history": [], "cart": []}')
+    # Nothing newer than what the caller already holds
+    assert store.load_session("lane-1", newer_than=1) is None
+    assert store.delete_session("lane-1") == 2
+    assert store.load_session("lane-1", newer_than=1) == (2, None)
+
+
+def test_events_reach_other_workers_only(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+    first.publish("lane:1", "hello")
+    assert first._exchange() == []
+    assert second._exchange() == [("lane:1", "hello")]
+    assert second._exchange() == []
+
+
+def test_reset_reaches_a_worker_holding_the_session(tmp_path):
+    path = str(tmp_path / "state.db")
+    a, b = SessionRegistry(store=SQLiteStateStore(path)), SessionRegistry(store=SQLiteStateStore(path))
+
+    async def scenario():
+        session = await a.get_or_create("lane-1")
+        session.append("user", "a coffee")
+        await a.save("lane-1")
+        # b has never seen the lane, so it loads a's copy
+        assert (await b.get_or_create("lane-1")).history == session.history
+        await a.remove("lane-1")
+        reset = await b.get_latest("lane-1")
+        assert reset.history == [] and reset.revision == 2
+
+    asyncio.run(scenario())
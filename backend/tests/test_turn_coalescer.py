@@ -0,0 +1,64 @@
+import asyncio
+import time
+from turn_coalescer import TurnCoalescer
+
+
+def speech(text):
+    return {"type": "user_speech", "text": text}
+
+
+def run_turns(scenario, debounce=0.05, model_seconds=0.0, commit=False):
+    """Feed fragments through a coalescer; returns the texts of turns that finished"""
+    async def main():
+        finished = []
+
+        async def run_turn(message, received_at):
+            if commit:
+                coalescer.commit()
+            await asyncio.sleep(model_seconds)
+            finished.append(message["text"])
+
+        coalescer = TurnCoalescer(run_turn, debounce=debounce)
+        runner = asyncio.create_task(coalescer.run())
+        await scenario(coalescer)
+        await asyncio.sleep(2 * (debounce + model_seconds) + 0.1)
+        runner.cancel()
+        return finished
+
+    return asyncio.run(main())
+
+
+def test_fragments_within_the_debounce_become_one_turn():
+    async def scenario(coalescer):
+        coalescer.add(speech("a medium coffee"), time.perf_counter())
+        await asyncio.sleep(0.02)
+        coalescer.add(speech("and a donut"), time.perf_counter())
+
+    assert run_turns(scenario) == ["a medium coffee and a donut"]
+
+
+def test_fragments_further_apart_are_separate_turns():
+    async def scenario(coalescer):
+        coalescer.add(speech("a medium coffee"), time.perf_counter())
+        await asyncio.sleep(0.1)
+        coalescer.add(speech("that's all"), time.perf_counter())
+
+    assert run_turns(scenario) == ["a medium coffee", "that's all"]
+
+
+def test_late_fragment_supersedes_a_turn_waiting_on_the_model():
+    async def scenario(coalescer):
+        coalescer.add(speech("a medium coffee"), time.perf_counter())
+        await asyncio.sleep(0.1)
+        coalescer.add(speech("and a donut"), time.perf_counter())
+
+    assert run_turns(scenario, model_seconds=0.2) == ["a medium coffee and a donut"]
+
+
+def test_committed_turn_finishes_before_the_next():
+    async def scenario(coalescer):
+        coalescer.add(speech("a medium coffee"), time.perf_counter())
+        await asyncio.sleep(0.1)
+        coalescer.add(speech("and a donut"), time.perf_counter())
+
+    assert run_turns(scenario, model_seconds=0.2, commit=True) == ["a medium coffee", "and a donut"]
@@ -0,0 +1,80 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from metrics import log
+
+# Fragments arriving within this long of each other are merged into one turn
+TURN_DEBOUNCE_SECONDS = float(os.getenv("TURN_DEBOUNCE_SECONDS", "0.08"))
+
+# (user_speech message, perf_counter() when its frame arrived)
+Fragment = Tuple[dict, float]
+
+
+def merge_fragments(fragments: List[Fragment]) -> Fragment:
+    """One user_speech message holding every fragment's text, in order"""
+    text = " ".join(message.get("text", "").strip() for message, _ in fragments).strip()
+    message = {**fragments[-1][0], "text": text}
+    return message, min(received_at for _, received_at in fragments)
+
+
+class TurnCoalescer:
+    """Turns one connection's user_speech fragments into as few turns as possible.
+
+    Speech recognition often delivers an order in pieces ("a medium coffee",
+    "and a donut"). add() holds fragments until none has arrived for the
+    debounce window, then run() starts a single turn with their merged text.
+    A fragment that arrives while a turn is still waiting on the model cancels
+    that turn and is merged with it instead; a turn that has already sent
+    output (see commit()) is left to finish and the fragment goes next.
+    """
+
+    def __init__(self, run_turn: Callable[[dict, float], Awaitable[None]], debounce: float = TURN_DEBOUNCE_SECONDS):
+        self.run_turn = run_turn
+        self.debounce = debounce
+        self._pending: List[Fragment] = []
+        self._deadline = 0.0
+        self._wakeup = asyncio.Event()
+        self._current: Optional[asyncio.Task] = None
+        self._current_fragments: List[Fragment] = []
+        self._committed = False
+
+    def add(self, message: dict, received_at: float) -> None:
+        if self._current is not None and not self._current.done() and not self._committed:
+            log("turn_superseded", fragments=len(self._current_fragments) + 1)
+            self._current.cancel()
+            self._pending = self._current_fragments + self._pending
+            self._current_fragments = []
+        self._pending.append((message, received_at))
+        self._deadline = time.monotonic() + self.debounce
+        self._wakeup.set()
+
+    def commit(self) -> None:
+        """Called by the running turn before its first output; it can no longer be superseded"""
+        self._committed = True
+
+    async def run(self) -> None:
+        """Start turns one at a time until cancelled (which also cancels the running turn)"""
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                # Debounce: the deadline moves each time another fragment arrives
+                delay = self._deadline - time.monotonic()
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = self._deadline - time.monotonic()
+                if not self._pending:
+                    continue
+                fragments, self._pending = self._pending, []
+                if len(fragments) > 1:
+                    log("turn_coalesced", fragments=len(fragments))
+                self._current_fragments = fragments
+                self._committed = False
+                self._current = asyncio.create_task(self.run_turn(*merge_fragments(fragments)))
+                # wait() rather than await: a superseded turn's cancellation must not end this loop
+                await asyncio.wait([self._current])
+                self._current_fragments = []
+        finally:
+            if self._current is not None:
+                self._current.cancel()
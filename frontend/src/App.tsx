@@ -21,7 +21,11 @@ const CHANNELS = {
   PAYMENT: 'order_payment_confirmation_channel'
 };
 
-const WS_AUDIO_URL = 'ws://localhost:8000/ws/audio';
+// One conversation per kiosk tab so lanes sharing a backend don't mix histories
+const SESSION_ID = crypto.randomUUID();
+// Lane this kiosk serves; finalized totals go to the lane's payment hardware
+const LANE = import.meta.env.VITE_LANE ?? '1';
+const WS_AUDIO_URL = `ws://localhost:8000/ws/audio?session_id=${SESSION_ID}&lane=${LANE}`;
 
 function AppContent() {
   const {
@@ -31,7 +35,7 @@ function AppContent() {
     isProcessing, setIsProcessing,
     setTranscript,
     messages, addMessage,
-    cart, addToCart, removeFromCart, clearCart,
+    cart, addToCart, removeFromCart, clearCart, setCart,
     orderHistory, completeOrder
   } = useKioskStore();
 
@@ -41,9 +45,11 @@ function AppContent() {
   const [hasInteracted, setHasInteracted] = useState(false);
   const [isDevMode, setIsDevMode] = useState(false);
   const [isDebugOpen, setIsDebugOpen] = useState(false);
+  // Set once finalize_order has spoken the total; the rest of that turn's reply stays silent
+  const orderFinalizedRef = useRef(false);
 
   // Text-to-Speech Hook
-  const { speak, stop: stopTTS, isSpeaking } = useSpeechSynthesis();
+  const { speak, enqueue, onDrained, stop: stopTTS, isSpeaking } = useSpeechSynthesis();
 
   // PubNub Integration
   useEffect(() => {
@@ -69,11 +75,12 @@ function AppContent() {
               
               // Clear previous session (messages, cart, AI memory)
               clearCart();
+              orderFinalizedRef.current = false;
               // Clear messages by calling the store's internal reset
               useKioskStore.getState().messages = [];
               
               // Reset AI conversation on backend
-              fetch('http://localhost:8000/reset_conversation', { method: 'POST' })
+              fetch(`http://localhost:8000/reset_conversation?session_id=${SESSION_ID}`, { method: 'POST' })
                 .then(() => console.log("AI conversation reset"))
                 .catch(err => console.error("Failed to reset conversation:", err));
               
@@ -156,7 +163,7 @@ function AppContent() {
         audioSocket.send(JSON.stringify({
           type: 'user_speech',
           text: text,
-          cart: useKioskStore.getState().cart // Send current cart context
+          stream: true // Receive the reply sentence by sentence
         }));
       }
     }
@@ -179,70 +186,110 @@ function AppContent() {
   useEffect(() => {
     // Audio WebSocket
     const aSocket = new WebSocket(WS_AUDIO_URL);
-    aSocket.onmessage = (event) => {
-      try {
-        const data = JSON.parse(event.data);
-        if (data.type === 'ai_response') {
-          setIsProcessing(false);
-          addMessage({ role: 'assistant', text: data.text, type: 'normal' });
-          
-          // Speak the response
-          setIsListening(false); // Stop listening while speaking
-          speak(data.text, () => {
-             // When done speaking, resume listening
+    const handleMessage = (data: any) => {
+      if (data.type === 'ai_response_partial') {
+        // Start speaking as soon as the first sentence arrives
+        setIsProcessing(false);
+        setIsListening(false);
+        // After finalize_order only the total is spoken, or it would be heard twice
+        if (!orderFinalizedRef.current) enqueue(data.text);
+      } else if (data.type === 'ai_response' && (data.streamed || orderFinalizedRef.current)) {
+        // Already spoken sentence by sentence (or the total is being spoken); just record it
+        setIsProcessing(false);
+        addMessage({ role: 'assistant', text: data.text, type: 'normal' });
+        if (!orderFinalizedRef.current) {
+          onDrained(() => {
              if (isAwake) setIsListening(true);
           });
-        } else if (data.type === 'cart_update') {
-          addToCart(data.item);
-        } else if (data.type === 'clear_cart') {
-          clearCart();
-        } else if (data.type === 'remove_item') {
-          removeFromCart(data.item_id);
-        } else if (data.type === 'finalize_order') {
-          // AI detected completion - auto finalize
-          console.log("AI triggered finalize_order");
-          
+        }
+      } else if (data.type === 'ai_response') {
+        setIsProcessing(false);
+        addMessage({ role: 'assistant', text: data.text, type: 'normal' });
+        
+        // Speak the response
+        setIsListening(false); // Stop listening while speaking
+        speak(data.text, () => {
+           // When done speaking, resume listening
+           if (isAwake) setIsListening(true);
+        });
+      } else if (data.type === 'cart_update') {
+        addToCart(data.item);
+      } else if (data.type === 'clear_cart') {
+        clearCart();
+      } else if (data.type === 'remove_item') {
+        removeFromCart(data.item_id);
+      } else if (data.type === 'cart_state') {
+        // Backend cart is authoritative; replace ours with it after every turn
+        setCart(data.items);
+      } else if (data.type === 'cart_error') {
+        console.warn("Cart action rejected:", data.message);
+        addMessage({ role: 'assistant', text: data.message, type: 'error' });
+      } else if (data.type === 'finalize_order') {
+        // Order finalized on the backend (spoken "that's all" or the Complete Order button)
+        console.log("Backend sent finalize_order");
+        
+        // The backend sends the total; fall back to the store for older backends
+        let total = data.total;
+        if (total === undefined) {
           // Get fresh cart state directly from store to avoid stale closure
           const currentCart = useKioskStore.getState().cart;
           const subtotal = currentCart.reduce((sum, item) => sum + item.finalPrice, 0);
-          const tax = subtotal * 0.13;
-          const total = subtotal + tax;
-          const total_str = total.toFixed(2);
-
-          // Publish to PubNub for Pi (non-blocking)
-          pubnub.publish({
-            channel: CHANNELS.PAYMENT,
-            message: {
-              ORDER_COMPLETED: true,
-              PAYMENT_AMOUNT: total_str
-            }
-          }, (status) => {
-            if (status.error) {
-              console.error("PubNub Publish Failed:");
-              console.error("Error:", status.error);
-              console.error("ErrorData:", status.errorData);
-              console.error("Category:", status.category);
-              // Don't block the kiosk - Pi might be offline
-            } else {
-              console.log("✅ Payment sent to Pi:", total_str);
-            }
-          });
-
-          // Speak the total to the user (Ensures sync with PubNub)
-          speak(`Your total comes to $${total_str}. Please tap your card to pay.`, () => {
-             // Wait 3 seconds after speech finishes before resetting
-             console.log("Speech finished. Waiting 3s before standby...");
-             setTimeout(() => {
-               setAwake(false);
-               setIsListening(false);
-               stopTTS();
-               console.log("Kiosk going to standby.");
-             }, 3000);
-          });
-
-          // Complete order locally regardless of PubNub status
-          completeOrder();
+          total = subtotal * 1.13;
         }
+        const total_str = total.toFixed(2);
+
+        // Publish to PubNub for Pi (non-blocking)
+        pubnub.publish({
+          channel: CHANNELS.PAYMENT,
+          message: {
+            ORDER_COMPLETED: true,
+            PAYMENT_AMOUNT: total_str
+          }
+        }, (status) => {
+          if (status.error) {
+            console.error("PubNub Publish Failed:");
+            console.error("Error:", status.error);
+            console.error("ErrorData:", status.errorData);
+            console.error("Category:", status.category);
+            // Don't block the kiosk - Pi might be offline
+          } else {
+            console.log("✅ Payment sent to Pi:", total_str);
+          }
+        });
+
+        // Speak the total to the user (Ensures sync with PubNub). speak() cancels
+        // any sentences of this turn still queued from ai_response_partial.
+        orderFinalizedRef.current = true;
+        speak(`Your total comes to $${total_str}. Please tap your card to pay.`, () => {
+           // Wait 3 seconds after speech finishes before resetting
+           console.log("Speech finished. Waiting 3s before standby...");
+           setTimeout(() => {
+             orderFinalizedRef.current = false;
+             setAwake(false);
+             setIsListening(false);
+             stopTTS();
+             console.log("Kiosk going to standby.");
+           }, 3000);
+        });
+
+        // Complete order locally regardless of PubNub status
+        completeOrder();
+      } else if (data.type === 'turn_result') {
+        // Protocol 2: the whole turn in one frame; apply its cart messages in
+        // order, then the canonical cart, then the reply
+        for (const action of data.actions) handleMessage(action);
+        if (data.cart) handleMessage({ type: 'cart_state', ...data.cart });
+        if (data.text) handleMessage({ type: 'ai_response', text: data.text, streamed: data.streamed });
+        else setIsProcessing(false);
+      }
+    };
+    // Ask for protocol 2 (one turn_result frame per turn); the browser reads JSON only
+    aSocket.onopen = () => {
+      aSocket.send(JSON.stringify({ type: 'hello', protocol: 2, encodings: ['json'] }));
+    };
+    aSocket.onmessage = (event) => {
+      try {
+        handleMessage(JSON.parse(event.data));
       } catch (e) {
         console.error("Audio socket parse error", e);
       }
@@ -287,9 +334,13 @@ function AppContent() {
 
   // Handle Complete Order
   const handleCompleteOrder = () => {
-    if (cart.length > 0) {
-      completeOrder();
-      addMessage({ role: 'assistant', text: 'Order completed! Thank you!', type: 'normal' });
+    if (cart.length === 0) return;
+    // The backend owns the cart, so the order is finalized there; its
+    // finalize_order reply handles payment and clears the cart, as for "that's all"
+    if (audioSocket && audioSocket.readyState === WebSocket.OPEN) {
+      audioSocket.send(JSON.stringify({ type: 'complete_order' }));
+    } else {
+      addMessage({ role: 'assistant', text: 'Not connected to the kiosk server. Please try again.', type: 'error' });
     }
   };
 
@@ -439,7 +490,7 @@ function AppContent() {
               </div>
             ) : (
               <div className="space-y-3">
-                {cart.map((item) => <CartItem key={item.id} item={item} />)}
+                {cart.map((item) => <CartItem key={item.lineId ?? item.id} item={item} />)}
               </div>
             )}
           </div>
@@ -3,6 +3,11 @@ import { useCallback, useEffect, useRef, useState } from 'react';
 export const useSpeechSynthesis = () => {
   const [isSpeaking, setIsSpeaking] = useState(false);
   const synthRef = useRef<SpeechSynthesis | null>(null);
+  // Streamed sentences queued with enqueue() and not yet finished
+  const pendingRef = useRef(0);
+  const onDrainedRef = useRef<(() => void) | null>(null);
+  // Bumped on cancel so interrupted sentences don't touch the new state
+  const queueGenerationRef = useRef(0);
 
   useEffect(() => {
     if (typeof window !== 'undefined' && 'speechSynthesis' in window) {
@@ -15,16 +20,7 @@ export const useSpeechSynthesis = () => {
     };
   }, []);
 
-  const speak = useCallback((text: string, onEnd?: () => void) => {
-    if (!synthRef.current) {
-      console.error('Speech synthesis not supported');
-      onEnd?.(); // Always fire callback
-      return;
-    }
-
-    // Cancel existing speech
-    synthRef.current.cancel();
-
+  const createUtterance = (text: string) => {
     const utterance = new SpeechSynthesisUtterance(text);
     
     // Select a better voice
@@ -42,6 +38,23 @@ export const useSpeechSynthesis = () => {
     utterance.rate = 1.0;
     utterance.pitch = 1.0;
     utterance.volume = 1.0;
+    return utterance;
+  };
+
+  const speak = useCallback((text: string, onEnd?: () => void) => {
+    if (!synthRef.current) {
+      console.error('Speech synthesis not supported');
+      onEnd?.(); // Always fire callback
+      return;
+    }
+
+    // Cancel existing speech (including any streamed sentences)
+    synthRef.current.cancel();
+    pendingRef.current = 0;
+    onDrainedRef.current = null;
+    queueGenerationRef.current += 1;
+
+    const utterance = createUtterance(text);
 
     // CRITICAL: Handle start/end/error to ensure state is reset
     utterance.onstart = () => {
@@ -83,12 +96,62 @@ export const useSpeechSynthesis = () => {
     }
   }, []);
 
+  // Queue a streamed sentence behind whatever is already being spoken
+  const enqueue = useCallback((text: string) => {
+    if (!synthRef.current) {
+      console.error('Speech synthesis not supported');
+      return;
+    }
+
+    const utterance = createUtterance(text);
+    const generation = queueGenerationRef.current;
+    pendingRef.current += 1;
+    // Mark as speaking now so the gap between sentences doesn't look idle
+    setIsSpeaking(true);
+
+    const handleEnd = () => {
+      if (generation !== queueGenerationRef.current) return;
+      pendingRef.current = Math.max(0, pendingRef.current - 1);
+      if (pendingRef.current === 0) {
+        setIsSpeaking(false);
+        const onDrained = onDrainedRef.current;
+        onDrainedRef.current = null;
+        onDrained?.();
+      }
+    };
+
+    utterance.onend = handleEnd;
+    utterance.onerror = (e) => {
+      console.error("TTS Error:", e);
+      handleEnd();
+    };
+
+    try {
+      synthRef.current.speak(utterance);
+    } catch (e) {
+      console.error("TTS Exception:", e);
+      handleEnd();
+    }
+  }, []);
+
+  // Run a callback once every enqueued sentence has been spoken
+  const onDrained = useCallback((callback: () => void) => {
+    if (pendingRef.current === 0) {
+      callback();
+    } else {
+      onDrainedRef.current = callback;
+    }
+  }, []);
+
   const stop = useCallback(() => {
     if (synthRef.current) {
       synthRef.current.cancel();
+      pendingRef.current = 0;
+      onDrainedRef.current = null;
+      queueGenerationRef.current += 1;
       setIsSpeaking(false);
     }
   }, []);
 
-  return { speak, stop, isSpeaking };
+  return { speak, enqueue, onDrained, stop, isSpeaking };
 };
@@ -7,6 +7,7 @@ export interface OrderItem {
   basePrice: number;
   modifiers: string[]; // e.g., ["Oat Milk", "Extra Shot"]
   finalPrice: number;
+  lineId?: string; // Set by the backend cart
 }
 
 export interface Message {
@@ -55,6 +56,7 @@ interface KioskState {
   addToCart: (item: OrderItem) => void;
   removeFromCart: (itemId: string) => void;
   clearCart: () => void;
+  setCart: (items: OrderItem[]) => void;
   completeOrder: () => void;
   reset: () => void;
 }
@@ -88,6 +90,7 @@ export const useKioskStore = create<KioskState>()(
         cart: state.cart.filter(item => item.id !== itemId)
       })),
       clearCart: () => set({ cart: [] }),
+      setCart: (items) => set({ cart: items }),
       completeOrder: () => {
         const state = get();
         if (state.cart.length === 0) return;